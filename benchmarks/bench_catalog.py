@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""Benchmarks of opening many daily netCDF files."""
+
+import shutil
+import tempfile
+from pathlib import Path
+
+import xarray as xr
+
+from water_masses import catalog
+
+from .synthetic import sss_files
+
+
+class OpenDaily(object):
+    """Open a year of daily files with open_mfdataset or from a manifest."""
+
+    timeout = 600
+
+    def setup(self):
+        self.tmpdir = Path(tempfile.mkdtemp())
+        self.urlpath = sss_files(self.tmpdir)
+        self.manifest = catalog.Manifest.build(self.urlpath)
+
+    def teardown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def time_open_mfdataset(self):
+        xr.open_mfdataset(self.urlpath, combine="by_coords", parallel=True)
+
+    def time_open_manifest(self):
+        self.manifest.to_dataset()
+
+    def time_build_manifest(self):
+        catalog.Manifest.build(self.urlpath)
+
+    def time_mean_mfdataset(self):
+        xr.open_mfdataset(self.urlpath, combine="by_coords").so.mean().compute()
+
+    def time_mean_manifest(self):
+        self.manifest.to_dataset(chunks={"time": 30}).so.mean().compute()
+
+
+class OpenSubset(object):
+    """Mean of a region and season, selected after opening or read only."""
+
+    timeout = 600
+
+    def setup(self):
+        self.tmpdir = Path(tempfile.mkdtemp())
+        self.urlpath = sss_files(self.tmpdir)
+        self.manifest = catalog.Manifest.build(self.urlpath)
+        self.sel = {
+            "time": slice("1993-06-01", "1993-08-31"),
+            "latitude": slice(50, 60),
+            "longitude": slice(-10, 5),
+        }
+
+    def teardown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def time_mean_mfdataset(self):
+        xr.open_mfdataset(self.urlpath, combine="by_coords").so.sel(
+            self.sel
+        ).mean().compute()
+
+    def time_mean_pushdown(self):
+        self.manifest.to_dataset(
+            indexers=self.manifest.indexers(self.sel)
+        ).so.mean().compute()
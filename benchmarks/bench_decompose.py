@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+"""Benchmarks of composites based on a monthly index."""
+
+import shutil
+import tempfile
+from pathlib import Path
+
+from water_masses import decompose, spgsi
+
+from .synthetic import spg_index, sss_cube
+
+
+class FromMonthlyIndex(object):
+    """Select the daily fields of positive SPG index months."""
+
+    timeout = 1800
+
+    def setup(self):
+        self.tmpdir = Path(tempfile.mkdtemp())
+        index = spgsi.open_index(spg_index(self.tmpdir.joinpath("spgsi.csv")))
+        self.filtindex = index[index.PC2 > 1]
+        self.datafield = sss_cube(stride=40).to_dataset()
+
+    def teardown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def time_from_monthly_index(self):
+        decompose.from_monthly_index(self.datafield, self.filtindex)
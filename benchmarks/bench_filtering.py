@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+"""Benchmarks of time filters applied to fields."""
+
+from water_masses import filtering
+
+from .synthetic import sss_cube
+
+
+class ApplyFilter(object):
+    """Monthly lowpass and bandstop filters on the AMM7 grid."""
+
+    params = ["butter_lowpass_filter", "butter_bandstop_filter"]
+    param_names = ["filter_func"]
+
+    def setup(self, filter_func):
+        self.data = sss_cube(freq="MS")
+        self.filter_func = getattr(filtering, filter_func)
+
+    def time_apply_filter(self, filter_func):
+        filtering.apply_filter(self.filter_func, self.data, [], {})
+
+    def peakmem_apply_filter(self, filter_func):
+        filtering.apply_filter(self.filter_func, self.data, [], {})
+
+
+class FilterSeries(object):
+    """Lowpass filter per series with apply_filter or batched, with land."""
+
+    params = ["apply_filter", "filter_series"]
+    param_names = ["method"]
+
+    def setup(self, method):
+        self.data = sss_cube(freq="MS")
+
+    def time_lowpass(self, method):
+        if method == "apply_filter":
+            # land series are all missing and filtered to missing
+            filtering.apply_filter(filtering.butter_lowpass_filter, self.data, [], {})
+        else:
+            filtering.lowpass(self.data).compute()
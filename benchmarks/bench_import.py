@@ -0,0 +1,10 @@
+# -*- coding: utf-8 -*-
+"""Benchmarks of the package import time."""
+
+
+def timeraw_import_water_masses():
+    return "import water_masses"
+
+
+def timeraw_import_seeding():
+    return "from water_masses.tracmass import seeding"
@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+"""Benchmarks of the principal component analysis."""
+
+from water_masses.origin import pca
+
+from .synthetic import sss_cube
+
+
+class LatWeightedEof(object):
+    """EOFs of monthly SSS."""
+
+    params = [[2, 10], [False, True]]
+    param_names = ["nmodes", "out_of_core"]
+
+    def setup(self, nmodes, out_of_core):
+        self.da = sss_cube(freq="MS")
+
+    def time_lat_weighted_eof(self, nmodes, out_of_core):
+        pca.lat_weighted_eof(self.da, nmodes=nmodes, out_of_core=out_of_core)
+
+    def peakmem_lat_weighted_eof(self, nmodes, out_of_core):
+        pca.lat_weighted_eof(self.da, nmodes=nmodes, out_of_core=out_of_core)
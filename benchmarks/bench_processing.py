@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+"""Benchmarks of the SSS processing pipeline."""
+
+from water_masses import grouped, precision, processing, time_series
+
+from .synthetic import sss_cube
+
+
+class RemoveTrend(object):
+    """Trend removal."""
+
+    params = ["point_wise", "domain_wide"]
+    param_names = ["method"]
+
+    def setup(self, method):
+        self.data = sss_cube()
+        self.meta_data = processing.MetaData(
+            "daily_mean", averaging_method="quantile", quantile=0.9
+        )
+
+    def time_remove_trend(self, method):
+        getattr(processing.RemoveTrend(self.data, self.meta_data), method)()
+
+    def peakmem_remove_trend(self, method):
+        getattr(processing.RemoveTrend(self.data, self.meta_data), method)()
+
+
+class Climatology(object):
+    """Day-of-year climatology."""
+
+    params = (["point_wise", "domain_wide"], ["mean", "quantile"])
+    param_names = ["clim_method", "averaging_method"]
+
+    def setup(self, clim_method, averaging_method):
+        self.grouped = sss_cube().groupby("time.dayofyear")
+        self.meta_data = processing.MetaData(
+            "daily_mean",
+            clim_method=clim_method,
+            averaging_method=averaging_method,
+            quantile=0.9,
+        )
+
+    def time_climatology(self, clim_method, averaging_method):
+        getattr(processing.Climatology, clim_method)(self.grouped, self.meta_data)
+
+    def peakmem_climatology(self, clim_method, averaging_method):
+        getattr(processing.Climatology, clim_method)(self.grouped, self.meta_data)
+
+
+class RmLeap(object):
+    """Leap day removal and conversion to a no-leap calendar."""
+
+    def setup(self):
+        self.data = sss_cube()
+
+    def time_rm_leap(self):
+        processing.rm_leap(self.data)
+
+
+class Detrend(object):
+    """Linear detrending along time."""
+
+    params = ["polyfit", "fused"]
+    param_names = ["method"]
+
+    def setup(self, method):
+        self.data = sss_cube()
+
+    def time_detrend(self, method):
+        time_series.detrend(self.data, "time", method=method).compute()
+
+    def peakmem_detrend(self, method):
+        time_series.detrend(self.data, "time", method=method).compute()
+
+
+class GroupedReduction(object):
+    """Day-of-year climatology with xarray groupby and the grouped backend."""
+
+    params = (["xarray", "grouped"], ["mean", "quantile"])
+    param_names = ["backend", "func"]
+
+    def setup(self, backend, func):
+        self.data = sss_cube(chunks={"time": 1000})
+
+    def time_dayofyear(self, backend, func):
+        if backend == "grouped":
+            grouped.reduce(self.data, "dayofyear", func=func, q=0.9).compute()
+        elif func == "quantile":
+            # xarray needs time in a single chunk for quantiles
+            self.data.chunk({"time": -1}).groupby("time.dayofyear").quantile(
+                0.9, dim="time"
+            ).compute()
+        else:
+            self.data.groupby("time.dayofyear").mean("time").compute()
+
+
+class Precision(object):
+    """Detrending and day-of-year anomalies of float64 and float32 fields."""
+
+    params = ["float64", "float32"]
+    param_names = ["policy"]
+
+    def setup(self, policy):
+        with precision.policy(policy):
+            self.data = precision.as_field(sss_cube(chunks={"latitude": 10}))
+
+    def _anomalies(self):
+        detrended = time_series.detrend(self.data, "time", method="fused")
+        grouped.anomalies(detrended, "dayofyear").compute()
+
+    def time_anomalies(self, policy):
+        self._anomalies()
+
+    def peakmem_anomalies(self, policy):
+        self._anomalies()
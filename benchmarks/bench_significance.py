@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+"""Benchmarks of the surrogate significance tests."""
+
+from water_masses import significance
+
+from .synthetic import sss_cube
+
+
+class EofTest(object):
+    """Null distribution of EOF variance fractions of monthly SSS."""
+
+    params = ["ar1", "phase"]
+    param_names = ["method"]
+
+    def setup(self, method):
+        self.da = sss_cube(freq="MS")
+
+    def time_eof_test(self, method):
+        significance.eof_test(
+            self.da, nmodes=4, n_surrogates=40, method=method, seed=0, max_workers=2
+        )
@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+"""Benchmarks of TRACMASS input and output."""
+
+import shutil
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import xarray as xr
+
+from water_masses import filter_month, spgsi
+from water_masses.grid import Grid
+from water_masses.tracmass import aggregate, io, query, seeding
+
+from .synthetic import AMM7, spg_index, trajectory_file
+
+
+class OpenTracmassFile(object):
+    """Read trajectory files with vaex or pandas."""
+
+    params = ([".csv", ".csv.gz", ".hdf5"], [True, False])
+    param_names = ["suffix", "use_vaex"]
+
+    def setup_cache(self):
+        tmpdir = Path(tempfile.mkdtemp())
+        for suffix in (".csv", ".csv.gz", ".hdf5"):
+            trajectory_file(tmpdir.joinpath(f"tests_run{suffix}"))
+        return str(tmpdir)
+
+    def setup(self, tmpdir, suffix, use_vaex):
+        if suffix == ".hdf5" and not use_vaex:
+            raise NotImplementedError("HDF5 files are only read with vaex.")
+        self.path = Path(tmpdir).joinpath(f"tests_run{suffix}")
+
+    def time_open_tracmass_file(self, tmpdir, suffix, use_vaex):
+        io.open_tracmass_file(self.path, use_vaex=use_vaex)
+
+    def peakmem_open_tracmass_file(self, tmpdir, suffix, use_vaex):
+        io.open_tracmass_file(self.path, use_vaex=use_vaex)
+
+
+class OpenTrajectoryTable(object):
+    """Read trajectory files into Arrow tables and convert them."""
+
+    params = [".csv", ".csv.gz", ".hdf5"]
+    param_names = ["suffix"]
+
+    def setup_cache(self):
+        return OpenTracmassFile.setup_cache(self)
+
+    def setup(self, tmpdir, suffix):
+        self.path = Path(tmpdir).joinpath(f"tests_run{suffix}")
+        self.table = io.open_trajectory_table(self.path)
+
+    def time_open_trajectory_table(self, tmpdir, suffix):
+        io.open_trajectory_table(self.path)
+
+    def time_to_pandas(self, tmpdir, suffix):
+        self.table.to_pandas()
+
+    def time_to_vaex(self, tmpdir, suffix):
+        self.table.to_vaex()
+
+
+class Query(object):
+    """Trajectories passing through a box, streamed or loaded at once."""
+
+    params = ["query", "pandas"]
+    param_names = ["method"]
+
+    def setup_cache(self):
+        tmpdir = Path(tempfile.mkdtemp())
+        trajectory_file(tmpdir.joinpath("tests_run.csv"))
+        return str(tmpdir)
+
+    def setup(self, tmpdir, method):
+        self.path = Path(tmpdir).joinpath("tests_run.csv")
+        self.box = query.Box(i=(100, 120), j=(200, 220))
+
+    def _rows(self, method):
+        if method == "query":
+            return query.Query(query.ever(self.box), chunk_size=1 << 18).rows(self.path)
+        df = io.open_tracmass_file(self.path, use_vaex=False).reset_index()
+        ids = df["id"].values[self.box.mask(df, None)]
+        return df[df["id"].isin(ids)]
+
+    def time_query(self, tmpdir, method):
+        self._rows(method)
+
+    def peakmem_query(self, tmpdir, method):
+        self._rows(method)
+
+
+class ToGrid(object):
+    """Aggregate trajectories to particle density on the AMM7 grid."""
+
+    def setup_cache(self):
+        return OpenTracmassFile.setup_cache(self)
+
+    def setup(self, tmpdir):
+        self.path = Path(tmpdir).joinpath("tests_run.csv")
+
+    def time_to_grid(self, tmpdir):
+        aggregate.to_grid(self.path, (AMM7["latitude"][2], AMM7["longitude"][2]))
+
+    def peakmem_to_grid(self, tmpdir):
+        aggregate.to_grid(self.path, (AMM7["latitude"][2], AMM7["longitude"][2]))
+
+
+class Assign2Trj(object):
+    """Attach the SPG strength index to trajectories."""
+
+    timeout = 1800
+
+    def setup(self):
+        self.tmpdir = Path(tempfile.mkdtemp())
+        trajectory_file(self.tmpdir.joinpath("tests_ini.csv"))
+        meta_data = filter_month.MetaData(
+            data_path=str(self.tmpdir.joinpath("tests_{0}.csv"))
+        )
+        self.df = filter_month.open_dataset("ini", meta_data)
+        self.spgs_idx = spgsi.open_index(spg_index(self.tmpdir.joinpath("spgsi.csv")))
+
+    def teardown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def time_assign2trj(self):
+        spgsi.assign2trj(self.df, self.spgs_idx)
+
+
+class SampleInitialization(object):
+    """Stratified sample of the initialization file."""
+
+    def setup(self):
+        self.tmpdir = Path(tempfile.mkdtemp())
+        trajectory_file(self.tmpdir.joinpath("tests_ini.csv"))
+        self.meta_data = filter_month.MetaData(
+            data_path=str(self.tmpdir.joinpath("tests_{0}.csv"))
+        )
+
+    def teardown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def time_sample_all_months(self):
+        filter_month.sample_initialization(100, seed=0, meta_data=self.meta_data)
+
+    def peakmem_sample_all_months(self):
+        filter_month.sample_initialization(100, seed=0, meta_data=self.meta_data)
+
+
+class Seeding(object):
+    """Write seed files on the full AMM7 grid."""
+
+    def setup(self):
+        self.tmpdir = Path(tempfile.mkdtemp())
+        lat, lon = [np.linspace(*axis) for axis in AMM7.values()]
+        self.da = xr.DataArray(
+            np.zeros((len(lat), len(lon))),
+            dims=("latitude", "longitude"),
+            coords={
+                "latitude": ("latitude", lat, {"standard_name": "latitude"}),
+                "longitude": ("longitude", lon, {"standard_name": "longitude"}),
+            },
+        )
+        self.grid = Grid.from_coords(self.da)
+
+    def teardown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def time_seed_patch(self):
+        seeding.seed_patch(
+            0, 100, 0, 100, max_as_diff=True, file_target_dir=str(self.tmpdir)
+        )
+
+    def time_seed_horizontal_diagonal(self):
+        seeding.seed_horizontal_diagonal(
+            -4.0,
+            57.0,
+            8.0,
+            62.0,
+            self.da,
+            {"zonal": 1, "meridional": 2},
+            file_target_dir=self.tmpdir,
+        )
+
+    def time_convert(self):
+        seeding.convert(self.da.longitude, np.arange(len(self.da.longitude)))
+
+    def time_convert_grid(self):
+        seeding.convert(self.da.longitude, np.arange(len(self.da.longitude)), self.grid)
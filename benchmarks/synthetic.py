@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+"""Synthetic data sized like the production data.
+
+The sizes are controlled by the environment variable
+``WATER_MASSES_BENCHMARK_SCALE``:
+
+``production``
+    Full AMM7 grid (375 x 297), 27 years of daily data and 10^7 trajectory rows.
+``small`` (default)
+    Every 10th AMM7 grid point (as in the test mode of ``processing.main``),
+    27 years of daily data and 10^5 trajectory rows.
+
+"""
+
+import os
+from pathlib import Path
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from water_masses.constants import Timespan
+
+SCALE = os.environ.get("WATER_MASSES_BENCHMARK_SCALE", "small")
+
+#: AMM7 grid, 1/15 degree latitude by 1/9 degree longitude.
+AMM7 = {"latitude": (40.0, 65.0, 375), "longitude": (-20.0, 13.0, 297)}
+
+SIZES = {
+    "production": {"stride": 1, "trajectory_rows": 10 ** 7, "lazy": True},
+    "small": {"stride": 10, "trajectory_rows": 10 ** 5, "lazy": False},
+}[SCALE]
+
+SEED = 42
+
+#: Time steps per block of the random noise of :func:`sss_cube`.
+NOISE_CHUNK = 365
+
+
+def date_axis(timespan: Timespan = Timespan(), freq: str = "D") -> pd.DatetimeIndex:
+    """Time axis covering the experiment timespan."""
+    return pd.date_range(timespan.start, timespan.end, freq=freq)
+
+
+def sss_cube(
+    freq: str = "D",
+    stride: int = SIZES["stride"],
+    chunks: Optional[Dict[str, int]] = None,
+) -> xr.DataArray:
+    """Sea surface salinity on the AMM7 grid.
+
+    Seasonal cycle plus linear trend plus noise, with land (NaN) south of
+    45 degrees north. The cube is built lazily with dask, one block per
+    `NOISE_CHUNK` time steps, so the values do not depend on `chunks`. It is
+    rechunked to `chunks` if given, otherwise loaded, except at production
+    scale (about 8.8 GB of daily float64 data) where it stays dask backed.
+
+    """
+    import dask.array as dsa
+
+    lat, lon = [
+        np.linspace(start, stop, num)[::stride] for start, stop, num in AMM7.values()
+    ]
+    time = date_axis(freq=freq)
+    doy = time.dayofyear.values[:, np.newaxis, np.newaxis]
+    trend = np.linspace(0, 0.3, len(time))[:, np.newaxis, np.newaxis]
+    noise = dsa.random.RandomState(SEED).normal(
+        scale=0.1,
+        size=(len(time), len(lat), len(lon)),
+        chunks=(NOISE_CHUNK, -1, -1),
+    )
+    data = dsa.where(
+        (lat >= 45)[:, np.newaxis],
+        35.0 + 0.5 * np.sin(2 * np.pi * doy / 365.25) + trend + noise,
+        np.nan,
+    )
+    da = xr.DataArray(
+        data,
+        dims=("time", "latitude", "longitude"),
+        coords={
+            "time": time,
+            "latitude": (
+                "latitude",
+                lat,
+                {"standard_name": "latitude", "units": "degrees_north"},
+            ),
+            "longitude": (
+                "longitude",
+                lon,
+                {"standard_name": "longitude", "units": "degrees_east"},
+            ),
+        },
+        name="salinity",
+    )
+    if chunks is not None:
+        # dimensions not in `chunks` in a single chunk, as when chunking numpy data
+        return da.chunk({**{dim: -1 for dim in da.dims}, **chunks})
+    return da if SIZES["lazy"] else da.load()
+
+
+def spg_index(path: Path, timespan: Timespan = Timespan()) -> Path:
+    """Write a monthly SPG strength index (PC1, PC2) as headerless CSV."""
+    rng = np.random.default_rng(SEED)
+    months = len(date_axis(timespan, freq="MS"))
+    pd.DataFrame(rng.normal(scale=2, size=(months, 2))).to_csv(
+        path, header=False, index=False
+    )
+    return path
+
+
+def trajectories(
+    rows: int = SIZES["trajectory_rows"],
+    rows_per_id: int = 100,
+    timespan: Timespan = Timespan(),
+) -> pd.DataFrame:
+    """TRACMASS like trajectories (id, i, j, k, subvol, time).
+
+    Time is given in seconds relative to the end of the timespan, as in
+    TRACMASS backward runs.
+
+    """
+    rng = np.random.default_rng(SEED)
+    ids = rows // rows_per_id
+    seconds = int((timespan.end - timespan.start).total_seconds())
+    start = rng.integers(-seconds, 0, size=ids) // 86400 * 86400
+    step = np.tile(np.arange(rows_per_id) * -86400 * 5, ids)
+    return pd.DataFrame(
+        {
+            "id": np.repeat(np.arange(1, ids + 1), rows_per_id),
+            "i": rng.uniform(1, AMM7["longitude"][2], rows),
+            "j": rng.uniform(1, AMM7["latitude"][2], rows),
+            "k": rng.uniform(1, 24, rows),
+            "subvol": rng.uniform(0, 1e4, rows),
+            "time": np.maximum(np.repeat(start, rows_per_id) + step, -seconds),
+        },
+    )
+
+
+def trajectory_file(path: Path, rows: int = SIZES["trajectory_rows"]) -> Path:
+    """Write trajectories to CSV, CSV.gz or HDF5 depending on the suffix."""
+    df = trajectories(rows)
+    if path.suffix == ".hdf5":
+        import vaex
+
+        vaex.from_pandas(df).export_hdf5(str(path))
+    else:
+        df.to_csv(path, header=False, index=False)
+    return path
+
+
+def sss_files(directory: Path, days: int = 365) -> str:
+    """Write daily netCDF files like the Copernicus reanalysis, return the glob."""
+    da = sss_cube().isel(time=slice(None, days)).expand_dims(depth=[0.0], axis=1)
+    for day in range(days):
+        date = pd.Timestamp(da.time.values[day])
+        da.isel(time=[day]).to_dataset(name="so").to_netcdf(
+            directory.joinpath(f"metoffice_foam1_amm7_NWS_SAL_dm{date:%Y%m%d}.nc")
+        )
+    return str(directory.joinpath("metoffice_foam1_amm7_NWS_SAL_dm*.nc"))
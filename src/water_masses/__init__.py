@@ -1,32 +1,81 @@
 # -*- coding: utf-8 -*-
-from . import (
-    version,
+"""Analysis of the northern European shelf seas.
+
+Submodules are imported on first attribute access, so ``import water_masses``
+stays cheap for scripts that need a single module only.
+"""
+
+import importlib
+from types import ModuleType
+from typing import TYPE_CHECKING, Any, List
+
+if TYPE_CHECKING:  # pragma: no cover
+    from . import (  # noqa: F401
+        version,
+        # modules
+        constants,
+        instrument,
+        precision,
+        catalog,
+        spgsi,
+        processing,
+        filter_month,
+        time_series,
+        significance,
+        grouped,
+        filtering,
+        pipeline,
+        grid,
+        transform,
+        # submodules
+        tracmass,
+        origin,
+    )
+    from .tracmass import seeding  # noqa: F401
+    from .origin import pca  # noqa: F401
+
+_submodules = {
+    "version": ".version",
     # modules
-    constants,
-    spgsi,
-    processing,
-    filter_month,
-    time_series,
-    filtering,
-    transform,
-    # submodules
-    tracmass,
-    origin,
-)
-from .version import pkg_version as __version__
-from .tracmass import seeding
-from .origin import pca
+    "constants": ".constants",
+    "instrument": ".instrument",
+    "precision": ".precision",
+    "catalog": ".catalog",
+    "processing": ".processing",
+    "filter_month": ".filter_month",
+    "spgsi": ".spgsi",
+    "time_series": ".time_series",
+    "significance": ".significance",
+    "grouped": ".grouped",
+    "filtering": ".filtering",
+    "pipeline": ".pipeline",
+    "grid": ".grid",
+    "transform": ".transform",
+    # submodule
+    "tracmass": ".tracmass",
+    "seeding": ".tracmass.seeding",
+    # submodule
+    "origin": ".origin",
+    "pca": ".origin.pca",
+}
 
 __all__ = [
     "version",
     "__version__",
     # modules
     "constants",
+    "instrument",
+    "precision",
+    "catalog",
     "processing",
     "filter_month",
     "spgsi",
     "time_series",
+    "significance",
+    "grouped",
     "filtering",
+    "pipeline",
+    "grid",
     "transform",
     # submodule
     "tracmass",
@@ -35,3 +84,18 @@ __all__ = [
     "origin",
     "pca",
 ]
+
+
+def __getattr__(name: str) -> Any:
+    """Import submodules lazily."""
+    if name == "__version__":
+        return importlib.import_module(".version", __name__).pkg_version
+    if name in _submodules:
+        module: ModuleType = importlib.import_module(_submodules[name], __name__)
+        globals()[name] = module
+        return module
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__() -> List[str]:
+    return sorted(set(globals()) | set(__all__))
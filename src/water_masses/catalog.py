@@ -0,0 +1,584 @@
+# -*- coding: utf-8 -*-
+"""Open netCDF catalog sources from a persisted metadata manifest.
+
+Opening a glob of netCDF files with ``combine="by_coords"`` reads the
+metadata of every file before any compute starts. A :class:`Manifest` holds
+the consolidated metadata instead: the grid, variables and attributes of the
+first file and path, modification time and time values of each file. It is
+built once, stored as JSON and reused as long as the files are unchanged.
+
+Datasets opened from a manifest are dask backed, each block reads the raw
+hyperslabs of its files with netCDF4 and is decoded lazily by xarray. While a
+block is read, the following blocks along the concatenation dimension are
+read ahead on a thread pool, so I/O overlaps with the processing of the
+current chunks. The netCDF-C and HDF5 libraries are not thread safe, all reads
+hold xarray's netCDF4 lock and are serialized with xarray's own reads and
+writes, e.g. ``to_netcdf``.
+
+Subsets (ranges with a positive step along any dimension) are pushed into the
+reads, so only the selected hyperslabs of the selected files are read and the
+graph has blocks of the subset only.
+"""
+
+import json
+import os
+import threading
+import weakref
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from glob import glob
+from hashlib import sha1
+from itertools import product
+from pathlib import Path
+from typing import (
+    Any,
+    Deque,
+    Dict,
+    Hashable,
+    Iterator,
+    List,
+    Mapping,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+from xarray.backends.netCDF4_ import NETCDF4_PYTHON_LOCK
+
+MANIFEST_VERSION = 1
+
+Chunks = Mapping[Hashable, Union[int, Tuple[int, ...], None]]
+Indexers = Mapping[str, Union[int, slice]]
+
+
+class Manifest(object):
+    """Consolidated metadata of netCDF files concatenated along one dimension.
+
+    All files must share the grid and variables, only the length along the
+    concatenation dimension may differ.
+
+    """
+
+    def __init__(self, content: Dict[str, Any]) -> None:
+        """Wrap the (JSON) content, see :meth:`build`."""
+        if content.get("version") != MANIFEST_VERSION:
+            raise ValueError("Unsupported manifest version.")
+        self.content = content
+        self.concat_dim: str = content["concat_dim"]
+        self.files: List[Dict[str, Any]] = content["files"]
+        self.offsets = np.cumsum([0, *(entry["length"] for entry in self.files)])
+
+    @classmethod
+    def build(
+        cls,
+        urlpath: Union[str, Sequence[str]],
+        concat_dim: str = "time",
+        max_workers: Optional[int] = None,
+    ) -> "Manifest":
+        """Read the metadata of each file once.
+
+        Parameter
+        =========
+        urlpath : str or sequence of str
+            Glob pattern or files.
+        concat_dim : str
+            Dimension to concatenate along, files are ordered by its first
+            value.
+        max_workers : int
+            Size of the thread pool reading the files.
+
+        """
+        import cftime
+
+        paths = _resolve(urlpath)
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            entries = list(pool.map(lambda path: _file_entry(path, concat_dim), paths))
+        template = _template(paths[0], concat_dim)
+        attrs = template["variables"][concat_dim]["attrs"]
+        units, calendar = attrs.get("units"), attrs.get("calendar", "standard")
+        for entry in entries:
+            file_units = entry.pop("units")
+            if units is not None and file_units != units:
+                entry["values"] = np.asarray(
+                    cftime.date2num(
+                        cftime.num2date(entry["values"], file_units, calendar),
+                        units,
+                        calendar,
+                    )
+                ).tolist()
+        entries.sort(key=lambda entry: entry["values"][0])
+        values = [value for entry in entries for value in entry.pop("values")]
+        template["dims"][concat_dim] = len(values)
+        template["variables"][concat_dim]["data"] = values
+        return cls(
+            {
+                "version": MANIFEST_VERSION,
+                "urlpath": urlpath if isinstance(urlpath, str) else None,
+                "concat_dim": concat_dim,
+                "files": entries,
+                **template,
+            }
+        )
+
+    @classmethod
+    def from_json(cls, path: Path) -> "Manifest":
+        """Load a manifest written by :meth:`to_json`."""
+        with open(path) as file:
+            return cls(json.load(file))
+
+    def to_json(self, path: Path) -> None:
+        """Write the manifest atomically."""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        partial = path.with_suffix(".partial")
+        with open(partial, "w") as file:
+            json.dump(self.content, file)
+        os.replace(partial, path)
+
+    @property
+    def token(self) -> str:
+        """Hash of the files and their state."""
+        return sha1(json.dumps(self.files).encode()).hexdigest()
+
+    def is_current(self) -> bool:
+        """Check that the glob matches the same, unmodified files."""
+        if self.content["urlpath"] is not None:
+            if _resolve(self.content["urlpath"]) != sorted(
+                entry["path"] for entry in self.files
+            ):
+                return False
+        return all(_unchanged(entry) for entry in self.files)
+
+    def coords(self) -> xr.Dataset:
+        """Decoded dimension coordinates, without opening any file."""
+        variables = {
+            name: xr.Variable(
+                meta["dims"],
+                np.asarray(meta["data"], dtype=meta["dtype"]),
+                attrs=_decode_attrs(meta["attrs"]),
+            )
+            for name, meta in self.content["variables"].items()
+            if meta["dims"] == [name]
+        }
+        return xr.decode_cf(xr.Dataset(variables))
+
+    def indexers(
+        self,
+        sel: Optional[Mapping[str, Any]] = None,
+        stride: Optional[Mapping[str, int]] = None,
+    ) -> Dict[str, Union[int, slice]]:
+        """Positional indexers of a label based selection.
+
+        Parameter
+        =========
+        sel : dict
+            Labels or label slices (inclusive, as ``Dataset.sel``) per
+            dimension.
+        stride : dict
+            Steps per dimension, applied after the selection.
+
+        Returns
+        =======
+        dict
+            Positions or slices for :meth:`to_dataset`.
+
+        """
+        coords = self.coords()
+        indexers: Dict[str, Union[int, slice]] = {
+            dim: _position(coords.indexes[dim], dim, label)
+            for dim, label in (sel or {}).items()
+        }
+        for dim, step in (stride or {}).items():
+            indexers[dim] = _strided(indexers.get(dim, slice(None)), dim, step)
+        return indexers
+
+    def to_dataset(
+        self,
+        chunks: Optional[Chunks] = None,
+        prefetch: int = 2,
+        max_workers: Optional[int] = None,
+        indexers: Optional[Indexers] = None,
+    ) -> xr.Dataset:
+        """Lazily combined and decoded dataset, without opening any file.
+
+        Parameter
+        =========
+        chunks : dict
+            Chunk sizes per dimension of the subset, defaults to one chunk
+            per file along the concatenation dimension and whole other
+            dimensions.
+        prefetch : int
+            Number of blocks along the concatenation dimension read ahead.
+        max_workers : int
+            Size of the thread pool reading ahead.
+        indexers : dict
+            Positions (the dimension is dropped) or slices with a positive
+            step per dimension, as ``Dataset.isel``, see :meth:`indexers`.
+            Only the selected hyperslabs are read.
+
+        """
+        reader = BlockReader(
+            self,
+            chunks,
+            prefetch=prefetch,
+            max_workers=max_workers,
+            indexers=indexers,
+        )
+        variables = {}
+        for name, meta in self.content["variables"].items():
+            if self.concat_dim in meta["dims"] and name != self.concat_dim:
+                data = reader.array(name)
+            else:
+                data = np.asarray(meta["data"], dtype=meta["dtype"])[
+                    tuple(reader.slice(dim) for dim in meta["dims"])
+                ]
+            variables[name] = xr.Variable(
+                meta["dims"], data, attrs=_decode_attrs(meta["attrs"])
+            )
+        ds = xr.decode_cf(
+            xr.Dataset(variables, attrs=_decode_attrs(self.content["attrs"]))
+        )
+        return ds.isel(
+            {
+                dim: 0
+                for dim, indexer in (indexers or {}).items()
+                if not isinstance(indexer, slice)
+            }
+        )
+
+
+class BlockReader(object):
+    """Read blocks of raw data of a manifest, reading ahead on a thread pool.
+
+    With `indexers` (see :meth:`Manifest.to_dataset`) the blocks are those of
+    the subset and only the selected hyperslabs are read. Positions are read
+    as dimensions of length one.
+
+    """
+
+    def __init__(
+        self,
+        manifest: Manifest,
+        chunks: Optional[Chunks] = None,
+        prefetch: int = 2,
+        max_workers: Optional[int] = None,
+        indexers: Optional[Indexers] = None,
+    ) -> None:
+        """Normalize the selection and chunks and start the pool."""
+        self.manifest = manifest
+        self.prefetch = prefetch
+        self.max_workers = max_workers
+        self.requested_chunks = dict(chunks or {})
+        self.indexers = dict(indexers or {})
+        dims = manifest.content["dims"]
+        concat_dim = manifest.concat_dim
+        self.selection: Dict[str, range] = {}
+        for dim, size in dims.items():
+            self.selection[dim] = _selection(self.indexers.get(dim), size, dim)
+        self.chunks: Dict[str, Tuple[int, ...]] = {}
+        for dim, selection in self.selection.items():
+            spec = self.requested_chunks.get(dim)
+            if spec is None and dim == concat_dim:
+                # one chunk per file with selected steps
+                counts = np.diff(np.searchsorted(selection, manifest.offsets))
+                self.chunks[dim] = tuple(int(count) for count in counts if count)
+            else:
+                self.chunks[dim] = _normalize(spec, len(selection))
+        self.offsets = {
+            dim: np.cumsum([0, *chunks]) for dim, chunks in self.chunks.items()
+        }
+        self.prefetched = 0
+        self._lock = threading.Lock()
+        self._pending: "OrderedDict[Tuple, Future]" = OrderedDict()
+        self._pool = ThreadPoolExecutor(max_workers=max_workers)
+        weakref.finalize(self, self._pool.shutdown, wait=False)
+
+    def __reduce__(self):  # type: ignore
+        return (
+            type(self),
+            (
+                self.manifest,
+                self.requested_chunks,
+                self.prefetch,
+                self.max_workers,
+                self.indexers,
+            ),
+        )
+
+    def slice(self, dim: str) -> slice:
+        """Selection along a dimension as slice of the whole dimension."""
+        selection = self.selection[dim]
+        return slice(selection.start, selection.stop, selection.step)
+
+    def array(self, name: str):  # type: ignore
+        """Dask array of the raw data of a variable."""
+        import dask.array as dsa
+        from dask.base import tokenize
+
+        meta = self.manifest.content["variables"][name]
+        chunks = tuple(self.chunks[dim] for dim in meta["dims"])
+        selection = tuple(self.selection[dim] for dim in meta["dims"])
+        key = f"{name}-{tokenize(self.manifest.token, name, chunks, selection)}"
+        graph = {
+            (key, *block_id): (self.read, name, block_id)
+            for block_id in product(*(range(len(dim_chunks)) for dim_chunks in chunks))
+        }
+        return dsa.Array(graph, key, chunks, dtype=np.dtype(meta["dtype"]))
+
+    def read(self, name: str, block_id: Tuple[int, ...]) -> np.ndarray:
+        """Read a block, and submit the reads of the following blocks."""
+        dims = self.manifest.content["variables"][name]["dims"]
+        axis = dims.index(self.manifest.concat_dim)
+        nblocks = len(self.chunks[self.manifest.concat_dim])
+        with self._lock:
+            future = self._pending.pop((name, block_id), None)
+            if future is None:
+                future = self._pool.submit(self._load, name, block_id)
+            else:
+                self.prefetched += 1
+            for ahead in range(block_id[axis] + 1, block_id[axis] + 1 + self.prefetch):
+                next_id = (*block_id[:axis], ahead, *block_id[axis + 1 :])
+                if ahead < nblocks and (name, next_id) not in self._pending:
+                    self._pending[(name, next_id)] = self._pool.submit(
+                        self._load, name, next_id
+                    )
+            # blocks read ahead but never requested
+            while len(self._pending) > 4 * max(self.prefetch, 1):
+                _, stale = self._pending.popitem(last=False)
+                stale.cancel()
+        return future.result()
+
+    def _load(self, name: str, block_id: Tuple[int, ...]) -> np.ndarray:
+        """Read the raw data of a block from its files."""
+        import netCDF4
+
+        dims = self.manifest.content["variables"][name]["dims"]
+        concat_dim = self.manifest.concat_dim
+        index = {
+            dim: self.selection[dim][
+                self.offsets[dim][block] : self.offsets[dim][block + 1]
+            ]
+            for dim, block in zip(dims, block_id)
+        }
+        steps = index[concat_dim]
+        offsets = self.manifest.offsets
+        # first and last selected step in each file
+        bounds = np.searchsorted(steps, offsets)
+        parts = []
+        for number in np.flatnonzero(np.diff(bounds)):
+            local = steps[bounds[number] : bounds[number + 1]]
+            index[concat_dim] = range(
+                local.start - offsets[number],
+                local[-1] - offsets[number] + 1,
+                local.step,
+            )
+            key = tuple(
+                slice(index[dim].start, index[dim].stop, index[dim].step)
+                for dim in dims
+            )
+            with NETCDF4_PYTHON_LOCK:
+                with netCDF4.Dataset(self.manifest.files[number]["path"]) as nc:
+                    variable = nc.variables[name]
+                    variable.set_auto_maskandscale(False)
+                    parts.append(np.asarray(variable[key]))
+        return np.concatenate(parts, axis=dims.index(concat_dim))
+
+
+def open_source(
+    source: str = "daily_mean",
+    catalog: str = "copernicus-reanalysis.yml",
+    chunks: Optional[Chunks] = None,
+    prefetch: int = 2,
+    manifest_dir: Optional[Path] = None,
+    rebuild: bool = False,
+    sel: Optional[Mapping[str, Any]] = None,
+    stride: Optional[Mapping[str, int]] = None,
+) -> xr.Dataset:
+    """Open a netCDF source of an intake catalog through its manifest.
+
+    The manifest is stored in `manifest_dir` (defaults to
+    ``$XDG_CACHE_HOME/water-masses/manifests``) and rebuilt if the files of the
+    source changed or `rebuild` is set. The selection `sel` and `stride` (see
+    :meth:`Manifest.indexers`) is read only.
+
+    """
+    import intake
+
+    entry = intake.open_catalog(str(Path(__file__).parent.joinpath("data", catalog)))[
+        source
+    ]
+    urlpath = entry.urlpath
+    path = manifest_path(source, urlpath, manifest_dir)
+    manifest = None
+    if path.exists() and not rebuild:
+        manifest = Manifest.from_json(path)
+        if not manifest.is_current():
+            manifest = None
+    if manifest is None:
+        manifest = Manifest.build(urlpath)
+        manifest.to_json(path)
+    return manifest.to_dataset(
+        chunks=chunks, prefetch=prefetch, indexers=manifest.indexers(sel, stride)
+    )
+
+
+def manifest_path(
+    source: str, urlpath: str, manifest_dir: Optional[Path] = None
+) -> Path:
+    """Location of the manifest of a source."""
+    if manifest_dir is None:
+        cache = os.environ.get("XDG_CACHE_HOME", str(Path.home().joinpath(".cache")))
+        manifest_dir = Path(cache).joinpath("water-masses", "manifests")
+    digest = sha1(urlpath.encode()).hexdigest()[:12]
+    return Path(manifest_dir).joinpath(f"{source}-{digest}.json")
+
+
+def iter_chunks(
+    obj: Union[xr.Dataset, xr.DataArray], dim: str = "time", prefetch: int = 1
+) -> Iterator[Union[xr.Dataset, xr.DataArray]]:
+    """Compute the chunks along `dim` one after another.
+
+    The next `prefetch` chunks are computed on a thread pool while the current
+    one is processed by the caller.
+
+    """
+    bounds = np.cumsum([0, *obj.chunksizes[dim]])
+    queue: Deque[Future] = deque()
+    with ThreadPoolExecutor(max_workers=max(prefetch, 1)) as pool:
+        for start, stop in zip(bounds[:-1], bounds[1:]):
+            queue.append(pool.submit(obj.isel({dim: slice(start, stop)}).compute))
+            if len(queue) > prefetch:
+                yield queue.popleft().result()
+        while queue:
+            yield queue.popleft().result()
+
+
+def _resolve(urlpath: Union[str, Sequence[str]]) -> List[str]:
+    paths = sorted(glob(urlpath)) if isinstance(urlpath, str) else list(urlpath)
+    if not paths:
+        raise FileNotFoundError(f"No files found for {urlpath}.")
+    return [str(Path(path).resolve()) for path in paths]
+
+
+def _unchanged(entry: Dict[str, Any]) -> bool:
+    """Check that the file of a manifest entry exists with the same state."""
+    try:
+        stat = os.stat(entry["path"])
+    except FileNotFoundError:
+        return False
+    return (stat.st_mtime_ns, stat.st_size) == (entry["mtime"], entry["size"])
+
+
+def _position(index: pd.Index, dim: str, label: Any) -> Union[int, slice]:
+    """Position of a label or slice of an inclusive label slice along `dim`."""
+    if isinstance(label, slice):
+        return index.slice_indexer(label.start, label.stop)
+    position = index.get_loc(label)
+    if not isinstance(position, (int, np.integer)):
+        raise KeyError(f"{label} is not unique along {dim}.")
+    return int(position)
+
+
+def _strided(current: Union[int, slice], dim: str, step: int) -> slice:
+    """Apply a step to the selection along `dim`."""
+    if not isinstance(current, slice):
+        raise ValueError(f"Cannot stride the scalar selection of {dim}.")
+    if current.step not in (None, 1):
+        raise ValueError(f"{dim} is already selected with a step.")
+    return slice(current.start, current.stop, step)
+
+
+def _file_entry(path: str, concat_dim: str) -> Dict[str, Any]:
+    """Path, state, length and (encoded) concatenation values of a file."""
+    import netCDF4
+
+    stat = os.stat(path)
+    with NETCDF4_PYTHON_LOCK:
+        with netCDF4.Dataset(path) as nc:
+            variable = nc.variables[concat_dim]
+            variable.set_auto_maskandscale(False)
+            values = np.asarray(variable[:])
+            units = getattr(variable, "units", None)
+    return {
+        "path": path,
+        "mtime": stat.st_mtime_ns,
+        "size": stat.st_size,
+        "length": len(values),
+        "values": values.tolist(),
+        "units": units,
+    }
+
+
+def _template(path: str, concat_dim: str) -> Dict[str, Any]:
+    """Dimensions, variables (with data unless along `concat_dim`) and attrs."""
+    import netCDF4
+
+    with NETCDF4_PYTHON_LOCK:
+        with netCDF4.Dataset(path) as nc:
+            variables = {}
+            for name, variable in nc.variables.items():
+                variable.set_auto_maskandscale(False)
+                meta: Dict[str, Any] = {
+                    "dims": list(variable.dimensions),
+                    "dtype": variable.dtype.str,
+                    "attrs": _encode_attrs(variable),
+                }
+                if concat_dim not in variable.dimensions:
+                    meta["data"] = np.asarray(variable[:]).tolist()
+                variables[name] = meta
+            return {
+                "dims": {name: len(dim) for name, dim in nc.dimensions.items()},
+                "variables": variables,
+                "attrs": _encode_attrs(nc),
+            }
+
+
+def _encode_attrs(obj: Any) -> Dict[str, Any]:
+    """netCDF attributes as JSON, keeping the dtype of numeric values."""
+    attrs = {}
+    for name in obj.ncattrs():
+        value = obj.getncattr(name)
+        if isinstance(value, (np.ndarray, np.generic)):
+            value = {
+                "__ndarray__": np.asarray(value).tolist(),
+                "dtype": value.dtype.str,
+            }
+        attrs[name] = value
+    return attrs
+
+
+def _decode_attrs(attrs: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        name: np.asarray(value["__ndarray__"], dtype=value["dtype"])[()]
+        if isinstance(value, dict) and "__ndarray__" in value
+        else value
+        for name, value in attrs.items()
+    }
+
+
+def _selection(indexer: Union[int, slice, None], size: int, dim: str) -> range:
+    """Selected positions of a dimension, a position as range of length one."""
+    if indexer is None:
+        return range(size)
+    if isinstance(indexer, slice):
+        selection = range(size)[indexer]
+        if selection.step < 1:
+            raise ValueError(f"Only positive steps can be read along {dim}.")
+        return selection
+    position = range(size)[indexer]
+    return range(position, position + 1)
+
+
+def _normalize(spec: Union[int, Tuple[int, ...], None], size: int) -> Tuple[int, ...]:
+    """Chunks of a dimension from a size (-1 or None for whole) or tuple."""
+    if isinstance(spec, tuple):
+        if sum(spec) != size:
+            raise ValueError("Chunks must add up to the size of the dimension.")
+        return spec
+    if spec is None or spec == -1 or spec >= size:
+        return (size,) if size else ()
+    return (spec,) * (size // spec) + ((size % spec,) if size % spec else ())
@@ -1,26 +1,135 @@
 # -*- coding: utf-8 -*-
 """Experiment constants."""
 
+import calendar
 from datetime import datetime
+from functools import cached_property
+from typing import Any, Dict, Tuple
+
+import numpy as np
+import pandas as pd
+
+DATE_FORMAT = "%Y-%m-%dT%H:%M:%S"
+
+#: Month number (1 to 12) of the English month names.
+MONTH_NUMBERS = {
+    name: number for number, name in enumerate(calendar.month_name) if number
+}
 
 
 class Timespan(object):
-    """Container of timespan of the experiment."""
+    """Timespan of the experiment.
+
+    Timespans are immutable values. Instances are cached, so ``Timespan()``
+    parses its dates once per session, and the derived calendars are computed
+    on first access only and shared by all modules.
+
+    Parameter
+    =========
+    start : str
+        start of timeperiod of analysis
+    end : str
+        end of timeperiod of analysis
+
+    """
+
+    _instances: Dict[Tuple[str, str], "Timespan"] = {}
 
-    def __init__(
-        self,
+    start: datetime
+    end: datetime
+
+    def __new__(
+        cls,
         start: str = "1993-01-01T00:00:00",
         end: str = "2019-12-31T00:00:00",
-    ) -> None:
-        """Start and end of analysis time series.
-
-        Parameter
-        =========
-        start : str
-            start of timeperiod of analysis
-        end : str
-            end of timeperiod of analysis
-
-        """
-        self.start: datetime = datetime.strptime(start, "%Y-%m-%dT%H:%M:%S")
-        self.end: datetime = datetime.strptime(end, "%Y-%m-%dT%H:%M:%S")
+    ) -> "Timespan":
+        """Return the cached instance of start and end."""
+        key = (start, end)
+        if key not in cls._instances:
+            instance = super().__new__(cls)
+            object.__setattr__(instance, "start", datetime.strptime(start, DATE_FORMAT))
+            object.__setattr__(instance, "end", datetime.strptime(end, DATE_FORMAT))
+            cls._instances[key] = instance
+        return cls._instances[key]
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        raise AttributeError("Timespan is immutable.")
+
+    def __delattr__(self, name: str) -> None:
+        raise AttributeError("Timespan is immutable.")
+
+    def __reduce__(self) -> Tuple[type, Tuple[str, str]]:
+        return (
+            type(self),
+            (self.start.strftime(DATE_FORMAT), self.end.strftime(DATE_FORMAT)),
+        )
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, Timespan):
+            return NotImplemented
+        return (self.start, self.end) == (other.start, other.end)
+
+    def __hash__(self) -> int:
+        return hash((self.start, self.end))
+
+    def __repr__(self) -> str:
+        return f"Timespan({self.start.isoformat()!r}, {self.end.isoformat()!r})"
+
+    @cached_property
+    def monthly(self) -> pd.DatetimeIndex:
+        """Month starts within the timespan."""
+        return pd.date_range(start=self.start, end=self.end, freq="MS")
+
+    @cached_property
+    def daily(self) -> pd.DatetimeIndex:
+        """Days within the timespan."""
+        return pd.date_range(start=self.start, end=self.end, freq="D")
+
+    @cached_property
+    def month_names(self) -> pd.Index:
+        """Month names of :attr:`monthly`."""
+        return self.monthly.month_name()
+
+    @cached_property
+    def year_month_keys(self) -> np.ndarray:
+        """Integer keys ``12 * year + month - 1`` of :attr:`monthly`."""
+        keys = np.asarray(12 * self.monthly.year + self.monthly.month - 1, np.int64)
+        keys.flags.writeable = False
+        return keys
+
+    @cached_property
+    def daily_noleap(self) -> pd.DatetimeIndex:
+        """Days of :attr:`daily` except February 29."""
+        daily = self.daily
+        return daily[~((daily.month == 2) & (daily.day == 29))]
+
+    @cached_property
+    def noleap(self) -> np.ndarray:
+        """:attr:`daily_noleap` as ``cftime.DatetimeNoLeap``."""
+        dates = noleap_dates(self.daily_noleap)
+        dates.flags.writeable = False
+        return dates
+
+
+def noleap_dates(dates: pd.Index) -> np.ndarray:
+    """Convert dates without February 29 to ``cftime.DatetimeNoLeap``.
+
+    Datetime indexes are converted at once, other dates one by one.
+
+    """
+    from cftime import DatetimeNoLeap, num2date
+
+    if not isinstance(dates, pd.DatetimeIndex):
+        return np.array([DatetimeNoLeap(*date.timetuple()[:6]) for date in dates])
+    if np.any((dates.month == 2) & (dates.day == 29)):
+        raise ValueError("February 29 does not exist in the noleap calendar.")
+    after_leap_day = dates.is_leap_year & (dates.month > 2)
+    days = (dates.year - 1) * 365 + dates.dayofyear - 1 - after_leap_day
+    seconds = (dates - dates.floor("D")) // pd.Timedelta(1, "s")
+    return np.asarray(
+        num2date(
+            np.asarray(days, np.int64) * 86400 + np.asarray(seconds, np.int64),
+            "seconds since 0001-01-01",
+            calendar="noleap",
+        )
+    )
@@ -1,24 +1,27 @@
 # -*- coding: utf-8 -*-
 """Decomposition of data sets."""
 
+import numpy as np
 import xarray as xr
 import pandas as pd
 from typing import Tuple
 
+from . import grouped
+from .instrument import instrumented
 
+
+@instrumented
 def from_monthly_index(
     datafield: xr.Dataset, filtindex: pd.DataFrame
 ) -> Tuple[int, xr.Dataset]:
-    """Filter daily data based on a monthly index."""
-    pain_fucking_ful_shit_manual_list_of_fucking_days_in_fucking_months = [
-        day.values
-        for day in datafield.time
-        if (day.dt.year, day.dt.month)
-        in zip(filtindex.date.dt.year, filtindex.date.dt.month)
-    ]
+    """Filter daily data based on a monthly index.
+
+    Days are matched to the months of the index by their integer year-month
+    key, see :func:`water_masses.grouped.labels`.
+
+    """
+    months, codes = grouped.labels(datafield.time, "yearmonth")
+    index_months = 12 * filtindex.date.dt.year.values + filtindex.date.dt.month.values
+    selected = np.isin(months, index_months - 1)[codes]
 
-    return len(
-        pain_fucking_ful_shit_manual_list_of_fucking_days_in_fucking_months
-    ), datafield.sel(
-        time=pain_fucking_ful_shit_manual_list_of_fucking_days_in_fucking_months
-    )
+    return int(selected.sum()), datafield.isel(time=selected)
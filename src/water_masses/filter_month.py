@@ -7,11 +7,14 @@ initialization-month and then subsample in that month.
 
 
 from pathlib import Path
-from typing import Optional
+from typing import Callable, Dict, Iterator, Optional, Sequence
 
+import numpy as np
 import pandas as pd
 
-from .constants import Timespan
+from .constants import MONTH_NUMBERS, Timespan
+from .tracmass import trajectory_time
+from .tracmass.table import TrajectoryTable, iter_csv
 
 
 class MetaData(object):
@@ -35,45 +38,150 @@ class MetaData(object):
         )
         self.timespan = timespan if timespan is not None else Timespan()
 
+    usecols: Sequence[int] = (0, 1, 5)
+    names: Sequence[str] = ("id", "lon", "time")
     import_kwargs = {
         "header": None,
-        "usecols": [0, 1, 5],
-        "names": ["id", "lon", "time"],
+        "usecols": list(usecols),
+        "names": list(names),
         "skipinitialspace": True,
     }
     indices = ["id"]
 
 
-def open_dataset(data_name: str, meta_data) -> pd.DataFrame:
+def open_table(data_name: str, meta_data: MetaData) -> TrajectoryTable:
+    """Open dataset given the Intake sources name as trajectory table."""
+    return TrajectoryTable.from_csv(
+        meta_data.data_path.format(data_name),
+        usecols=meta_data.usecols,
+        names=meta_data.names,
+        epoch=meta_data.timespan.end,
+    )
+
+
+def open_dataset(data_name: str, meta_data: MetaData) -> pd.DataFrame:
     """Open dataset given the Intake sources name."""
-    df = pd.read_csv(  # type: ignore
+    return open_table(data_name, meta_data).to_frame(
+        index=[*meta_data.indices, "date"],
+    )
+
+
+def iter_batches(
+    data_name: str,
+    meta_data: MetaData,
+    block_size: int = 1 << 24,
+) -> Iterator[pd.DataFrame]:
+    """Stream the dataset in batches of about `block_size` bytes of CSV."""
+    return iter_csv(
         meta_data.data_path.format(data_name),
-        **meta_data.import_kwargs,
-    ).set_index(meta_data.indices)
-    df = df.assign(
-        date=pd.Timestamp(meta_data.timespan.end)
-        + pd.to_timedelta(df.time.values, "s"),
+        usecols=meta_data.usecols,
+        names=meta_data.names,
+        block_size=block_size,
+    )
+
+
+def sample_initialization(
+    sample_size: int = 4,
+    strata: Sequence[str] = ("month",),
+    seed: Optional[int] = None,
+    meta_data: Optional[MetaData] = None,
+    table: Optional[TrajectoryTable] = None,
+    select: Optional[Dict[str, Sequence[int]]] = None,
+    region: Optional[Callable[[pd.DataFrame], np.ndarray]] = None,
+    block_size: int = 1 << 24,
+) -> pd.DataFrame:
+    """Draw a stratified random sample from initialization data in one pass.
+
+    The initialization data is streamed in batches (unless `table` is given) and
+    each row gets a random priority, per stratum the `sample_size` rows of lowest
+    priority are kept. This is a reservoir sample, uniform and without
+    replacement, so memory is bounded by the batch size and the reservoirs.
+    For a given `seed` the sample does not depend on the batch size.
+
+    Parameter
+    =========
+    sample_size : int
+        Number of samples per stratum, strata with fewer rows are returned whole.
+    strata : sequence of str
+        Keys defining the strata, `year`, `month` (of the initialization date),
+        `region` (see `region`) or any column of the data.
+    seed : int
+        Seed of the random number generator, for reproducible samples.
+    meta_data : MetaData
+        Location and format of the data.
+    table : TrajectoryTable
+        Sample from this table instead of reading the data.
+    select : dict
+        Only sample strata with these values, e.g. ``{"month": [1, 2]}``.
+    region : callable
+        Map a batch (DataFrame) to a seed region label per row.
+    block_size : int
+        Approximate size of the streamed batches in bytes.
+
+    Returns
+    =======
+    pd.DataFrame
+        Sampled rows with strata, ordered by strata.
+
+    """
+    if meta_data is None:
+        meta_data = MetaData()
+    batches = (
+        iter_batches("ini", meta_data, block_size=block_size)
+        if table is None
+        else (batch.to_pandas() for batch in table.table.to_batches())
+    )
+    epoch = meta_data.timespan.end if table is None else table.epoch
+    rng = np.random.default_rng(seed)
+    strata = list(strata)
+    reservoir = None
+    for batch in batches:
+        batch = batch.assign(_priority=rng.random(len(batch)))
+        # int64, rounded by the table and the CSV reader alike
+        year, month = trajectory_time.year_month(batch["time"].values, epoch)
+        batch = batch.assign(year=year, month=month)
+        if region is not None:
+            batch = batch.assign(region=region(batch))
+        for key, values in (select or {}).items():
+            batch = batch[batch[key].isin(values)]
+        reservoir = (
+            pd.concat([reservoir, batch], ignore_index=True)
+            .sort_values("_priority", kind="stable")
+            .groupby(strata, sort=False)
+            .head(sample_size)
+        )
+    if reservoir is None:
+        raise ValueError("No initialization data to sample from.")
+    return (
+        reservoir.sort_values([*strata, "_priority"])
+        .drop(columns="_priority")
+        .reset_index(drop=True)
     )
-    df.set_index([df.index, "date"], inplace=True)
-    return df
 
 
 def select_from_initialization(
     sample_size: int = 4,
     month: str = "January",
     meta_data: Optional[MetaData] = None,
+    table: Optional[TrajectoryTable] = None,
+    seed: Optional[int] = None,
 ) -> pd.Int64Index:
     """Filter for month and draw random sample.
 
-    First open initialization data of trajectpries, then Filter for month and draw
-    random sample.
+    Stream initialization data of trajectpries (unless `table` is given),
+    then Filter for month and draw random sample, see
+    :func:`sample_initialization` to sample several months at once.
 
     """
-    if meta_data is None:
-        meta_data = MetaData()
-    df = open_dataset("ini", meta_data)
-    of_month = df.index.get_level_values("date").month_name() == month
-    return df[of_month].sample(sample_size).index.get_level_values("id")
+    sample = sample_initialization(
+        sample_size,
+        strata=("month",),
+        seed=seed,
+        meta_data=meta_data,
+        table=table,
+        select={"month": [MONTH_NUMBERS[month]]},
+    )
+    return pd.Index(sample["id"].values, name="id")
 
 
 def main() -> pd.Int64Index:
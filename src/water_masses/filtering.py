@@ -1,42 +1,87 @@
-from typing import Callable, Dict, List
+"""Butterworth filters along time.
+
+:func:`filter_series` filters many series at once: the columns of a 2-D array
+or DataFrame or all series of an N-D DataArray are filtered by a single
+``scipy.signal.sosfiltfilt`` call. Series with missing values are split into
+their contiguous segments, segments with the same start and end are again
+filtered together.
+"""
+
+from typing import Callable, Dict, List, Optional, Tuple, TypeVar
 
-import cf_xarray as cfxr  # noqa
 import numpy as np
+import pandas as pd
 import xarray as xr
-from scipy import signal
+
+from .instrument import instrumented
+from .precision import result_dtype
+
+T = TypeVar("T", np.ndarray, pd.Series, pd.DataFrame, xr.DataArray)
 
 
+@instrumented
 def apply_filter(
     filter_func: Callable[..., np.ndarray],
     data: xr.DataArray,
     filter_args: List[float],
     filter_kwgs: Dict[str, int],
 ) -> xr.DataArray:
-    """Apply filter to xarray DataArray."""
+    """Apply filter to xarray DataArray.
+
+    The filter runs in float64, the result keeps the floating point type of
+    `data`.
+
+    """
+    import cf_xarray as cfxr  # noqa
+
     data = data.copy()
-    data.values = xr.apply_ufunc(
-        filter_func,
-        data,
-        *filter_args,
-        kwargs=filter_kwgs,
-        input_core_dims=[["time"], *[[] for _ in range(len(filter_args))]],
-        output_core_dims=[["time"]],
-        vectorize=True,
-    ).cf.transpose("time", "latitude", "longitude")
+    data.values = (
+        xr.apply_ufunc(
+            filter_func,
+            data,
+            *filter_args,
+            kwargs=filter_kwgs,
+            input_core_dims=[["time"], *[[] for _ in range(len(filter_args))]],
+            output_core_dims=[["time"]],
+            vectorize=True,
+        )
+        .cf.transpose("time", "latitude", "longitude")
+        .astype(result_dtype(data.dtype))
+    )
 
     return data
 
 
+def lowpass_sos(cutlen: float = 15, fs: float = 12, order: int = 5) -> np.ndarray:
+    """Second order sections of a lowpass filter cutting periods below `cutlen`."""
+    from scipy import signal
+
+    return signal.butter(
+        order, 1 / cutlen / (0.5 * fs), analog=False, btype="lowpass", output="sos"
+    )
+
+
+def bandstop_sos(
+    lowcut: float = 0.875, highcut: float = 1.167, fs: float = 12, order: int = 5
+) -> np.ndarray:
+    """Second order sections of a filter stopping periods `highcut` to `lowcut`."""
+    from scipy import signal
+
+    nyq = 0.5 * fs
+    lcut = 1 / lowcut / nyq
+    hcut = 1 / highcut / nyq
+    return signal.butter(
+        order, [hcut, lcut], analog=False, btype="bandstop", output="sos"
+    )
+
+
 def butter_lowpass_filter(
     data: np.ndarray, cutlen: int = 15, fs: int = 12, order=5
 ) -> np.ndarray:
     """1D lowpass butterworth filter."""
-    return signal.sosfiltfilt(
-        signal.butter(
-            order, 1 / cutlen / (0.5 * fs), analog=False, btype="lowpass", output="sos"
-        ),
-        data,
-    )
+    from scipy import signal
+
+    return signal.sosfiltfilt(lowpass_sos(cutlen, fs, order), data)
 
 
 def butter_bandstop_filter(
@@ -47,12 +92,153 @@ def butter_bandstop_filter(
     order: int = 5,
 ):
     """1D bandstop butterworth filter."""
-    nyq = 0.5 * fs
-    lcut = 1 / lowcut / nyq
-    hcut = 1 / highcut / nyq
-    return signal.sosfiltfilt(
-        signal.butter(
-            order, [hcut, lcut], analog=False, btype="bandstop", output="sos"
-        ),
-        data,
+    from scipy import signal
+
+    return signal.sosfiltfilt(bandstop_sos(lowcut, highcut, fs, order), data)
+
+
+def lowpass(
+    data: T,
+    cutlen: float = 15,
+    fs: float = 12,
+    order: int = 5,
+    dim: str = "time",
+    axis: int = 0,
+) -> T:
+    """Lowpass filter of many series.
+
+    See :func:`lowpass_sos` for the filter and :func:`filter_series` for
+    `data`, `dim` and `axis`.
+
+    """
+    return filter_series(data, lowpass_sos(cutlen, fs, order), dim=dim, axis=axis)
+
+
+def bandstop(
+    data: T,
+    lowcut: float = 0.875,
+    highcut: float = 1.167,
+    fs: float = 12,
+    order: int = 5,
+    dim: str = "time",
+    axis: int = 0,
+) -> T:
+    """Bandstop filter of many series.
+
+    See :func:`bandstop_sos` for the filter and :func:`filter_series` for
+    `data`, `dim` and `axis`.
+
+    """
+    return filter_series(
+        data, bandstop_sos(lowcut, highcut, fs, order), dim=dim, axis=axis
+    )
+
+
+@instrumented
+def filter_series(
+    data: T,
+    sos: np.ndarray,
+    dim: str = "time",
+    axis: int = 0,
+    padlen: Optional[int] = None,
+) -> T:
+    """Forward-backward filter all series of `data` at once.
+
+    Missing values split a series into segments which are filtered separately.
+    Segments not longer than the padding are too short to be filtered and
+    become missing.
+
+    Parameter
+    =========
+    data : np.ndarray, pd.Series, pd.DataFrame or xr.DataArray
+        Series along `axis` (arrays), the index (pandas, each column is a
+        series) or `dim` (DataArrays, in a single chunk if dask backed).
+    sos : np.ndarray
+        Second order sections of the filter, e.g. from :func:`lowpass_sos`.
+    dim : str
+        Time dimension of DataArrays.
+    axis : int
+        Time axis of arrays.
+    padlen : int
+        Padding of ``scipy.signal.sosfiltfilt``, defaults to its default.
+
+    Returns
+    =======
+    np.ndarray, pd.Series, pd.DataFrame or xr.DataArray
+        New object like `data`, of the floating point type of `data`.
+
+    """
+    if isinstance(data, xr.DataArray):
+        return xr.apply_ufunc(
+            _filter_last_axis,
+            data,
+            input_core_dims=[[dim]],
+            output_core_dims=[[dim]],
+            kwargs={"sos": sos, "padlen": padlen},
+            dask="parallelized",
+            output_dtypes=[result_dtype(data.dtype)],
+            keep_attrs=True,
+        ).transpose(*data.dims)
+    if isinstance(data, pd.DataFrame):
+        values = _filter_last_axis(data.to_numpy().T, sos, padlen).T
+        return pd.DataFrame(values, index=data.index, columns=data.columns)
+    if isinstance(data, pd.Series):
+        values = _filter_last_axis(data.to_numpy(), sos, padlen)
+        return pd.Series(values, index=data.index, name=data.name)
+    values = np.moveaxis(np.asarray(data), axis, -1)
+    return np.moveaxis(_filter_last_axis(values, sos, padlen), -1, axis)
+
+
+def default_padlen(sos: np.ndarray) -> int:
+    """Default padding of ``scipy.signal.sosfiltfilt``."""
+    ntaps = 2 * len(sos) + 1
+    ntaps -= min((sos[:, 2] == 0).sum(), (sos[:, 5] == 0).sum())
+    return int(3 * ntaps)
+
+
+def _filter_last_axis(
+    values: np.ndarray, sos: np.ndarray, padlen: Optional[int] = None
+) -> np.ndarray:
+    """Filter the series along the last axis, segment wise if incomplete."""
+    from scipy import signal
+
+    shape = values.shape
+    dtype = result_dtype(values.dtype)
+    series = values.reshape(-1, shape[-1])
+    valid = ~np.isnan(series)
+    result = np.full(series.shape, np.nan, dtype=dtype)
+    minimum = (default_padlen(sos) if padlen is None else padlen) + 1
+
+    complete = valid.all(axis=-1)
+    if complete.any() and shape[-1] >= minimum:
+        result[complete] = signal.sosfiltfilt(
+            sos, series[complete], axis=-1, padlen=padlen
+        )
+    incomplete = np.flatnonzero(~complete)
+    if incomplete.size:
+        starts, stops, rows = _segments(valid[incomplete])
+        long_enough = stops - starts >= minimum
+        starts, stops, rows = starts[long_enough], stops[long_enough], rows[long_enough]
+    if incomplete.size and rows.size:
+        bounds, group = np.unique(
+            np.stack([starts, stops], axis=-1), axis=0, return_inverse=True
+        )
+        group = group.reshape(-1)
+        for number, (start, stop) in enumerate(bounds):
+            members = incomplete[rows[group == number]]
+            result[members, start:stop] = signal.sosfiltfilt(
+                sos, series[members, start:stop], axis=-1, padlen=padlen
+            )
+    return result.reshape(shape)
+
+
+def _segments(valid: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Starts, stops and rows of the runs of valid values along the last axis."""
+    edges = np.diff(
+        np.pad(valid.astype(np.int8), ((0, 0), (1, 1))),
+        axis=-1,
     )
+    # both in row major order, so the n-th start belongs to the n-th stop
+    rows, starts = np.nonzero(edges == 1)
+    _, stops = np.nonzero(edges == -1)
+    return starts, stops, rows
@@ -0,0 +1,236 @@
+# -*- coding: utf-8 -*-
+"""Derived geometry of regular latitude/longitude grids.
+
+A :class:`Grid` holds what :mod:`water_masses.tracmass.seeding`,
+:mod:`water_masses.origin.pca`, :mod:`water_masses.significance` and
+:mod:`water_masses.transform` derive from the coordinates of a field: spacing,
+bounds, cos(latitude) weights, cell areas, the wet mask and index lookup
+tables. Grids are cached by a hash of their coordinates (and mask), so
+``Grid.from_coords(da)`` returns the same instance for every field on the AMM7
+grid and each quantity is computed once per session::
+
+    grid = Grid.from_coords(sss)
+    solver, eofs = lat_weighted_eof(sss, grid=grid)
+    ds = roll(ds, grid=grid)
+
+"""
+
+import hashlib
+from collections import OrderedDict
+from functools import cached_property
+from typing import TYPE_CHECKING, Dict, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+if TYPE_CHECKING:  # pragma: no cover
+    import xarray as xr
+
+#: Mean radius of the earth in metres.
+EARTH_RADIUS = 6371000.0
+
+#: Number of grids kept in the cache.
+CACHE_SIZE = 16
+
+DIMS = ("latitude", "longitude")
+
+
+class Grid(object):
+    """Geometry of a latitude/longitude grid, derived on first access.
+
+    Use :meth:`from_coords` to share instances between fields on the same
+    grid. The derived arrays are read-only.
+
+    Parameter
+    =========
+    latitude, longitude : np.ndarray
+        Monotonic 1-D coordinates in degrees.
+    wet : np.ndarray or xr.DataArray
+        Boolean mask `(latitude, longitude)` of ocean cells, defaults to all
+        cells.
+
+    """
+
+    _instances: "OrderedDict[str, Grid]" = OrderedDict()
+
+    def __init__(
+        self,
+        latitude: np.ndarray,
+        longitude: np.ndarray,
+        wet: Union[None, np.ndarray, "xr.DataArray"] = None,
+    ) -> None:
+        """Store read-only copies of the coordinates and the mask."""
+        self.coords: Dict[str, np.ndarray] = {
+            dim: _readonly(np.array(values, dtype=np.float64))
+            for dim, values in zip(DIMS, (latitude, longitude))
+        }
+        self.shape = (len(self.coords["latitude"]), len(self.coords["longitude"]))
+        self._wet = None if wet is None else _readonly(np.array(wet, dtype=bool))
+        if self._wet is not None and self._wet.shape != self.shape:
+            raise ValueError(
+                f"The wet mask {self._wet.shape} does not match the grid {self.shape}."
+            )
+        self._roll: Dict[float, Tuple[np.ndarray, np.ndarray]] = {}
+
+    @classmethod
+    def from_coords(
+        cls,
+        obj: Union["xr.DataArray", "xr.Dataset"],
+        wet: Union[None, np.ndarray, "xr.DataArray"] = None,
+    ) -> "Grid":
+        """Return the cached grid of the CF latitude and longitude of `obj`."""
+        import cf_xarray as cfxr  # noqa
+
+        latitude, longitude = [obj.cf.coords[dim].values for dim in DIMS]
+        return cls.cached(latitude, longitude, wet)
+
+    @classmethod
+    def cached(
+        cls,
+        latitude: np.ndarray,
+        longitude: np.ndarray,
+        wet: Union[None, np.ndarray, "xr.DataArray"] = None,
+    ) -> "Grid":
+        """Return the cached grid of the coordinates, see :func:`grid_key`."""
+        key = grid_key(latitude, longitude, wet)
+        if key in cls._instances:
+            cls._instances.move_to_end(key)
+        else:
+            cls._instances[key] = cls(latitude, longitude, wet)
+            if len(cls._instances) > CACHE_SIZE:
+                cls._instances.popitem(last=False)
+        return cls._instances[key]
+
+    def __repr__(self) -> str:
+        return (
+            f"Grid(latitude={self.bounds['latitude']}, "
+            f"longitude={self.bounds['longitude']}, shape={self.shape})"
+        )
+
+    @cached_property
+    def spacing(self) -> Dict[str, float]:
+        """Mean spacing of the coordinates in degrees."""
+        return {
+            dim: float(np.mean(np.diff(values))) for dim, values in self.coords.items()
+        }
+
+    @cached_property
+    def bounds(self) -> Dict[str, Tuple[float, float]]:
+        """Minimum and maximum of the coordinates."""
+        return {
+            dim: (float(values.min()), float(values.max()))
+            for dim, values in self.coords.items()
+        }
+
+    @cached_property
+    def coslat(self) -> np.ndarray:
+        """cos(latitude), clipped to 0 to 1."""
+        return _readonly(np.cos(np.deg2rad(self.coords["latitude"])).clip(0.0, 1.0))
+
+    @cached_property
+    def coslat_weights(self) -> np.ndarray:
+        """Square root of cos(latitude), broadcastable to (latitude, longitude)."""
+        return _readonly(np.sqrt(self.coslat)[..., np.newaxis])
+
+    @cached_property
+    def area(self) -> np.ndarray:
+        """Area of the cells `(latitude, longitude)` in square metres.
+
+        Cell edges are halfway between the coordinates, the outer edges half a
+        spacing beyond the first and last coordinates.
+
+        """
+        lat_edges, lon_edges = [_edges(self.coords[dim]) for dim in DIMS]
+        band = np.abs(np.diff(np.sin(np.deg2rad(lat_edges.clip(-90, 90)))))
+        width = np.abs(np.diff(np.deg2rad(lon_edges)))
+        return _readonly(EARTH_RADIUS ** 2 * np.outer(band, width))
+
+    @property
+    def wet(self) -> np.ndarray:
+        """Boolean mask of ocean cells `(latitude, longitude)`."""
+        if self._wet is None:
+            self._wet = _readonly(np.ones(self.shape, dtype=bool))
+        return self._wet
+
+    @cached_property
+    def wet_area(self) -> np.ndarray:
+        """:attr:`area` of the ocean cells, zero on land."""
+        return _readonly(np.where(self.wet, self.area, 0.0))
+
+    @cached_property
+    def _indexes(self) -> Dict[str, pd.Index]:
+        return {dim: pd.Index(values) for dim, values in self.coords.items()}
+
+    def nearest(self, dim: str, loc: Union[float, np.ndarray]) -> np.ndarray:
+        """Index of the nearest coordinate, as ``.sel(method="nearest")``."""
+        return self._indexes[dim].get_indexer(np.atleast_1d(loc), method="nearest")
+
+    def to_coordinate(
+        self, dim: str, idx: Union[float, np.ndarray]
+    ) -> Union[float, np.ndarray]:
+        """Convert (fractional) indexes to coordinates, linear between the bounds."""
+        mi, ma = self.bounds[dim]
+        return idx / (len(self.coords[dim]) - 1) * (ma - mi) + mi
+
+    def roll_index(self, lon_min: float = -180) -> Tuple[np.ndarray, np.ndarray]:
+        """Permutation index and wrapped longitudes, see :func:`transform.roll`."""
+        if lon_min not in self._roll:
+            from .transform import _roll_index
+
+            self._roll[lon_min] = _roll_index(
+                tuple(self.coords["longitude"].tolist()), lon_min
+            )
+        return self._roll[lon_min]
+
+
+def grid_key(
+    latitude: np.ndarray,
+    longitude: np.ndarray,
+    wet: Union[None, np.ndarray, "xr.DataArray"] = None,
+) -> str:
+    """Hash of the coordinates and the mask."""
+    digest = hashlib.blake2b(digest_size=16)
+    for values in (latitude, longitude):
+        values = np.ascontiguousarray(values, dtype=np.float64)
+        digest.update(str(values.shape).encode())
+        digest.update(values.tobytes())
+    if wet is not None:
+        digest.update(np.packbits(np.asarray(wet, dtype=bool)).tobytes())
+    return digest.hexdigest()
+
+
+def cf_role(obj: Union["xr.DataArray", "xr.Dataset"], name: str) -> str:
+    """CF role (`latitude` or `longitude`) of the coordinate `name` of `obj`.
+
+    :class:`Grid` keys its coordinates by role, so e.g. a coordinate ``lon``
+    with ``units: degrees_east`` is looked up as `longitude`.
+
+    """
+    import cf_xarray as cfxr  # noqa
+
+    coordinates = obj.cf.coordinates
+    for dim in DIMS:
+        if name in coordinates.get(dim, ()):
+            return dim
+    if name in DIMS:
+        return name
+    raise KeyError(f"{name} is neither the CF latitude nor longitude.")
+
+
+def get_grid(
+    obj: Union["xr.DataArray", "xr.Dataset"], grid: Optional[Grid] = None
+) -> Grid:
+    """`grid` or the cached grid of `obj`."""
+    return Grid.from_coords(obj) if grid is None else grid
+
+
+def _edges(values: np.ndarray) -> np.ndarray:
+    middle = (values[1:] + values[:-1]) / 2
+    first = values[0] - (middle[0] - values[0]) if len(values) > 1 else values[0]
+    last = values[-1] + (values[-1] - middle[-1]) if len(values) > 1 else values[-1]
+    return np.concatenate([[first], middle, [last]])
+
+
+def _readonly(values: np.ndarray) -> np.ndarray:
+    values.flags.writeable = False
+    return values
@@ -0,0 +1,377 @@
+# -*- coding: utf-8 -*-
+"""Grouped reductions along time with integer labels.
+
+Instead of one task per group as with xarray's groupby or resample, each chunk
+is reduced by a single vectorized kernel: the time steps are ordered by their
+integer group code once and reduced group by group with ``ufunc.reduceat``.
+For `mean` and `count` the chunks along time are reduced separately into
+partial sums and counts of the groups present in the chunk, which are added up
+pairwise (tree reduction). `quantile` needs all values of a group at once and
+reduces each spatial chunk of time series (blockwise, with time rechunked to a
+single chunk if necessary).
+
+Sums are accumulated in float64, the results of float32 data are float32,
+see :mod:`water_masses.precision`.
+"""
+
+from functools import partial
+from typing import Any, Dict, Hashable, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import xarray as xr
+
+from .precision import ACCUMULATOR, result_dtype
+
+FUNCS = ("mean", "count", "quantile")
+
+Labels = Union[str, Sequence[Hashable], np.ndarray]
+
+
+def labels(time: xr.DataArray, by: Labels) -> Tuple[np.ndarray, np.ndarray]:
+    """Unique group labels and the integer group code of each time step.
+
+    Parameter
+    =========
+    time : xr.DataArray
+        Time coordinate (datetime64 or cftime).
+    by : str or array like
+        Component of the ``dt`` accessor, e.g. `month`, `season` or
+        `dayofyear`, `yearmonth` for the key ``12 * year + month - 1``, or a
+        label per time step.
+
+    """
+    if isinstance(by, str):
+        if by == "yearmonth":
+            values = np.asarray(12 * time.dt.year + time.dt.month - 1)
+        else:
+            values = np.asarray(getattr(time.dt, by))
+    else:
+        values = np.asarray(by)
+    if values.shape != time.shape:
+        raise ValueError("There must be one label per time step.")
+    unique, codes = np.unique(values, return_inverse=True)
+    return unique, codes.reshape(-1)
+
+
+def reduce(
+    da: xr.DataArray,
+    by: Labels,
+    func: str = "mean",
+    q: Optional[float] = None,
+    dim: str = "time",
+    skipna: bool = True,
+    group_dim: Optional[str] = None,
+) -> xr.DataArray:
+    """Reduce `da` along `dim` by groups.
+
+    Parameter
+    =========
+    da : xr.DataArray
+        Data, numpy or dask backed.
+    by : str or array like
+        Groups, see :func:`labels`.
+    func : str
+        `mean`, `count` or `quantile`.
+    q : float
+        Quantile, required for `quantile`.
+    dim : str
+        Dimension to reduce.
+    skipna : bool
+        Skip missing values, otherwise groups with missing values are missing.
+    group_dim : str
+        Name of the group dimension, defaults to `by` if a string else `group`.
+
+    Returns
+    =======
+    xr.DataArray
+        Reduction with `dim` replaced by the group dimension (last), counts
+        are integers, other reductions of the floating point type of `da`.
+
+    """
+    if func not in FUNCS:
+        raise ValueError(f"func must be one of {', '.join(FUNCS)}.")
+    if func == "quantile" and q is None:
+        raise ValueError("quantile requires q.")
+    if group_dim is None:
+        group_dim = by if isinstance(by, str) else "group"
+    unique, codes = labels(da[dim], by)
+    da = da.transpose(..., dim)
+    kws = {"ngroups": len(unique), "func": func, "q": q, "skipna": skipna}
+
+    if da.chunks is None:
+        data = _finalize(_reduce_block(da.values, codes, **kws), **kws)
+    else:
+        data = _reduce_dask(da, codes, dim, kws)
+    if func != "count" and data.dtype != result_dtype(da.dtype):
+        data = data.astype(result_dtype(da.dtype))
+
+    coords: Dict[Hashable, xr.Variable] = {
+        name: coord.variable
+        for name, coord in da.coords.items()
+        if dim not in coord.dims
+    }
+    coords[group_dim] = xr.Variable(group_dim, unique)
+    return xr.DataArray(
+        data,
+        coords=coords,
+        dims=(*da.dims[:-1], group_dim),
+        name=da.name,
+        attrs=da.attrs,
+    )
+
+
+def _reduce_dask(da: xr.DataArray, codes: np.ndarray, dim: str, kws: Dict):
+    """Map the block kernel over the time chunks and tree-reduce the partials."""
+    import dask.array as dsa
+
+    if kws["func"] == "quantile":
+        da = da.chunk({dim: -1})
+    array = da.data
+    partials = _chunk_partials(array, codes, kws)
+    while len(partials) > 1:
+        partials = [
+            _merge_partials(*partials[i : i + 2])
+            if i + 1 < len(partials)
+            else partials[i]
+            for i in range(0, len(partials), 2)
+        ]
+    # every group is present in some chunk
+    _, total = partials[0]
+    return dsa.map_blocks(
+        partial(_finalize, **kws),
+        total,
+        chunks=(*array.chunks[:-1], (kws["ngroups"],)),
+        meta=np.array((), dtype=np.int64 if kws["func"] == "count" else ACCUMULATOR),
+    )
+
+
+def _chunk_partials(
+    array, codes: np.ndarray, kws: Dict
+) -> List[Tuple[np.ndarray, Any]]:
+    """Partials of the time chunks of a dask array with their groups.
+
+    The partial of a chunk holds only the groups present in the chunk, e.g. a
+    month of days for `dayofyear`, instead of all groups.
+
+    """
+    import dask.array as dsa
+
+    bounds = np.cumsum((0, *array.chunks[-1]))
+    partials = []
+    for start, stop in zip(bounds[:-1], bounds[1:]):
+        present, local = np.unique(codes[start:stop], return_inverse=True)
+        block_kws = {**kws, "ngroups": len(present)}
+        width = len(present) if kws["func"] == "quantile" else 2 * len(present)
+        partials.append(
+            (
+                present,
+                dsa.map_blocks(
+                    partial(_reduce_block, codes=local.reshape(-1), **block_kws),
+                    array[..., start:stop],
+                    chunks=(*array.chunks[:-1], (width,)),
+                    meta=np.array((), dtype=ACCUMULATOR),
+                ),
+            )
+        )
+    return partials
+
+
+def _merge_partials(
+    first: Tuple[np.ndarray, Any], second: Tuple[np.ndarray, Any]
+) -> Tuple[np.ndarray, Any]:
+    """Add two partial sums and counts over the union of their groups."""
+    import dask.array as dsa
+
+    groups = np.union1d(first[0], second[0])
+    positions = [np.searchsorted(groups, present) for present, _ in (first, second)]
+    index = "abcdefghijklmnopqrs"[: first[1].ndim - 1]
+    merged = dsa.blockwise(
+        partial(_add_partials, positions=positions, ngroups=len(groups)),
+        f"{index}g",
+        first[1],
+        f"{index}u",
+        second[1],
+        f"{index}v",
+        new_axes={"g": 2 * len(groups)},
+        concatenate=True,
+        meta=np.array((), dtype=ACCUMULATOR),
+    )
+    return groups, merged
+
+
+def _add_partials(
+    first: np.ndarray,
+    second: np.ndarray,
+    positions: Sequence[np.ndarray],
+    ngroups: int,
+) -> np.ndarray:
+    result = np.zeros((*first.shape[:-1], 2 * ngroups), dtype=ACCUMULATOR)
+    for values, position in zip((first, second), positions):
+        result[..., position] += values[..., : len(position)]
+        result[..., ngroups + position] += values[..., len(position) :]
+    return result
+
+
+def _reduce_block(
+    values: np.ndarray,
+    codes: np.ndarray,
+    ngroups: int,
+    func: str,
+    q: Optional[float],
+    skipna: bool,
+) -> np.ndarray:
+    """Group reduction of a block along its last axis.
+
+    Returns the quantiles of the groups or the partial sums followed by the
+    partial counts.
+
+    """
+    order = None
+    if np.any(codes[1:] < codes[:-1]):
+        order = np.argsort(codes, kind="stable")
+        codes = codes[order]
+        values = values[..., order]
+    present, starts = np.unique(codes, return_index=True)
+    shape = values.shape[:-1]
+
+    if func == "quantile":
+        result = np.full((*shape, ngroups), np.nan, dtype=ACCUMULATOR)
+        for group, start, stop in zip(present, starts, [*starts[1:], len(codes)]):
+            result[..., group] = _quantile(values[..., start:stop], q, skipna)
+        return result
+
+    sums = np.zeros((*shape, ngroups), dtype=ACCUMULATOR)
+    counts = np.zeros((*shape, ngroups), dtype=ACCUMULATOR)
+    if len(codes):
+        valid = ~np.isnan(values) if skipna else None
+        filled = np.where(valid, values, 0) if skipna else values
+        sums[..., present] = np.add.reduceat(filled, starts, axis=-1, dtype=ACCUMULATOR)
+        if skipna:
+            counts[..., present] = np.add.reduceat(valid, starts, axis=-1)
+        else:
+            counts[..., present] = np.diff(np.r_[starts, len(codes)])
+    return np.concatenate([sums, counts], axis=-1)
+
+
+def _quantile(values: np.ndarray, q: float, skipna: bool) -> np.ndarray:
+    """Linearly interpolated quantile along the last axis by a single sort.
+
+    Same as ``np.nanquantile`` (``np.quantile`` without `skipna`), but
+    vectorized over the series.
+
+    """
+    ordered = np.sort(values, axis=-1)
+    # missing values are sorted last
+    count = np.sum(~np.isnan(ordered), axis=-1)
+    if not skipna:
+        count = np.where(count < values.shape[-1], 0, count)
+    position = np.maximum(count - 1, 0) * q
+    lower = np.floor(position).astype(np.intp)
+    upper = np.minimum(lower + 1, np.maximum(count - 1, 0))
+    low = np.take_along_axis(ordered, lower[..., np.newaxis], axis=-1)[..., 0]
+    high = np.take_along_axis(ordered, upper[..., np.newaxis], axis=-1)[..., 0]
+    result = low + (position - lower) * (high - low)
+    return np.where(count > 0, result, np.nan)
+
+
+def _finalize(
+    partial: np.ndarray,
+    ngroups: int,
+    func: str,
+    q: Optional[float],
+    skipna: bool,
+) -> np.ndarray:
+    """Final reduction from the partials of :func:`_reduce_block`."""
+    if func == "quantile":
+        return partial
+    sums, counts = partial[..., :ngroups], partial[..., ngroups:]
+    if func == "count":
+        return counts.astype(np.int64)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return sums / counts
+
+
+def anomalies(
+    da: xr.DataArray,
+    by: Labels,
+    func: str = "mean",
+    q: Optional[float] = None,
+    dim: str = "time",
+    skipna: bool = True,
+    reduced: Optional[xr.DataArray] = None,
+) -> xr.DataArray:
+    """Subtract the grouped reduction (e.g. a climatology) from `da`.
+
+    The reduction of each time step's group is subtracted in a single kernel
+    per chunk instead of by group wise arithmetic.
+
+    Parameter
+    =========
+    reduced : xr.DataArray
+        Precomputed reduction of `da` by `by`, see :func:`reduce`, otherwise
+        it is computed with `func`, `q` and `skipna`.
+
+    """
+    group_dim = by if isinstance(by, str) else "group"
+    unique, codes = labels(da[dim], by)
+    if reduced is None:
+        reduced = reduce(da, by, func=func, q=q, dim=dim, skipna=skipna)
+    position = reduced.indexes[group_dim].get_indexer(unique)
+    if np.any(position < 0):
+        raise KeyError(f"Groups missing in the reduction: {unique[position < 0]}")
+    dims = da.dims
+    da = da.transpose(..., dim)
+    reduced = reduced.transpose(*da.dims[:-1], group_dim)
+    codes = position[codes]
+
+    if da.chunks is None:
+        data = _subtract_groups(da.values, reduced.values, codes)
+    else:
+        import dask.array as dsa
+
+        reduced = reduced.chunk(dict(zip(da.dims[:-1], da.chunks[:-1])))
+        index = "abcdefghijklmnopqrs"[: da.ndim - 1]
+        data = dsa.blockwise(
+            _subtract_groups,
+            f"{index}t",
+            da.data,
+            f"{index}t",
+            reduced.data,
+            f"{index}g",
+            dsa.from_array(codes, chunks=(da.chunks[-1],)),
+            "t",
+            concatenate=True,
+            dtype=np.result_type(da.dtype, reduced.dtype),
+        )
+    return da.copy(data=data).transpose(*dims)
+
+
+def _subtract_groups(
+    values: np.ndarray, reduced: np.ndarray, codes: np.ndarray
+) -> np.ndarray:
+    return values - reduced[..., codes]
+
+
+def resample_monthly(
+    da: xr.DataArray,
+    func: str = "mean",
+    q: Optional[float] = None,
+    dim: str = "time",
+    skipna: bool = True,
+) -> xr.DataArray:
+    """Monthly reduction labeled with the month starts, like ``resample("MS")``.
+
+    Only months with data are returned.
+
+    """
+    reduced = reduce(
+        da, "yearmonth", func=func, q=q, dim=dim, skipna=skipna, group_dim=dim
+    )
+    keys = reduced[dim].values
+    first = da[dim].values[0]
+    if np.issubdtype(da[dim].dtype, np.datetime64):
+        starts = (keys - 12 * 1970).astype("datetime64[M]").astype("datetime64[ns]")
+    else:
+        # cftime dates
+        starts = np.array([type(first)(key // 12, key % 12 + 1, 1) for key in keys])
+    return reduced.assign_coords({dim: starts})
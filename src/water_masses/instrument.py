@@ -0,0 +1,348 @@
+# -*- coding: utf-8 -*-
+"""Opt-in timing and memory instrumentation of processing stages.
+
+Instrumentation is disabled by default and then costs a single flag lookup
+per call. Enable it with :func:`enable` or by setting the environment
+variable ``WATER_MASSES_INSTRUMENT=1``. Each stage records
+
+- wall and CPU time,
+- the peak resident set size during the stage and its increase over the size
+  at the start of the stage, sampled every `SAMPLE_INTERVAL` seconds by a
+  background thread,
+- the number of dask tasks of the returned object,
+- the bytes of the (array like) arguments and of the result.
+
+Note that most stages are lazy when the data is dask backed, their times then
+cover the graph construction only and the compute shows up in the stage that
+writes or loads the data. Stages nest per thread, stages run on worker threads
+get the running stage of their own thread as parent. The resident set size is
+the one of the process, so stages running at the same time see each other's
+memory.
+
+"""
+
+import functools
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import (
+    Callable,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    TypedDict,
+    TypeVar,
+    Union,
+    cast,
+)
+
+# mypy 0.910 has no ParamSpec, "..." (an implicit Any) is the only spelling of
+# an arbitrary signature, the decorated functions keep their own signature.
+Function = Callable[..., object]  # type: ignore[misc]
+F = TypeVar("F", bound=Function)
+
+ENVIRONMENT_VARIABLE = "WATER_MASSES_INSTRUMENT"
+
+#: Seconds between two samples of the resident set size of running stages.
+SAMPLE_INTERVAL = 0.01
+
+
+class Record(TypedDict):
+    """Measurements of a finished stage."""
+
+    name: str
+    parent: Optional[str]
+    wall_time: float
+    cpu_time: float
+    peak_rss: Optional[int]
+    peak_rss_increase: Optional[int]
+    dask_tasks: int
+    bytes_in: int
+    bytes_out: int
+
+
+class Total(TypedDict):
+    """Sum of the top level stages."""
+
+    wall_time: float
+    cpu_time: float
+    peak_rss: Optional[int]
+
+
+class Report(TypedDict):
+    """Records of all stages and their total."""
+
+    stages: List[Record]
+    total: Total
+
+
+class _State(object):
+    """Module wide switch, collected records and stage stacks per thread."""
+
+    def __init__(self) -> None:
+        self.enabled: bool = os.environ.get(ENVIRONMENT_VARIABLE, "") not in {
+            "",
+            "0",
+        }
+        self.records: List[Record] = []
+        self.local = threading.local()
+
+    @property
+    def stack(self) -> List[str]:
+        """Names of the running stages of the calling thread."""
+        if not hasattr(self.local, "stack"):
+            self.local.stack = []
+        return self.local.stack
+
+
+class _Sampler(object):
+    """Background thread sampling the resident set size for running stages."""
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.stages: Set["Stage"] = set()
+        self.stop: Optional[threading.Event] = None
+
+    def add(self, stage: "Stage") -> None:
+        with self.lock:
+            self.stages.add(stage)
+            if self.stop is None:
+                self.stop = threading.Event()
+                threading.Thread(
+                    target=self._run,
+                    args=(self.stop,),
+                    name="water-masses-rss-sampler",
+                    daemon=True,
+                ).start()
+
+    def remove(self, stage: "Stage") -> None:
+        with self.lock:
+            self.stages.discard(stage)
+            if not self.stages and self.stop is not None:
+                self.stop.set()
+                self.stop = None
+
+    def _run(self, stop: threading.Event) -> None:
+        while not stop.wait(SAMPLE_INTERVAL):
+            rss = current_rss()
+            with self.lock:
+                for stage in self.stages:
+                    stage.observe(rss)
+
+
+_state = _State()
+_sampler = _Sampler()
+
+
+def enable() -> None:
+    """Start recording stages."""
+    _state.enabled = True
+
+
+def disable() -> None:
+    """Stop recording stages, the records are kept."""
+    _state.enabled = False
+
+
+def is_enabled() -> bool:
+    """Check if stages are recorded."""
+    return _state.enabled
+
+
+def reset() -> None:
+    """Drop all records."""
+    _state.records = []
+    _state.local = threading.local()
+
+
+@contextmanager
+def recording(enabled: bool = True) -> Iterator[None]:
+    """Switch recording on (or off) within a block.
+
+    The previous switch and records are restored afterwards, the records of
+    the block are dropped, so :func:`report` them within the block.
+
+    """
+    previous, records = _state.enabled, _state.records
+    _state.enabled, _state.records = enabled, []
+    try:
+        yield
+    finally:
+        _state.enabled, _state.records = previous, records
+
+
+def records() -> List[Record]:
+    """Records of all finished stages in the order they finished."""
+    return list(_state.records)
+
+
+def report(path: Optional[Union[str, Path]] = None) -> Report:
+    """Summarize the records and optionally write them as JSON to `path`.
+
+    The total `peak_rss` is the high-water mark over the lifetime of the
+    process, see :func:`peak_rss`.
+
+    """
+    top_level = [record for record in _state.records if record["parent"] is None]
+    summary: Report = {
+        "stages": records(),
+        "total": {
+            "wall_time": sum(record["wall_time"] for record in top_level),
+            "cpu_time": sum(record["cpu_time"] for record in top_level),
+            "peak_rss": peak_rss(),
+        },
+    }
+    if path is not None:
+        Path(path).write_text(json.dumps(summary, indent=2))
+    return summary
+
+
+class Stage(object):
+    """Measurements of a running stage."""
+
+    def __init__(self, name: str, inputs: object = ()) -> None:
+        """Start measuring."""
+        self.name = name
+        self.parent = _state.stack[-1] if _state.stack else None
+        self.bytes_in = nbytes(inputs)
+        self.output: object = None
+        self._rss = current_rss()
+        self._peak = self._rss
+        self._wall = time.perf_counter()
+        self._cpu = time.process_time()
+        _sampler.add(self)
+
+    def observe(self, rss: Optional[int]) -> None:
+        """Update the peak with a sample of the resident set size."""
+        if rss is not None and (self._peak is None or rss > self._peak):
+            self._peak = rss
+
+    def finish(self) -> Record:
+        """Stop measuring and store the record."""
+        wall_time = time.perf_counter() - self._wall
+        cpu_time = time.process_time() - self._cpu
+        _sampler.remove(self)
+        self.observe(current_rss())
+        increase = None
+        if self._peak is not None and self._rss is not None:
+            increase = self._peak - self._rss
+        record: Record = {
+            "name": self.name,
+            "parent": self.parent,
+            "wall_time": wall_time,
+            "cpu_time": cpu_time,
+            "peak_rss": self._peak,
+            "peak_rss_increase": increase,
+            "dask_tasks": dask_tasks(self.output),
+            "bytes_in": self.bytes_in,
+            "bytes_out": nbytes(self.output),
+        }
+        _state.records.append(record)
+        return record
+
+
+@contextmanager
+def stage(name: str, inputs: object = ()) -> Iterator[Optional[Stage]]:
+    """Record a stage of a run.
+
+    Yields ``None`` if instrumentation is disabled, otherwise the running
+    :class:`Stage`, assign its ``output`` to record dask tasks and bytes out.
+
+    """
+    if not _state.enabled:
+        yield None
+        return
+    current = Stage(name, inputs)
+    stack = _state.stack
+    stack.append(name)
+    try:
+        yield current
+    finally:
+        stack.pop()
+        current.finish()
+
+
+def instrumented(func: F) -> F:
+    """Record each call of `func` as stage if instrumentation is enabled."""
+    name = f"{func.__module__}.{func.__qualname__}"
+
+    @functools.wraps(func)
+    def wrapper(*args: object, **kwargs: object) -> object:
+        if not _state.enabled:
+            return func(*args, **kwargs)
+        with stage(name, inputs=(args, kwargs)) as current:
+            output = func(*args, **kwargs)
+            if current is not None:
+                current.output = output
+        return output
+
+    return cast(F, wrapper)
+
+
+def current_rss() -> Optional[int]:
+    """Resident set size of the process in bytes, with psutil if installed."""
+    return _rss_reader()()
+
+
+@functools.lru_cache(maxsize=None)
+def _rss_reader() -> Callable[[], Optional[int]]:
+    """Reader of the resident set size, psutil is looked up once."""
+    try:
+        import psutil
+    except ImportError:
+        return _statm_rss
+
+    def psutil_rss() -> Optional[int]:
+        return int(psutil.Process().memory_info().rss)
+
+    return psutil_rss
+
+
+def _statm_rss() -> Optional[int]:
+    try:
+        with open("/proc/self/statm") as statm:
+            pages = int(statm.read().split()[1])
+    except (OSError, ValueError, IndexError):  # pragma: no cover
+        return None
+    return pages * os.sysconf("SC_PAGE_SIZE")
+
+
+def peak_rss() -> Optional[int]:
+    """Peak resident set size over the lifetime of the process in bytes."""
+    try:
+        import resource
+    except ImportError:  # pragma: no cover
+        return None
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return maxrss if sys.platform == "darwin" else maxrss * 1024
+
+
+def nbytes(obj: object) -> int:
+    """Bytes held by arrays, data frames or (nested) containers of them."""
+    if isinstance(obj, dict):
+        return sum(nbytes(value) for value in obj.values())
+    if isinstance(obj, (list, tuple)):
+        return sum(nbytes(value) for value in obj)
+    memory_usage = getattr(obj, "memory_usage", None)
+    if callable(memory_usage):
+        usage = memory_usage(index=True)
+        return int(getattr(usage, "sum", lambda: usage)())
+    size = getattr(obj, "nbytes", 0)
+    return int(size) if isinstance(size, (int, float)) else 0
+
+
+def dask_tasks(obj: object) -> int:
+    """Number of tasks in the dask graph(s) of `obj`, 0 if not dask backed."""
+    if isinstance(obj, (list, tuple)):
+        return sum(dask_tasks(value) for value in obj)
+    graph = getattr(obj, "__dask_graph__", None)
+    if not callable(graph):
+        return 0
+    graph = graph()
+    return 0 if graph is None else len(graph)
@@ -1,21 +1,231 @@
 # -*- coding: utf-8 -*-
 """Principle Component Analysis."""
 
-from typing import Tuple
+from typing import TYPE_CHECKING, Iterator, Optional, Tuple, Union
 
 import numpy as np
 import xarray as xr
-import cf_xarray as cfxr  # noqa
-from eofs.xarray import Eof
 
 from .. import time_series  # noqa
+from ..instrument import instrumented
 
+if TYPE_CHECKING:  # pragma: no cover
+    from eofs.xarray import Eof
 
-def lat_weighted_eof(da: xr.DataArray, nmodes: int = 10) -> Tuple[Eof, xr.DataArray]:
-    """Calculate PCs and eof solver."""
-    coslat = np.cos(np.deg2rad(da.cf.coords["latitude"].values)).clip(0.0, 1.0)
-    wgts = np.sqrt(coslat)[..., np.newaxis]
-    solver = Eof(da, weights=wgts)
+    from ..grid import Grid
+
+#: Target size in bytes of a spatial block of the out-of-core EOF analysis.
+BLOCK_BYTES = 1 << 28
+
+
+@instrumented
+def lat_weighted_eof(
+    da: xr.DataArray,
+    nmodes: int = 10,
+    out_of_core: bool = False,
+    spatial_chunk: Optional[int] = None,
+    grid: Optional["Grid"] = None,
+) -> Tuple[Union["Eof", "GramEof"], xr.DataArray]:
+    """Calculate PCs and eof solver.
+
+    With `out_of_core` the field is never loaded as a whole, see :class:`GramEof`.
+    The weights are taken from `grid`, defaults to the cached grid of `da`, see
+    :class:`water_masses.grid.Grid`.
+
+    """
+    wgts = _coslat_weights(da, grid)
+    if out_of_core:
+        solver: Union["Eof", "GramEof"] = GramEof(
+            da, weights=wgts, spatial_chunk=spatial_chunk
+        )
+    else:
+        from eofs.xarray import Eof
+
+        solver = Eof(da, weights=wgts)
     eof: xr.DataArray = solver.eofsAsCorrelation(neofs=nmodes)
 
     return solver, eof
+
+
+def _coslat_weights(da: xr.DataArray, grid: Optional["Grid"] = None) -> np.ndarray:
+    """Square root of cos(latitude), broadcastable to (latitude, longitude)."""
+    from ..grid import get_grid
+
+    return get_grid(da, grid).coslat_weights
+
+
+class GramEof(object):
+    """EOF solver for fields that do not fit into memory.
+
+    For time much shorter than space, the EOF analysis is done on the small
+    time x time Gram matrix of the (weighted) anomalies, which is accumulated
+    block by block along the first spatial dimension. The spatial patterns are
+    reconstructed in a second pass over the blocks. Dask backed fields are thus
+    loaded one block at a time.
+
+    The interface follows ``eofs.xarray.Eof``: time is the first dimension,
+    points with missing values at any time are excluded.
+
+    """
+
+    def __init__(
+        self,
+        da: xr.DataArray,
+        weights: Optional[np.ndarray] = None,
+        center: bool = True,
+        ddof: int = 1,
+        spatial_chunk: Optional[int] = None,
+    ) -> None:
+        """Accumulate the Gram matrix and solve the eigenvalue problem.
+
+        Parameter
+        =========
+        da : xr.DataArray
+            Field with time as first dimension.
+        weights : np.ndarray
+            Weights broadcastable to the spatial dimensions.
+        center : bool
+            Remove the time mean.
+        ddof : int
+            Delta degrees of freedom of the eigenvalues (variances).
+        spatial_chunk : int
+            Size of the blocks along the first spatial dimension, defaults to the
+            dask chunks or blocks of about `BLOCK_BYTES`.
+
+        """
+        self.da = da
+        self.time_dim, self.block_dim = da.dims[:2]
+        self.weights = (
+            np.ones(da.shape[1:])
+            if weights is None
+            else np.broadcast_to(weights, da.shape[1:])
+        )
+        self.center = center
+        self.ddof = ddof
+        self.spatial_chunk = spatial_chunk or _default_chunk(da)
+
+        ntime = da.shape[0]
+        gram = np.zeros((ntime, ntime))
+        total_variance = 0.0
+        for _, _, anomalies, weights in self._blocks():
+            weighted = anomalies * weights
+            gram += weighted @ weighted.T
+            total_variance += np.sum(weighted ** 2)
+        eigenvalues, vectors = np.linalg.eigh(gram)
+        order = np.argsort(eigenvalues)[::-1]
+        # at most ntime - 1 modes with a removed mean
+        rank = ntime - 1 if center else ntime
+        self._squares = np.clip(eigenvalues[order][:rank], 0, None)
+        self._vectors = vectors[:, order][:, :rank]
+        self._total_variance = total_variance
+
+    def _blocks(self) -> Iterator[Tuple[slice, np.ndarray, np.ndarray, np.ndarray]]:
+        """Index, valid points, anomalies (time, point) and weights of the blocks."""
+        nblock = self.da.shape[1]
+        for start in range(0, nblock, self.spatial_chunk):
+            index = slice(start, min(start + self.spatial_chunk, nblock))
+            values = np.asarray(
+                self.da.isel({self.block_dim: index}).values, dtype=np.float64
+            )
+            values = values.reshape(values.shape[0], -1)
+            weights = self.weights[index].reshape(-1)
+            valid = ~np.isnan(values).any(axis=0)
+            values = values[:, valid]
+            if self.center:
+                values -= values.mean(axis=0)
+            yield index, valid, values, weights[valid]
+
+    def _modes(self, n: Optional[int]) -> int:
+        return len(self._squares) if n is None else min(n, len(self._squares))
+
+    def _mode_coord(self, n: int) -> xr.DataArray:
+        return xr.DataArray(np.arange(n), dims="mode", name="mode")
+
+    def eigenvalues(self, neigs: Optional[int] = None) -> xr.DataArray:
+        """Variances of the modes."""
+        n = self._modes(neigs)
+        return xr.DataArray(
+            self._squares[:n] / (self.da.shape[0] - self.ddof),
+            coords={"mode": self._mode_coord(n)},
+            dims="mode",
+            name="eigenvalues",
+        )
+
+    def varianceFraction(  # noqa: N802
+        self, neigs: Optional[int] = None
+    ) -> xr.DataArray:
+        """Fraction of the total variance explained by the modes."""
+        n = self._modes(neigs)
+        return xr.DataArray(
+            self._squares[:n] / self._total_variance,
+            coords={"mode": self._mode_coord(n)},
+            dims="mode",
+            name="variance_fractions",
+        )
+
+    def pcs(self, pcscaling: int = 0, npcs: Optional[int] = None) -> xr.DataArray:
+        """Principal components.
+
+        Unscaled (0), scaled to unit variance (1) or multiplied by the square root
+        of the eigenvalue (2).
+
+        """
+        n = self._modes(npcs)
+        pcs = self._vectors[:, :n]
+        if pcscaling == 0:
+            pcs = pcs * np.sqrt(self._squares[:n])
+        elif pcscaling == 2:
+            pcs = pcs * self._squares[:n] / np.sqrt(self.da.shape[0] - self.ddof)
+        elif pcscaling == 1:
+            pcs = pcs * np.sqrt(self.da.shape[0] - self.ddof)
+        else:
+            raise ValueError("pcscaling must be 0, 1 or 2.")
+        return xr.DataArray(
+            pcs,
+            coords={
+                self.time_dim: self.da[self.time_dim],
+                "mode": self._mode_coord(n),
+            },
+            dims=(self.time_dim, "mode"),
+            name="pcs",
+        )
+
+    def eofsAsCorrelation(  # noqa: N802
+        self, neofs: Optional[int] = None
+    ) -> xr.DataArray:
+        """Correlation between the PCs and the (unweighted) field at each point."""
+        n = self._modes(neofs)
+        pcs = self._vectors[:, :n]
+        pcs = pcs - pcs.mean(axis=0)
+        pcs /= np.linalg.norm(pcs, axis=0)
+        spatial_shape = self.da.shape[1:]
+        patterns = np.full((n, *spatial_shape), np.nan)
+        for index, valid, anomalies, _ in self._blocks():
+            block = np.full((n, index.stop - index.start, *spatial_shape[1:]), np.nan)
+            flat = block.reshape(n, -1)
+            centered = anomalies - anomalies.mean(axis=0)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                flat[:, valid] = (pcs.T @ centered) / np.linalg.norm(centered, axis=0)
+            patterns[:, index] = flat.reshape(block.shape)
+        spatial_dims = self.da.dims[1:]
+        return xr.DataArray(
+            patterns,
+            coords={
+                "mode": self._mode_coord(n),
+                **{
+                    name: coord
+                    for name, coord in self.da.coords.items()
+                    if set(coord.dims) <= set(spatial_dims)
+                },
+            },
+            dims=("mode", *spatial_dims),
+            name="eofs",
+        )
+
+
+def _default_chunk(da: xr.DataArray) -> int:
+    """Block size along the first spatial dimension."""
+    if da.chunks is not None:
+        return int(max(da.chunks[1]))
+    row = np.prod(da.shape) // max(da.shape[1], 1) * 8
+    return int(max(1, BLOCK_BYTES // max(row, 1)))
@@ -0,0 +1,555 @@
+# -*- coding: utf-8 -*-
+"""Declarative processing pipelines with checkpoints.
+
+A pipeline is a DAG of tasks, each applying an operation (see
+:data:`OPERATIONS`) to the outputs of its input tasks::
+
+    directory: $HOME/data/output/water-masses/run
+    workers: 4
+    precision: float32
+    tasks:
+      sss: {op: open_sss, params: {source: daily_mean, manifest: true}}
+      noleap: {op: rm_leap, inputs: [sss]}
+      detrended: {op: detrend, inputs: [noleap]}
+      climatology:
+        op: climatology
+        inputs: [detrended]
+        params: {by: dayofyear, func: quantile, q: 0.9}
+      anomalies: {op: anomalies, inputs: [detrended, climatology]}
+
+Run it with ``water-masses config.yml`` (or ``python -m
+water_masses.pipeline``). The output of each checkpointed task is written to
+``<directory>/<task>.nc`` together with the fingerprint of its operation,
+parameters, inputs and the package version. A rerun loads the outputs with a
+matching fingerprint instead of computing them, so an interrupted run resumes
+with the unfinished tasks. Tasks without checkpoint (by default opening and
+leap day removal, which are cheap and lazy) are evaluated only if a task
+depending on them has to run. Independent tasks run in parallel on a thread
+pool, their checkpoint writes and the manifest reads of
+:mod:`water_masses.catalog` share xarray's netCDF4 lock.
+
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from hashlib import sha1
+from pathlib import Path
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Mapping,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+    Union,
+)
+
+import numpy as np
+import xarray as xr
+
+from . import filtering, grouped, precision, processing, time_series
+from .version import pkg_version
+
+logger = logging.getLogger(__name__)
+
+Output = Union[xr.DataArray, xr.Dataset]
+
+#: Operations by name, with their function and default checkpointing.
+OPERATIONS: Dict[str, Tuple[Callable[..., Output], bool]] = {}
+
+
+def register(
+    name: str, checkpoint: bool = True
+) -> Callable[[Callable[..., Output]], Callable[..., Output]]:
+    """Register a function ``func(*inputs, **params)`` as operation."""
+
+    def decorator(func: Callable[..., Output]) -> Callable[..., Output]:
+        OPERATIONS[name] = (func, checkpoint)
+        return func
+
+    return decorator
+
+
+class Task(object):
+    """Operation applied to the outputs of other tasks."""
+
+    def __init__(
+        self,
+        name: str,
+        op: str,
+        inputs: Sequence[str] = (),
+        params: Optional[Mapping[str, Any]] = None,
+        checkpoint: Optional[bool] = None,
+    ) -> None:
+        """Look up the operation."""
+        if op not in OPERATIONS:
+            raise KeyError(f"Unknown operation {op} of task {name}.")
+        self.name = name
+        self.op = op
+        self.inputs = list(inputs)
+        self.params = dict(params or {})
+        self.func, default = OPERATIONS[op]
+        self.checkpoint = default if checkpoint is None else checkpoint
+
+
+class Pipeline(object):
+    """DAG of tasks with checkpoints in `directory`.
+
+    Parameter
+    =========
+    tasks : dict
+        Tasks by name.
+    directory : Path
+        Directory of the checkpoints.
+    workers : int
+        Number of tasks run at once.
+    dtype : str
+        Precision policy of the run, see :mod:`water_masses.precision`, the
+        current policy if not given. The previous policy is restored after
+        the run.
+
+    """
+
+    def __init__(
+        self,
+        tasks: Mapping[str, Task],
+        directory: Union[str, Path],
+        workers: int = 1,
+        dtype: Optional[str] = None,
+    ) -> None:
+        """Check the DAG."""
+        self.tasks = dict(tasks)
+        self.directory = Path(directory)
+        self.workers = workers
+        self.dtype = dtype
+        self.order = self._topological_order()
+
+    @classmethod
+    def from_config(
+        cls, config: Mapping[str, Any], base: Optional[Path] = None
+    ) -> "Pipeline":
+        """Pipeline of a config, relative directories are relative to `base`."""
+        directory = Path(os.path.expandvars(str(config["directory"]))).expanduser()
+        if base is not None:
+            directory = Path(base).joinpath(directory)
+        tasks = {
+            name: Task(name, **(spec or {})) for name, spec in config["tasks"].items()
+        }
+        return cls(
+            tasks,
+            directory,
+            workers=config.get("workers", 1),
+            dtype=config.get("precision"),
+        )
+
+    @classmethod
+    def from_file(cls, path: Union[str, Path]) -> "Pipeline":
+        """Pipeline of a YAML or JSON config file."""
+        path = Path(path)
+        with open(path) as file:
+            if path.suffix == ".json":
+                config = json.load(file)
+            else:
+                import yaml
+
+                config = yaml.safe_load(file)
+        return cls.from_config(config, base=path.parent)
+
+    def _topological_order(self) -> List[str]:
+        order: List[str] = []
+        state: Dict[str, str] = {}
+        for name in self.tasks:
+            self._visit(name, state, order)
+        return order
+
+    def _visit(self, name: str, state: Dict[str, str], order: List[str]) -> None:
+        """Append `name` to `order` after its inputs (depth first)."""
+        if state.get(name) == "done":
+            return
+        if state.get(name) == "visiting":
+            raise ValueError(f"The tasks have a cycle through {name}.")
+        state[name] = "visiting"
+        for dependency in self._inputs(name):
+            self._visit(dependency, state, order)
+        state[name] = "done"
+        order.append(name)
+
+    def _inputs(self, name: str) -> List[str]:
+        """Inputs of task `name`, checked to be tasks."""
+        for dependency in self.tasks[name].inputs:
+            if dependency not in self.tasks:
+                raise KeyError(f"Unknown input {dependency} of task {name}.")
+        return self.tasks[name].inputs
+
+    def fingerprints(self) -> Dict[str, str]:
+        """Hash of operation, parameters, precision, version and inputs."""
+        fingerprints: Dict[str, str] = {}
+        for name in self.order:
+            task = self.tasks[name]
+            content = {
+                "op": task.op,
+                "params": task.params,
+                "precision": self.dtype,
+                "version": pkg_version,
+                "inputs": [fingerprints[dependency] for dependency in task.inputs],
+            }
+            fingerprints[name] = sha1(
+                json.dumps(content, sort_keys=True, default=str).encode()
+            ).hexdigest()
+        return fingerprints
+
+    def descendants(self, names: Iterable[str]) -> Set[str]:
+        """Tasks depending (indirectly) on `names`, including `names`."""
+        result = set(names)
+        for name in self.order:
+            if result.intersection(self.tasks[name].inputs):
+                result.add(name)
+        return result
+
+    def plan(
+        self, targets: Optional[Iterable[str]] = None, rerun: Iterable[str] = ()
+    ) -> Dict[str, str]:
+        """Action of each task needed for `targets`.
+
+        `targets` default to all checkpointed tasks and the tasks no other
+        task depends on. Returns ``"load"`` for valid checkpoints, else
+        ``"run"``, in topological order.
+
+        """
+        fingerprints = self.fingerprints()
+        stale = self.descendants(rerun)
+        actions: Dict[str, str] = {}
+        pending = list(self._default_targets() if targets is None else targets)
+        while pending:
+            name = pending.pop()
+            if name in actions:
+                continue
+            if name not in stale and self._is_current(name, fingerprints[name]):
+                actions[name] = "load"
+            else:
+                actions[name] = "run"
+                pending.extend(self.tasks[name].inputs)
+        return {name: actions[name] for name in self.order if name in actions}
+
+    def _default_targets(self) -> List[str]:
+        """Checkpointed tasks and tasks no other task depends on."""
+        used = {dep for task in self.tasks.values() for dep in task.inputs}
+        return [
+            name
+            for name in self.order
+            if self.tasks[name].checkpoint or name not in used
+        ]
+
+    def _is_current(self, name: str, fingerprint: str) -> bool:
+        """Whether task `name` has a checkpoint with `fingerprint`."""
+        return bool(
+            self.tasks[name].checkpoint
+            and self._state(name).get("fingerprint") == fingerprint
+            and self._path(name).exists()
+        )
+
+    def run(
+        self, targets: Optional[Iterable[str]] = None, rerun: Iterable[str] = ()
+    ) -> Dict[str, Output]:
+        """Run the tasks needed for `targets`.
+
+        Parameter
+        =========
+        targets : iterable of str
+            Tasks whose outputs are needed, see :meth:`plan`.
+        rerun : iterable of str
+            Tasks run (with their descendants) despite valid checkpoints.
+
+        Returns
+        =======
+        dict
+            Outputs of the planned tasks, checkpointed ones loaded lazily.
+
+        """
+        with precision.policy(self.dtype or precision.get_policy()):
+            return self._run(targets, rerun)
+
+    def _run(
+        self, targets: Optional[Iterable[str]], rerun: Iterable[str]
+    ) -> Dict[str, Output]:
+        fingerprints = self.fingerprints()
+        actions = self.plan(targets, rerun)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        outputs: Dict[str, Output] = {}
+        running: Dict[Future, str] = {}
+        waiting = list(actions)
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            while waiting or running:
+                ready = self._ready(waiting, actions, outputs)
+                for name in ready:
+                    waiting.remove(name)
+                    if actions[name] == "load":
+                        outputs[name] = self._load(name)
+                    else:
+                        self._submit(pool, name, fingerprints[name], outputs, running)
+                if not ready:
+                    _collect(running, outputs)
+        return outputs
+
+    def _ready(
+        self, waiting: List[str], actions: Dict[str, str], outputs: Dict[str, Output]
+    ) -> List[str]:
+        """Waiting tasks to load or whose inputs are available."""
+        return [
+            name
+            for name in waiting
+            if actions[name] == "load"
+            or all(dep in outputs for dep in self.tasks[name].inputs)
+        ]
+
+    def _submit(
+        self,
+        pool: ThreadPoolExecutor,
+        name: str,
+        fingerprint: str,
+        outputs: Dict[str, Output],
+        running: Dict[Future, str],
+    ) -> None:
+        """Run a checkpointed task on `pool`, evaluate others right away."""
+        task = self.tasks[name]
+        inputs = [outputs[dep] for dep in task.inputs]
+        if not task.checkpoint:
+            outputs[name] = task.func(*inputs, **task.params)
+            return
+        logger.info("Running %s", name)
+        running[pool.submit(self._execute, task, inputs, fingerprint)] = name
+
+    def _path(self, name: str) -> Path:
+        return self.directory.joinpath(f"{name}.nc")
+
+    def _state_path(self, name: str) -> Path:
+        return self.directory.joinpath(f"{name}.json")
+
+    def _state(self, name: str) -> Dict[str, Any]:
+        path = self._state_path(name)
+        if not path.exists():
+            return {}
+        return json.loads(path.read_text())
+
+    def _execute(self, task: Task, inputs: List[Output], fingerprint: str) -> Output:
+        """Compute and checkpoint the output, then load it lazily."""
+        output = task.func(*inputs, **task.params)
+        path = self._path(task.name)
+        partial = path.with_suffix(".partial")
+        _without_encoding(output).to_netcdf(partial)
+        os.replace(partial, path)
+        state = {
+            "fingerprint": fingerprint,
+            "kind": type(output).__name__,
+            "op": task.op,
+        }
+        state_path = self._state_path(task.name)
+        partial = state_path.with_suffix(".json.partial")
+        partial.write_text(json.dumps(state))
+        os.replace(partial, state_path)
+        return self._load(task.name)
+
+    def _load(self, name: str) -> Output:
+        if self._state(name)["kind"] == "DataArray":
+            return xr.open_dataarray(self._path(name), chunks={})
+        return xr.open_dataset(self._path(name), chunks={})
+
+
+def _collect(running: Dict[Future, str], outputs: Dict[str, Output]) -> None:
+    """Wait for a running task, cancel the others if it failed."""
+    done, _ = wait(running, return_when=FIRST_COMPLETED)
+    for future in done:
+        name = running.pop(future)
+        try:
+            outputs[name] = future.result()
+        except BaseException:
+            for other in running:
+                other.cancel()
+            raise
+        logger.info("Finished %s", name)
+
+
+def _without_encoding(output: Output) -> Output:
+    """Copy without the encoding of loaded inputs (chunk sizes, packing)."""
+    output = output.copy()
+    variables = (
+        output.variables.values()
+        if isinstance(output, xr.Dataset)
+        else [output.variable, *(coord.variable for coord in output.coords.values())]
+    )
+    for variable in variables:
+        variable.encoding = {}
+    return output
+
+
+def _slices(selection: Optional[Mapping[str, Any]]) -> Optional[Dict[str, Any]]:
+    """Pairs (config lists) as slices."""
+    if selection is None:
+        return None
+    return {
+        dim: slice(*value) if isinstance(value, (list, tuple)) else value
+        for dim, value in selection.items()
+    }
+
+
+@register("open_sss", checkpoint=False)
+def _open_sss(
+    variable: str = "salinity",
+    region: Optional[Mapping[str, Sequence[float]]] = None,
+    time: Optional[Sequence[str]] = None,
+    **params: Any,
+) -> xr.DataArray:
+    """Open SSS, see :func:`water_masses.processing.open_sss`."""
+    return processing.open_sss(
+        region=_slices(region),
+        time=None if time is None else slice(*time),
+        **params,
+    )[variable]
+
+
+@register("rm_leap", checkpoint=False)
+def _rm_leap(da: xr.DataArray) -> xr.DataArray:
+    return processing.rm_leap(da)
+
+
+@register("detrend")
+def _detrend(
+    da: xr.DataArray, dim: str = "time", deg: int = 1, method: str = "fused"
+) -> xr.DataArray:
+    return time_series.detrend(da.chunk({dim: -1}), dim, deg=deg, method=method)
+
+
+@register("climatology")
+def _climatology(
+    da: xr.DataArray,
+    by: str = "dayofyear",
+    func: str = "mean",
+    q: Optional[float] = None,
+) -> xr.DataArray:
+    return grouped.reduce(da, by, func=func, q=q)
+
+
+@register("anomalies")
+def _anomalies(
+    da: xr.DataArray, reduced: xr.DataArray, by: str = "dayofyear"
+) -> xr.DataArray:
+    return grouped.anomalies(da, by, reduced=reduced)
+
+
+@register("resample_monthly")
+def _resample_monthly(
+    da: xr.DataArray, func: str = "mean", q: Optional[float] = None
+) -> xr.DataArray:
+    return grouped.resample_monthly(da, func=func, q=q).transpose(*da.dims)
+
+
+@register("lowpass")
+def _lowpass(da: xr.DataArray, **params: Any) -> xr.DataArray:
+    return filtering.lowpass(da.chunk({"time": -1}), **params)
+
+
+@register("bandstop")
+def _bandstop(da: xr.DataArray, **params: Any) -> xr.DataArray:
+    return filtering.bandstop(da.chunk({"time": -1}), **params)
+
+
+@register("eof")
+def _eof(da: xr.DataArray, nmodes: int = 10, out_of_core: bool = False) -> xr.Dataset:
+    """EOFs as correlation, scaled PCs and variance fractions."""
+    from .origin.pca import lat_weighted_eof
+
+    solver, eofs = lat_weighted_eof(
+        da.transpose("time", ...), nmodes=nmodes, out_of_core=out_of_core
+    )
+    return xr.Dataset(
+        {
+            "eofs": eofs,
+            "pcs": solver.pcs(pcscaling=1, npcs=nmodes),
+            "variance_fraction": solver.varianceFraction(neigs=nmodes),
+        }
+    )
+
+
+@register("select", checkpoint=False)
+def _select(
+    obj: Output,
+    variable: Optional[str] = None,
+    sel: Optional[Mapping[str, Any]] = None,
+    isel: Optional[Mapping[str, Any]] = None,
+) -> Output:
+    """Variable of a Dataset and selection by labels or positions."""
+    if variable is not None:
+        obj = obj[variable]
+    return obj.sel(_slices(sel) or {}).isel(_slices(isel) or {})
+
+
+@register("composite")
+def _composite(
+    field: xr.DataArray, index: xr.DataArray, threshold: float = 1.0
+) -> xr.Dataset:
+    """Mean field of the times of high and low standardized `index`."""
+    index = index.reset_coords(drop=True)
+    standardized = (index - index.mean("time")) / index.std("time")
+    field, standardized = xr.align(field, standardized)
+    high, low = standardized > threshold, standardized < -threshold
+    positive = field.where(high).mean("time")
+    negative = field.where(low).mean("time")
+    return xr.Dataset(
+        {
+            "positive": positive,
+            "negative": negative,
+            "difference": positive - negative,
+            "count": xr.DataArray([int(high.sum()), int(low.sum())], dims="phase"),
+        },
+        coords={"phase": np.array(["positive", "negative"])},
+        attrs={"threshold": threshold},
+    )
+
+
+def cli(argv: Optional[Sequence[str]] = None) -> int:
+    """Run a pipeline config from the command line."""
+    parser = argparse.ArgumentParser(
+        prog="water-masses", description="Run a processing pipeline."
+    )
+    parser.add_argument("config", type=Path, help="YAML or JSON pipeline config")
+    parser.add_argument("--workers", type=int, help="tasks run at once")
+    parser.add_argument(
+        "--target",
+        action="append",
+        metavar="TASK",
+        help="run only what TASK needs (repeatable)",
+    )
+    parser.add_argument(
+        "--rerun",
+        action="append",
+        default=[],
+        metavar="TASK",
+        help="ignore the checkpoints of TASK and its descendants (repeatable)",
+    )
+    parser.add_argument(
+        "--dry-run", action="store_true", help="print the plan and exit"
+    )
+    args = parser.parse_args(argv)
+
+    pipeline = Pipeline.from_file(args.config)
+    if args.workers is not None:
+        pipeline.workers = args.workers
+    if args.dry_run:
+        for name, action in pipeline.plan(args.target, args.rerun).items():
+            print(f"{action:4} {name}")
+        return 0
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+    pipeline.run(args.target, args.rerun)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(cli())
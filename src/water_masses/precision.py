@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""Precision policy of the fields processed.
+
+Fields are kept in the floating point type of the policy, ``float64`` by
+default. With ``float32`` the fields take half the memory and bandwidth on
+every pass. Set it per run with :func:`set_policy`, temporarily with
+:func:`policy` or by setting the environment variable
+``WATER_MASSES_PRECISION=float32``.
+
+The policy is applied where fields enter the pipeline (see
+:func:`as_field`), all stages keep the floating point type of their input.
+Accumulators of reductions and least squares solves are always
+:data:`ACCUMULATOR` (``float64``), only their results are cast back.
+
+"""
+
+import os
+from contextlib import contextmanager
+from typing import Iterator, TypeVar
+
+import numpy as np
+import xarray as xr
+
+T = TypeVar("T", np.ndarray, xr.DataArray, xr.Dataset)
+
+ENVIRONMENT_VARIABLE = "WATER_MASSES_PRECISION"
+
+POLICIES = {"float64": np.dtype(np.float64), "float32": np.dtype(np.float32)}
+
+#: Floating point type of sums, counts and least squares solves.
+ACCUMULATOR = np.dtype(np.float64)
+
+
+def _dtype(name: str) -> np.dtype:
+    if name not in POLICIES:
+        raise ValueError(f"policy must be one of {', '.join(POLICIES)}.")
+    return POLICIES[name]
+
+
+class _State(object):
+    """Module wide policy."""
+
+    def __init__(self) -> None:
+        self.dtype = _dtype(os.environ.get(ENVIRONMENT_VARIABLE) or "float64")
+
+
+_state = _State()
+
+
+def set_policy(name: str) -> None:
+    """Keep fields in `float64` or `float32`."""
+    _state.dtype = _dtype(name)
+
+
+def get_policy() -> str:
+    """Name of the current policy."""
+    return _state.dtype.name
+
+
+def field_dtype() -> np.dtype:
+    """Floating point type of the fields."""
+    return _state.dtype
+
+
+@contextmanager
+def policy(name: str) -> Iterator[None]:
+    """Use a policy within a block."""
+    previous = _state.dtype
+    _state.dtype = _dtype(name)
+    try:
+        yield
+    finally:
+        _state.dtype = previous
+
+
+def as_field(obj: T) -> T:
+    """Cast floating point data (not coordinates) to :func:`field_dtype`.
+
+    Casts of dask backed data are lazy.
+
+    """
+    if isinstance(obj, xr.Dataset):
+        return obj.assign(
+            {
+                name: as_field(variable)
+                for name, variable in obj.data_vars.items()
+                if np.issubdtype(variable.dtype, np.floating)
+            }
+        )
+    if not np.issubdtype(obj.dtype, np.floating) or obj.dtype == _state.dtype:
+        return obj
+    return obj.astype(_state.dtype)
+
+
+def result_dtype(dtype: np.dtype) -> np.dtype:
+    """Floating point type of results computed from data of `dtype`.
+
+    Floating point data keeps its type, other data gives :data:`ACCUMULATOR`.
+
+    """
+    dtype = np.dtype(dtype)
+    return dtype if np.issubdtype(dtype, np.floating) else ACCUMULATOR
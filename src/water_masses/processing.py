@@ -1,33 +1,93 @@
 # -*- coding: utf-8 -*-
 
-from datetime import timedelta
+from functools import partial
 from pathlib import Path
-from typing import Optional
+from typing import Any, Dict, Mapping, Optional, Union
 
-import intake
 import numpy as np
 import pandas as pd
 import xarray as xr
-from cftime import DatetimeNoLeap
-from statsmodels import api as sm
 
+from . import grouped, instrument, precision, time_series
+from .constants import Timespan, noleap_dates
+from .instrument import instrumented
 
+
+@instrumented
 def open_sss(
     catalog: str = "copernicus-reanalysis.yml",
     source: str = "daily_mean",
+    manifest: bool = False,
+    region: Optional[Mapping[str, slice]] = None,
+    stride: Union[None, int, Mapping[str, int]] = None,
+    depth: Optional[float] = 0.0,
+    time: Optional[slice] = None,
 ) -> xr.Dataset:
-    """Open dataset using Intake."""
+    """Open dataset using Intake.
+
+    With `manifest` the files are opened from the persisted metadata manifest
+    of the source instead of reading the metadata of every file, see
+    :func:`water_masses.catalog.open_source`, and the subset is pushed into
+    the reads: only the selected hyperslabs of the files within `time` are
+    read. Otherwise the region, depth and spatial stride are selected from
+    each file before the files are combined, `time` and a stride along time
+    after combining (the metadata of all files is read in either case). The
+    fields are cast to the precision policy, see :mod:`water_masses.precision`.
+
+    Parameter
+    =========
+    region : dict
+        Label slices per dimension, e.g. ``{"latitude": slice(50, 60)}``.
+    stride : int or dict
+        Steps per dimension after the selection, an int applies to latitude
+        and longitude.
+    depth : float
+        Depth level, all levels if None.
+    time : slice
+        Time range, inclusive.
+
+    """
     rename_dict = {"so": "salinity"}
-    sal = (
-        intake.open_catalog(str(Path(__file__).parent.joinpath("data", catalog)))[
-            source
-        ]
-        .to_dask()
-        .chunk({"time": -1})
-        .rename(rename_dict)
-    )
+    sel: Dict[str, Any] = dict(region or {})
+    if depth is not None:
+        sel["depth"] = depth
+    if time is not None:
+        sel["time"] = time
+    if isinstance(stride, int):
+        stride = {"latitude": stride, "longitude": stride}
+    if manifest:
+        from .catalog import open_source
+
+        sal = open_source(source, catalog, sel=sel, stride=stride)
+    else:
+        import intake
+
+        entry = intake.open_catalog(
+            str(Path(__file__).parent.joinpath("data", catalog))
+        )[source]
+        per_file = partial(
+            _subset,
+            sel={dim: label for dim, label in sel.items() if dim != "time"},
+            stride={dim: step for dim, step in (stride or {}).items() if dim != "time"},
+        )
+        sal = _subset(
+            entry(
+                xarray_kwargs={**entry.xarray_kwargs, "preprocess": per_file}
+            ).to_dask(),
+            sel={"time": time} if time is not None else {},
+            stride={"time": stride["time"]} if stride and "time" in stride else {},
+        )
+
+    return precision.as_field(sal.chunk({"time": -1}).rename(rename_dict))
+
 
-    return sal.sel(depth=0)
+def _subset(
+    ds: xr.Dataset, sel: Mapping[str, Any], stride: Mapping[str, int]
+) -> xr.Dataset:
+    """Label based selection followed by steps per dimension."""
+    return ds.sel(sel).isel(
+        {dim: slice(None, None, step) for dim, step in stride.items()}
+    )
 
 
 class MetaData(object):
@@ -49,6 +109,7 @@ class MetaData(object):
         self.quantile = quantile
 
 
+@instrumented
 def ref_series(
     da: xr.DataArray,
     md: MetaData,
@@ -80,6 +141,8 @@ class RemoveTrend(object):
     @staticmethod
     def _domain_wide(data: np.ndarray, averaging_method: str, quantile: float):
         """Find trend."""
+        from statsmodels import api as sm
+
         shape = data.shape
 
         data = getattr(
@@ -93,33 +156,23 @@ class RemoveTrend(object):
 
         return fit.params.x1 * index + fit.params.const
 
+    @instrumented
     def domain_wide(self):
         """Remove global trend from data."""
-        return self.data - xr.DataArray(
-            self._domain_wide(self.data.values, self.averaging_method, self.quantile),
-            [("time", self.data.time.values)],
+        return (
+            self.data
+            - xr.DataArray(
+                self._domain_wide(
+                    self.data.values, self.averaging_method, self.quantile
+                ),
+                [("time", self.data.time.values)],
+            ).astype(precision.result_dtype(self.data.dtype))
         )
 
-    @staticmethod
-    def _point_wise(data: xr.DataArray) -> np.ndarray:
-        """Remove trend from 1D time series."""
-        index = np.arange(len(data)) / len(data)
-        model = sm.OLS(np.asarray(data), sm.add_constant(index))
-        fit = model.fit()
-        trend = fit.params[1] * index + fit.params[0]
-
-        return data - trend
-
+    @instrumented
     def point_wise(self):
         """Calculate and remove temporal trends for each point in space."""
-        return xr.apply_ufunc(
-            self._point_wise,
-            self.data,
-            input_core_dims=[["time"]],
-            output_core_dims=[["time"]],
-            dask="parallelized",
-            vectorize=True,
-        )
+        return time_series.detrend(self.data, "time", method="fused")
 
 
 class Climatology(object):
@@ -127,8 +180,9 @@ class Climatology(object):
 
     @staticmethod
     def _climatology(da: xr.DataArray, md: MetaData, **kwargs) -> xr.DataArray:
+        """Mean (accumulated in float64) or quantile as field of the policy."""
         if md.averaging_method == "mean":
-            da = getattr(da, md.averaging_method)(**kwargs)
+            da = da.mean(dtype=precision.ACCUMULATOR, **kwargs)
         elif md.averaging_method == "quantile":
             da = getattr(da, md.averaging_method)(
                 md.quantile,
@@ -139,9 +193,10 @@ class Climatology(object):
                 "Only functions mean and quantile are implemented for "
                 "climatology calculation.",
             )
-        return da
+        return precision.as_field(da)
 
     @classmethod
+    @instrumented
     def domain_wide(
         cls,
         dda_grouped: xr.DataArray,
@@ -155,8 +210,26 @@ class Climatology(object):
         )
 
     @classmethod
+    @instrumented
     def point_wise(cls, dda_grouped: xr.DataArray, meta_data: MetaData) -> xr.DataArray:
-        """Calculate climatology for each horizontal point."""
+        """Calculate climatology for each horizontal point.
+
+        Data not grouped yet is reduced by day of year with a single grouped
+        reduction per chunk, see :func:`water_masses.grouped.reduce`.
+
+        """
+        if isinstance(dda_grouped, xr.DataArray):
+            if meta_data.averaging_method not in {"mean", "quantile"}:
+                raise NotImplementedError(
+                    "Only functions mean and quantile are implemented for "
+                    "climatology calculation.",
+                )
+            return grouped.reduce(
+                dda_grouped,
+                "dayofyear",
+                func=meta_data.averaging_method,
+                q=meta_data.quantile,
+            )
         return cls._climatology(
             dda_grouped,
             meta_data,
@@ -164,6 +237,7 @@ class Climatology(object):
         )
 
 
+@instrumented
 def rm_leap(data: xr.DataArray) -> xr.DataArray:
     """Remove lear days and replace time axis with cftime.DatetimeNoLeap."""
     february = 2
@@ -171,17 +245,21 @@ def rm_leap(data: xr.DataArray) -> xr.DataArray:
     data = data.sel(
         time=~((data.time.dt.month == february) & (data.time.dt.day == leap_day)),
     )
-    days_since_first = np.cumsum(
-        np.append(data.time[1:].values - data.time[:-1].values, timedelta(1)),
-    )
-    data["time"] = [
-        DatetimeNoLeap(*data.time[0].values.tolist().timetuple()) + dt
-        for dt in days_since_first
-    ]
+    data["time"] = _noleap_axis(data.indexes["time"])
 
     return data
 
 
+def _noleap_axis(index: pd.Index) -> np.ndarray:
+    """Noleap dates of a time axis, taken from the cached timespan calendar."""
+    timespan = Timespan()
+    if isinstance(index, pd.DatetimeIndex):
+        position = timespan.daily_noleap.get_indexer(index)
+        if np.all(position >= 0):
+            return timespan.noleap[position]
+    return noleap_dates(index)
+
+
 def output_directory(test: bool = True) -> Path:
     """Provide path to output directory."""
     if test:
@@ -195,8 +273,20 @@ def main(
     quantile: float = 0.9,
     clim_method: str = "point_wise",
     test: bool = True,
+    instrumentation: bool = False,
+    dtype: Optional[str] = None,
+    manifest: bool = False,
 ) -> None:
-    """Load, detrend and declimatize SSS data."""
+    """Load, detrend and declimatize SSS data.
+
+    With `instrumentation` (or ``WATER_MASSES_INSTRUMENT=1``) the timing and
+    memory of each stage is written to ``instrumentation.json`` in the output
+    directory, the instrumentation switch and records are restored afterwards.
+    `dtype` (`float32` or `float64`) sets the precision policy for the run
+    only, see :mod:`water_masses.precision`. With `manifest` the source is
+    opened from a metadata manifest, see :func:`open_sss`.
+
+    """
     source = "daily_mean" if not test else "test_daily_mean"
     output_path = output_directory(test=test)
     output_path.mkdir(parents=True, exist_ok=True)
@@ -207,25 +297,43 @@ def main(
         test=test,
         quantile=quantile,
     )
-
-    data = open_sss(source=meta_data.source)["salinity"]
-    if test:
-        data = data.isel(
-            longitude=slice(None, None, 10),
-            latitude=slice(None, None, 10),
-        )
+    with precision.policy(dtype or precision.get_policy()), instrument.recording(
+        instrumentation or instrument.is_enabled()
+    ):
+        _process(meta_data, output_path, manifest)
+        if instrument.is_enabled():
+            instrument.report(output_path.joinpath("instrumentation.json"))
+
+
+def _process(meta_data: MetaData, output_path: Path, manifest: bool) -> None:
+    data = open_sss(
+        source=meta_data.source,
+        manifest=manifest,
+        stride=10 if meta_data.test else None,
+    )["salinity"]
     data = rm_leap(data)
     data = getattr(RemoveTrend(data, meta_data), meta_data.clim_method)()
-    data = data.groupby("time.dayofyear")
-    data -= getattr(Climatology, meta_data.clim_method)(
-        data,
-        meta_data,
-    )
+    with instrument.stage("processing.anomalies", inputs=data) as current:
+        if meta_data.clim_method == "point_wise":
+            data = grouped.anomalies(
+                data,
+                "dayofyear",
+                reduced=Climatology.point_wise(data, meta_data),
+            )
+        else:
+            data = data.groupby("time.dayofyear")
+            data -= getattr(Climatology, meta_data.clim_method)(
+                data,
+                meta_data,
+            )
+        if current is not None:
+            current.output = data
 
     refser = ref_series(data, meta_data)
 
-    data.to_dataset(name="SSS").to_netcdf(output_path.joinpath("sss-processed.nc"))
-    refser.to_netcdf(output_path.joinpath("sss_time_series_processed.nc"))
+    with instrument.stage("processing.to_netcdf", inputs=(data, refser)):
+        data.to_dataset(name="SSS").to_netcdf(output_path.joinpath("sss-processed.nc"))
+        refser.to_netcdf(output_path.joinpath("sss_time_series_processed.nc"))
 
 
 if __name__ == "__main__":
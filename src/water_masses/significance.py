@@ -0,0 +1,340 @@
+# -*- coding: utf-8 -*-
+"""Monte Carlo significance tests against red-noise surrogates.
+
+Surrogates are generated in batches as arrays of shape `(n, time, ...)` and the
+statistic is evaluated for a whole batch at once. Batches run on a process
+pool, each with its own child of a single ``np.random.SeedSequence``, so the
+null distribution depends on `seed` and `batch_size` only, not on the number
+of workers.
+
+Two surrogate methods are available:
+
+- ``"ar1"``: independent AR(1) processes with the lag-1 autocorrelation, mean
+  and variance of each series.
+- ``"phase"``: Fourier phase randomization, keeping the power spectrum of each
+  series.
+
+Surrogates of the series of a field are independent, so a null distribution
+of EOF statistics keeps the autocorrelation of each point but not the spatial
+coherence.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from typing import TYPE_CHECKING, Callable, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from .instrument import instrumented
+
+if TYPE_CHECKING:  # pragma: no cover
+    from .grid import Grid
+
+METHODS = ("ar1", "phase")
+
+
+def surrogates(
+    x: np.ndarray,
+    n: int,
+    method: str = "ar1",
+    seed: Union[None, int, np.random.SeedSequence] = None,
+) -> np.ndarray:
+    """Red-noise surrogates of series with time as first axis.
+
+    Parameter
+    =========
+    x : np.ndarray
+        Series of shape `(time, ...)` without missing values.
+    n : int
+        Number of surrogates.
+    method : str
+        `ar1` or `phase`, see the module documentation.
+    seed : int or np.random.SeedSequence
+        Seed of the random generator.
+
+    Returns
+    =======
+    np.ndarray
+        Surrogates of shape `(n, time, ...)`.
+
+    """
+    x = np.asarray(x, dtype=np.float64)
+    if np.isnan(x).any():
+        raise ValueError("Surrogates require series without missing values.")
+    rng = np.random.default_rng(seed)
+    if method == "ar1":
+        return _ar1_surrogates(x, n, rng)
+    if method == "phase":
+        return _phase_surrogates(x, n, rng)
+    raise ValueError(f"method must be one of {', '.join(METHODS)}.")
+
+
+def ar1_coefficient(x: np.ndarray) -> np.ndarray:
+    """Lag-1 autocorrelation of series with time as first axis."""
+    anomalies = np.asarray(x, dtype=np.float64) - np.mean(x, axis=0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        phi = np.sum(anomalies[1:] * anomalies[:-1], axis=0) / np.sum(
+            anomalies ** 2, axis=0
+        )
+    return np.nan_to_num(phi)
+
+
+def _ar1_surrogates(x: np.ndarray, n: int, rng: np.random.Generator) -> np.ndarray:
+    """AR(1) processes started from their stationary distribution."""
+    phi = np.clip(ar1_coefficient(x), -0.999, 0.999)
+    mean, std = x.mean(axis=0), x.std(axis=0)
+    noise = rng.standard_normal((n, *x.shape))
+    noise[:, 1:] *= np.sqrt(1 - phi ** 2)
+    for t in range(1, x.shape[0]):
+        noise[:, t] += phi * noise[:, t - 1]
+    return mean + std * noise
+
+
+def _phase_surrogates(x: np.ndarray, n: int, rng: np.random.Generator) -> np.ndarray:
+    """Series with the amplitude spectrum of `x` and random phases."""
+    ntime = x.shape[0]
+    spectrum = np.fft.rfft(x, axis=0)
+    phases = rng.uniform(0, 2 * np.pi, (n, *spectrum.shape))
+    # the mean and (for even lengths) the Nyquist frequency stay real
+    phases[:, 0] = 0
+    if ntime % 2 == 0:
+        phases[:, -1] = 0
+    return np.fft.irfft(spectrum * np.exp(1j * phases), n=ntime, axis=1)
+
+
+def _null_distribution(
+    statistic: Callable[[int, np.random.SeedSequence], np.ndarray],
+    n_surrogates: int,
+    seed: Optional[int],
+    batch_size: int,
+    max_workers: Optional[int],
+) -> np.ndarray:
+    """Evaluate `statistic(size, seed)` for batches of surrogates."""
+    sizes = [batch_size] * (n_surrogates // batch_size)
+    if n_surrogates % batch_size:
+        sizes.append(n_surrogates % batch_size)
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    if max_workers == 1 or len(sizes) == 1:
+        results: List[np.ndarray] = list(map(statistic, sizes, seeds))
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            results = list(pool.map(statistic, sizes, seeds))
+    return np.concatenate(results)
+
+
+def _lagged_correlation(x: np.ndarray, y: np.ndarray, lags: np.ndarray) -> np.ndarray:
+    """Pearson correlation of `x[t]` and `y[..., t - lag]` for each lag.
+
+    `y` may hold a batch of series as `(..., time)`.
+
+    """
+    ntime = x.shape[-1]
+    result = np.empty((*y.shape[:-1], len(lags)))
+    for index, lag in enumerate(lags):
+        if lag >= 0:
+            xs, ys = x[lag:], y[..., : ntime - lag]
+        else:
+            xs, ys = x[:lag], y[..., -lag:]
+        xs = xs - xs.mean()
+        ys = ys - ys.mean(axis=-1, keepdims=True)
+        result[..., index] = (ys @ xs) / np.sqrt(
+            np.sum(ys ** 2, axis=-1) * np.sum(xs ** 2)
+        )
+    return result
+
+
+def _crosscorr_batch(
+    size: int,
+    seed: np.random.SeedSequence,
+    x: np.ndarray,
+    y: np.ndarray,
+    lags: np.ndarray,
+    method: str,
+) -> np.ndarray:
+    return _lagged_correlation(x, surrogates(y, size, method, seed), lags)
+
+
+@instrumented
+def crosscorr_test(
+    datax: Union[pd.Series, xr.DataArray],
+    datay: Union[pd.Series, xr.DataArray],
+    lags: Union[int, Sequence[int]] = 0,
+    n_surrogates: int = 1000,
+    method: str = "ar1",
+    seed: Optional[int] = None,
+    batch_size: int = 100,
+    max_workers: Optional[int] = None,
+) -> Tuple[xr.DataArray, xr.DataArray, xr.DataArray]:
+    """Test lag correlations against surrogates of `datay`.
+
+    The correlation at `lag` is that of
+    :func:`water_masses.time_series.crosscorr`, i.e. of `datax` and `datay`
+    shifted by `lag`.
+
+    Parameter
+    =========
+    datax, datay : pd.Series or xr.DataArray
+        Series of equal length without missing values.
+    lags : int or sequence of int
+        Lags in time steps.
+    n_surrogates : int
+        Size of the null distribution.
+    method : str
+        `ar1` or `phase`, see the module documentation.
+    seed : int
+        Seed of the root ``np.random.SeedSequence``.
+    batch_size : int
+        Surrogates evaluated at once by a worker.
+    max_workers : int
+        Size of the process pool, 1 runs in the calling process.
+
+    Returns
+    =======
+    correlation : xr.DataArray
+        Observed correlation on the dimension `lag`.
+    null : xr.DataArray
+        Correlations of the surrogates on the dimensions `(surrogate, lag)`.
+    p_value : xr.DataArray
+        Two-sided p-values on the dimension `lag`.
+
+    """
+    lags = np.atleast_1d(lags)
+    x = np.asarray(datax, dtype=np.float64)
+    y = np.asarray(datay, dtype=np.float64)
+    if x.shape != y.shape or x.ndim != 1:
+        raise ValueError("datax and datay must be series of equal length.")
+    if np.isnan(x).any():
+        raise ValueError("Surrogates require series without missing values.")
+    observed = _lagged_correlation(x, y, lags)
+    null = _null_distribution(
+        partial(_crosscorr_batch, x=x, y=y, lags=lags, method=method),
+        n_surrogates,
+        seed,
+        batch_size,
+        max_workers,
+    )
+    p_value = _p_value(np.abs(observed), np.abs(null))
+    return _as_data_arrays(observed, null, p_value, "lag", lags, "correlation", method)
+
+
+def _variance_fractions(anomalies: np.ndarray, nmodes: int) -> np.ndarray:
+    """Leading variance fractions of a batch of `(..., time, point)` anomalies."""
+    anomalies = anomalies - anomalies.mean(axis=-2, keepdims=True)
+    gram = anomalies @ np.swapaxes(anomalies, -1, -2)
+    eigenvalues = np.clip(np.linalg.eigvalsh(gram)[..., ::-1], 0, None)
+    return eigenvalues[..., :nmodes] / eigenvalues.sum(axis=-1, keepdims=True)
+
+
+def _eof_batch(
+    size: int,
+    seed: np.random.SeedSequence,
+    values: np.ndarray,
+    weights: np.ndarray,
+    nmodes: int,
+    method: str,
+) -> np.ndarray:
+    return _variance_fractions(surrogates(values, size, method, seed) * weights, nmodes)
+
+
+@instrumented
+def eof_test(
+    da: xr.DataArray,
+    nmodes: int = 10,
+    n_surrogates: int = 1000,
+    method: str = "phase",
+    seed: Optional[int] = None,
+    batch_size: int = 20,
+    max_workers: Optional[int] = None,
+    grid: Optional["Grid"] = None,
+) -> Tuple[xr.DataArray, xr.DataArray, xr.DataArray]:
+    """Test the variance fractions of latitude weighted EOFs against surrogates.
+
+    The field is weighted as in :func:`water_masses.origin.pca.lat_weighted_eof`,
+    points with missing values are excluded. Variance fractions of a batch of
+    surrogates are computed at once from the eigenvalues of their time x time
+    Gram matrices.
+
+    Parameter
+    =========
+    da : xr.DataArray
+        Field with time as first dimension and CF latitude coordinate.
+    nmodes : int
+        Number of leading modes tested.
+    n_surrogates : int
+        Size of the null distribution.
+    method : str
+        `phase` (default) or `ar1`, see the module documentation.
+    seed : int
+        Seed of the root ``np.random.SeedSequence``.
+    batch_size : int
+        Surrogates evaluated at once by a worker.
+    max_workers : int
+        Size of the process pool, 1 runs in the calling process.
+    grid : Grid
+        Grid of `da`, defaults to the cached grid, see
+        :class:`water_masses.grid.Grid`.
+
+    Returns
+    =======
+    variance_fraction : xr.DataArray
+        Observed variance fractions on the dimension `mode`.
+    null : xr.DataArray
+        Variance fractions of the surrogates on the dimensions
+        `(surrogate, mode)`.
+    p_value : xr.DataArray
+        One-sided p-values on the dimension `mode`.
+
+    """
+    from .origin.pca import _coslat_weights
+
+    weights = np.broadcast_to(_coslat_weights(da, grid), da.shape[1:]).reshape(-1)
+    values = np.asarray(da.values, dtype=np.float64).reshape(da.shape[0], -1)
+    valid = ~np.isnan(values).any(axis=0)
+    values, weights = values[:, valid], weights[valid]
+    nmodes = min(nmodes, da.shape[0] - 1)
+    observed = _variance_fractions(values * weights, nmodes)
+    null = _null_distribution(
+        partial(
+            _eof_batch, values=values, weights=weights, nmodes=nmodes, method=method
+        ),
+        n_surrogates,
+        seed,
+        batch_size,
+        max_workers,
+    )
+    p_value = _p_value(observed, null)
+    return _as_data_arrays(
+        observed, null, p_value, "mode", np.arange(nmodes), "variance_fraction", method
+    )
+
+
+def _p_value(observed: np.ndarray, null: np.ndarray) -> np.ndarray:
+    """Share of surrogates at least as large as observed, never zero."""
+    return (1 + np.sum(null >= observed, axis=0)) / (1 + null.shape[0])
+
+
+def _as_data_arrays(
+    observed: np.ndarray,
+    null: np.ndarray,
+    p_value: np.ndarray,
+    dim: str,
+    coord: np.ndarray,
+    name: str,
+    method: str,
+) -> Tuple[xr.DataArray, xr.DataArray, xr.DataArray]:
+    attrs = {"surrogates": method, "n_surrogates": null.shape[0]}
+    return (
+        xr.DataArray(observed, coords={dim: coord}, dims=dim, name=name),
+        xr.DataArray(
+            null,
+            coords={dim: coord, "surrogate": np.arange(null.shape[0])},
+            dims=("surrogate", dim),
+            name=f"{name}_null",
+            attrs=attrs,
+        ),
+        xr.DataArray(
+            p_value, coords={dim: coord}, dims=dim, name="p_value", attrs=attrs
+        ),
+    )
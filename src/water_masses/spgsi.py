@@ -2,51 +2,98 @@
 """Read and manipulate SPG strength index."""
 
 import pandas as pd
-from scipy import signal
 from pathlib import Path
 import numpy as np
-from datetime import datetime
-import calendar
+from typing import Sequence, Union
 
-from . import constants
+from . import constants, filtering
+from .tracmass import trajectory_time
+from .tracmass.table import TrajectoryTable
 
 
-def assign2trj(df: pd.DataFrame, spgs_idx: pd.DataFrame) -> pd.DataFrame:
-    """Add SPG strength index to trajectories."""
+def assign2trj(
+    df: Union[pd.DataFrame, TrajectoryTable], spgs_idx: pd.DataFrame
+) -> pd.DataFrame:
+    """Add SPG strength index to trajectories.
+
+    Each trajectory gets the rounded PC2 of the month it was initialized in,
+    i.e. the month of its latest date. Rows outside the timespan are dropped.
+
+    Parameter
+    =========
+    df : pd.DataFrame or TrajectoryTable
+        Trajectories as trajectory table, as flat DataFrame with the columns
+        `id` and `time` (seconds relative to the end of the timespan) or as
+        `(id, date)` indexed DataFrame, see
+        :func:`water_masses.filter_month.open_dataset`.
+    spgs_idx : pd.DataFrame
+        SPG strength index, see :func:`open_index`.
+
+    Returns
+    =======
+    pd.DataFrame
+        Tables and flat DataFrames are returned flat with the additional columns
+        `init` (seconds, day precision), `year`, `month` and `PC2`. Indexed
+        DataFrames keep their index and get `init` as date and `PC2`.
 
-    def to_spgs_idx(date: datetime.date):
-        return np.round(
-            spgs_idx.loc[(date.year, calendar.month_name[date.month]), "PC2"],
-            decimals=0,
+    """
+    timespan = constants.Timespan()
+    epoch = timespan.end
+    indexed = isinstance(df, pd.DataFrame) and "date" in df.index.names
+    if isinstance(df, TrajectoryTable):
+        epoch = df.epoch
+        df = df.to_pandas()
+    if indexed:
+        ids = df.index.get_level_values("id").values
+        time = trajectory_time.from_datetime64(
+            df.index.get_level_values("date").values, epoch
         )
+    else:
+        ids = df["id"].values
+        time = df["time"].values.astype(np.int64)
 
-    query = "date >= '{0}' & date <= '{1}'".format(
-        "-".join([str(n) for n in constants.Timespan().start.timetuple()[:3]]),
-        "-".join([str(n) for n in constants.Timespan().end.timetuple()[:3]]),
-    )
-    df = df.query(query)
-    df = df.assign(
-        init=df.reset_index("date")["date"]
-        .dt.date.groupby("id")
-        .transform("max")
-        .tolist(),
-    )
-    vspgsi = np.vectorize(to_spgs_idx)
+    first, last = [
+        trajectory_time.from_datetime64(np.datetime64(date, "D"), epoch)
+        for date in (timespan.start, timespan.end)
+    ]
+    within = (time >= first) & (time <= last)
+    if not within.all():
+        df, ids, time = df[within], ids[within], time[within]
 
-    return df.assign(PC2=vspgsi(df.init))
+    init = trajectory_time.floor_day(trajectory_time.init_time(ids, time), epoch)
+    key = trajectory_time.year_month_key(init, epoch)
+    pc2 = np.round(_monthly_values(spgs_idx, "PC2", key), decimals=0)
+    if indexed:
+        # datetime.date objects, as before vectorization
+        dates = trajectory_time.to_datetime64(init, epoch).astype("datetime64[D]")
+        return df.assign(init=dates.astype(object), PC2=pc2)
+    return df.assign(init=init, year=key // 12, month=key % 12 + 1, PC2=pc2)
+
+
+def _monthly_values(spgs_idx: pd.DataFrame, column: str, key: np.ndarray) -> np.ndarray:
+    """Look up `column` of the `(year, month)` indexed SPG index by year-month key."""
+    index_key = 12 * spgs_idx.index.get_level_values("year").values + (
+        spgs_idx.index.get_level_values("month").map(constants.MONTH_NUMBERS).values - 1
+    )
+    position = pd.Index(index_key).get_indexer(key)
+    if np.any(position < 0):
+        missing = np.unique(key[position < 0])
+        raise KeyError(
+            "No SPG strength index for (year, month) "
+            + ", ".join(
+                str(divmod(ym, 12)[0]) + f"-{ym % 12 + 1:02d}" for ym in missing
+            )
+        )
+    return spgs_idx[column].values[position]
 
 
 def open_index(path: Path) -> pd.DataFrame:
     """Read SPG strength index."""
+    timespan = constants.Timespan()
     spgsi = pd.read_csv(path, header=None, names=["PC1", "PC2"])
-    dates = pd.date_range(
-        start=constants.Timespan().start,
-        end=constants.Timespan().end,
-        freq="MS",
-    )
-    spgsi = spgsi.assign(date=dates)
-    spgsi = spgsi.assign(year=dates.year)
-    spgsi = spgsi.assign(month=dates.month_name())
+    spgsi = spgsi.assign(date=timespan.monthly)
+    spgsi = spgsi.assign(year=timespan.monthly.year)
+    spgsi = spgsi.assign(month=timespan.month_names)
     spgsi = spgsi.set_index(["year", "month"])
 
     return spgsi
@@ -57,8 +104,17 @@ def filter(
     order: int = 10,
     freq: float = 12,
     cutoff: float = 4,
+    columns: Union[str, Sequence[str]] = "PC2",
 ) -> pd.DataFrame:
-    """Apply low pass filter."""
+    """Apply low pass filter.
+
+    All `columns` are filtered at once, see
+    :func:`water_masses.filtering.filter_series`, and returned with a copy of
+    `spgsi`: a single column as `filtered`, several as `f<column>`.
+
+    """
+    from scipy import signal
+
     nyq = 0.5 * freq
     sos = signal.butter(
         N=order,
@@ -67,5 +123,7 @@ def filter(
         fs=freq,
         output="sos",
     )
-    spgsi["filtered"] = signal.sosfiltfilt(sos, spgsi.PC2)
-    return spgsi
+    if isinstance(columns, str):
+        return spgsi.assign(filtered=filtering.filter_series(spgsi[columns], sos))
+    filtered = filtering.filter_series(spgsi[list(columns)], sos)
+    return spgsi.assign(**{f"f{column}": filtered[column] for column in columns})
@@ -1,22 +1,33 @@
 # -*- coding: utf-8 -*-
 """Time series manipulations."""
 
-from typing import Tuple
+from functools import lru_cache
+from typing import Sequence, Tuple, Union
 
 import pandas as pd
-from scipy import signal
 import xarray as xr
 import numpy as np
 
+from . import filtering, grouped
+from .precision import result_dtype
+
 
 def lowpass_filter(
     df: pd.DataFrame,
-    var: str,
+    var: Union[str, Sequence[str]],
     order: int = 10,
     freq: float = 12,
     cutoff: float = 4,
 ) -> pd.DataFrame:
-    """Apply low pass filter."""
+    """Apply low pass filter.
+
+    The columns `var` are filtered at once, see
+    :func:`water_masses.filtering.filter_series`, and returned as `f<var>`
+    with a copy of `df`.
+
+    """
+    from scipy import signal
+
     nyq = 0.5 * freq
     sos = signal.butter(
         N=order,
@@ -25,8 +36,9 @@ def lowpass_filter(
         fs=freq,
         output="sos",
     )
-    df[f"f{var}"] = signal.sosfiltfilt(sos, df[var])
-    return df
+    columns = [var] if isinstance(var, str) else list(var)
+    filtered = filtering.filter_series(df[columns], sos)
+    return df.assign(**{f"f{column}": filtered[column] for column in columns})
 
 
 def crosscorr(datax, datay, lag=0):
@@ -48,55 +60,137 @@ def crosscorr(datax, datay, lag=0):
     return datax.corr(datay.shift(lag))
 
 
-def detrend(data: xr.DataArray, dim: str, deg: int = 1) -> xr.DataArray:
-    """Detrend along a single dimension."""
-    p = data.polyfit(dim=dim, deg=deg)
-    fit = xr.polyval(data[dim], p.polyfit_coefficients)
-    return data - fit
-
+def detrend(
+    data: xr.DataArray, dim: str, deg: int = 1, method: str = "polyfit"
+) -> xr.DataArray:
+    """Detrend along a single dimension.
+
+    The fit is solved in float64, the result keeps the floating point type of
+    `data`.
+
+    Parameter
+    =========
+    data : xr.DataArray
+        Data, with `dim` in a single chunk if dask backed.
+    dim : str
+        Dimension of the trend.
+    deg : int
+        Degree of the polynomial trend.
+    method : str
+        `polyfit` fits with ``xr.DataArray.polyfit`` and subtracts the
+        evaluated fit. `fused` solves the normal equations with a cached
+        pseudo-inverse of the Vandermonde matrix of the `dim` axis and
+        subtracts the trend in the same per-chunk kernel, so no full size fit
+        is allocated. Missing values are excluded from the fit of their
+        series, series with fewer than ``deg + 1`` values become missing.
 
-def _cross_year_winter_months(
-    da: xr.DataArray, y_n=list
-) -> Tuple[xr.DataArray, xr.DataArray]:
-    """Calculate a touple of consecutive December, January, and February.
-
-    Assumes time dimension to be the last. e.g. (lon, lat, t)
     """
-    return (
-        da[..., da.time.dt.year.isin(y_n - 1) & da.time.dt.month.isin([12])],
-        da[..., da.time.dt.year.isin(y_n) & da.time.dt.month.isin([1, 2])],
-    )
+    if method == "polyfit":
+        p = data.polyfit(dim=dim, deg=deg)
+        fit = xr.polyval(data[dim], p.polyfit_coefficients)
+        return data - fit.astype(result_dtype(data.dtype))
+    if method != "fused":
+        raise ValueError("method must be polyfit or fused.")
+    vandermonde, pinv = _vandermonde(tuple(_numeric_axis(data[dim])), deg)
+    return xr.apply_ufunc(
+        _detrend_kernel,
+        data,
+        input_core_dims=[[dim]],
+        output_core_dims=[[dim]],
+        kwargs={"vandermonde": vandermonde, "pinv": pinv},
+        dask="parallelized",
+        output_dtypes=[data.dtype],
+    ).transpose(*data.dims)
+
+
+def _numeric_axis(coord: xr.DataArray) -> np.ndarray:
+    """Coordinate as float, datetimes in seconds since the first."""
+    values = coord.values
+    if np.issubdtype(values.dtype, np.datetime64):
+        return (values - values[0]) / np.timedelta64(1, "s")
+    if values.dtype == object:
+        # cftime dates
+        index = coord.to_index()
+        return np.asarray((index - index[0]) / pd.Timedelta(1, "s"), dtype=float)
+    return values.astype(float)
+
+
+@lru_cache(maxsize=16)
+def _vandermonde(axis: Tuple[float, ...], deg: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Vandermonde matrix (n, deg + 1) of the scaled axis and its pseudo-inverse."""
+    x = np.asarray(axis)
+    scale = np.ptp(x) / 2 or 1.0
+    vandermonde = np.vander((x - x.mean()) / scale, deg + 1, increasing=True)
+    pinv = np.linalg.pinv(vandermonde)
+    vandermonde.flags.writeable = False
+    pinv.flags.writeable = False
+    return vandermonde, pinv
+
+
+#: Number of elements of the temporary trend slabs of the fused detrending.
+SLAB_SIZE = 1 << 20
+
+
+def _detrend_kernel(
+    values: np.ndarray, vandermonde: np.ndarray, pinv: np.ndarray
+) -> np.ndarray:
+    """Subtract the least squares polynomial along the last axis.
+
+    The coefficients are float64 (`pinv` is float64), the trend is subtracted
+    in the type of `values`.
 
+    """
+    coefficients = values @ pinv.T
+    incomplete = np.isnan(coefficients).any(axis=-1)
+    if incomplete.any():
+        # normal equations of the series with missing values
+        masked = values[incomplete]
+        valid = ~np.isnan(masked)
+        gram = np.einsum("tk,tl,st->skl", vandermonde, vandermonde, valid)
+        moments = np.where(valid, masked, 0) @ vandermonde
+        enough = valid.sum(axis=-1) >= vandermonde.shape[1]
+        solved = np.full(moments.shape, np.nan)
+        solved[enough] = np.linalg.solve(
+            gram[enough], moments[enough][..., np.newaxis]
+        )[..., 0]
+        coefficients[incomplete] = solved
+
+    result = np.array(values, copy=True)
+    ntime = values.shape[-1]
+    step = max(1, SLAB_SIZE // max(1, values.size // max(ntime, 1)))
+    for start in range(0, ntime, step):
+        slab = slice(start, start + step)
+        result[..., slab] -= coefficients @ vandermonde[slab].T
+    return result
+
+
+def cross_year_winter_average(da: xr.DataArray) -> xr.DataArray:
+    """Average of consecutive December, January and February.
+
+    Winters are labeled by the year of their January, the first (incomplete)
+    winter is dropped. Missing values propagate to the average.
 
-def _winter_mean(da: xr.DataArray, y_n) -> np.ndarray:
-    """Average cross year winter months tuple."""
-    return np.expand_dims(
-        np.mean(
-            np.concatenate(_cross_year_winter_months(da, y_n), axis=-1),
-            axis=-1,
-        ),
-        axis=-1,
+    """
+    import cf_xarray as cfxr  # noqa
+
+    da_djf = da.isel(time=np.flatnonzero(da.time.dt.season.values == "DJF"))
+    year = da_djf.time.dt.year.values
+    years_complete_djf = np.unique(year)[1:]
+    winter = year + (da_djf.time.dt.month.values == 12)
+    complete = np.isin(winter, years_complete_djf)
+    da_seasonal_average = grouped.reduce(
+        da_djf.isel(time=np.flatnonzero(complete)),
+        winter[complete],
+        skipna=False,
+        group_dim="time",
     )
-
-
-def cross_year_winter_average(da):
-    da_djf = da[..., da.time.dt.season == "DJF"]
-    years_complete_djf = list(set(da_djf.time.dt.year.values))[1:]
-    da_seasonal_average = xr.DataArray(
-        data=np.concatenate(
-            [_winter_mean(da_djf, y_n) for y_n in years_complete_djf], axis=-1
-        ),
-        dims=["lat", "lon", "time"],
-        coords=dict(
-            lon=(["lon"], da_djf.lon.values),
-            lat=(["lat"], da_djf.lat.values),
-            time=pd.date_range(
-                start=f"{years_complete_djf[0]}",
-                end=f"{years_complete_djf[-1]}",
-                freq="AS-JAN",
-            )
-            + pd.Timedelta(14, unit="D"),
-        ),
-    ).transpose("time", "lat", "lon")
+    da_seasonal_average = da_seasonal_average.assign_coords(
+        time=pd.date_range(
+            start=f"{years_complete_djf[0]}",
+            end=f"{years_complete_djf[-1]}",
+            freq="AS-JAN",
+        )
+        + pd.Timedelta(14, unit="D"),
+    ).transpose("time", ...)
     da_seasonal_average = da_seasonal_average.cf.guess_coord_axis()
     return da_seasonal_average
@@ -0,0 +1,262 @@
+# -*- coding: utf-8 -*-
+"""Aggregate trajectories onto the model grid.
+
+Trajectory positions are binned onto grid cells (and optional time windows)
+with ``np.bincount``, chunk by chunk, so any number of rows is aggregated in a
+single streaming pass with memory bounded by the chunk size and the grid.
+
+TRACMASS positions are given in grid index space, cell `n` spans the positions
+`n - 1` to `n`. With the default ``offset=1`` the cells are hence numbered as
+in TRACMASS and the seed files written by :mod:`water_masses.tracmass.seeding`.
+"""
+
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from ..constants import Timespan
+from . import trajectory_time
+from .io import iter_tracmass_file
+from .table import TrajectoryTable
+
+Trajectories = Union[Path, pd.DataFrame, TrajectoryTable, Iterable[pd.DataFrame]]
+
+SECONDS_PER_DAY = trajectory_time.SECONDS_PER_DAY
+
+
+class GridAccumulator(object):
+    """Running per-cell statistics of trajectory positions."""
+
+    def __init__(
+        self,
+        shape: Tuple[int, ...],
+        time_bins: Optional[Sequence[np.datetime64]] = None,
+        init: Optional[Union[pd.DataFrame, TrajectoryTable]] = None,
+        epoch: Optional[datetime] = None,
+        offset: int = 1,
+    ) -> None:
+        """Allocate the accumulators.
+
+        Parameter
+        =========
+        shape : tuple of int
+            Number of cells `(nj, ni)` or, to bin vertically as well,
+            `(nk, nj, ni)`.
+        time_bins : sequence of datetime64
+            Edges of the time windows, rows outside are dropped.
+        init : pd.DataFrame or TrajectoryTable
+            Initialization data (e.g. `tests_ini.csv`) with the columns `id` and
+            `time`, required for the age (time since initialization) statistics.
+        epoch : datetime
+            Reference date of `time`, defaults to the end of the experiment.
+        offset : int
+            Added to the floored positions to get cell numbers.
+
+        """
+        self.shape = tuple(shape)
+        self.epoch = epoch if epoch is not None else Timespan().end
+        self.offset = offset
+        self.time_bins = (
+            None
+            if time_bins is None
+            else trajectory_time.from_datetime64(np.asarray(time_bins), self.epoch)
+        )
+        windows = 1 if self.time_bins is None else len(self.time_bins) - 1
+        self.size = windows * int(np.prod(self.shape))
+        self.count = np.zeros(self.size, dtype=np.int64)
+        self.transport = np.zeros(self.size)
+        self.time_sum = np.zeros(self.size)
+        self.init_ids: Optional[np.ndarray] = None
+        if init is not None:
+            self._set_init(init)
+            self.age_count = np.zeros(self.size, dtype=np.int64)
+            self.age_sum = np.zeros(self.size)
+            self.age_sum_squares = np.zeros(self.size)
+
+    def _set_init(self, init: Union[pd.DataFrame, TrajectoryTable]) -> None:
+        """Initialization time per id, sorted by id for lookups."""
+        if isinstance(init, TrajectoryTable):
+            ids, time = init.to_numpy("id"), init.to_numpy("time")
+        else:
+            ids, time = init["id"].values, init["time"].values
+        _, _, self.init_ids = trajectory_time.segments(ids)
+        self.init_time = trajectory_time.reduce_by_id(
+            ids, np.asarray(time, dtype=np.int64), broadcast=False
+        )
+
+    def cells(self, chunk: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray]:
+        """Flat cell (and time window) index of each row and mask of valid rows."""
+        dims = ["k", "j", "i"][-len(self.shape) :]
+        index = [
+            np.floor(chunk[dim].values).astype(np.int64) + self.offset - 1
+            for dim in dims
+        ]
+        shape = self.shape
+        if self.time_bins is not None:
+            index.insert(
+                0,
+                np.searchsorted(self.time_bins, chunk["time"].values, side="right") - 1,
+            )
+            shape = (len(self.time_bins) - 1, *shape)
+        valid = np.logical_and.reduce(
+            [(idx >= 0) & (idx < size) for idx, size in zip(index, shape)]
+        )
+        flat = np.ravel_multi_index([idx[valid] for idx in index], shape)
+        return flat, valid
+
+    def update(self, chunk: pd.DataFrame) -> None:
+        """Add a chunk of trajectory rows (columns id, i, j[, k], subvol, time)."""
+        flat, valid = self.cells(chunk)
+        time = chunk["time"].values[valid].astype(np.float64)
+        self.count += np.bincount(flat, minlength=self.size)
+        self.transport += np.bincount(
+            flat, weights=chunk["subvol"].values[valid], minlength=self.size
+        )
+        self.time_sum += np.bincount(flat, weights=time, minlength=self.size)
+        if self.init_ids is None:
+            return
+        position = np.searchsorted(self.init_ids, chunk["id"].values[valid])
+        position = np.minimum(position, len(self.init_ids) - 1)
+        known = self.init_ids[position] == chunk["id"].values[valid]
+        age = (self.init_time[position[known]] - time[known]) / SECONDS_PER_DAY
+        self.age_count += np.bincount(flat[known], minlength=self.size)
+        self.age_sum += np.bincount(flat[known], weights=age, minlength=self.size)
+        self.age_sum_squares += np.bincount(
+            flat[known], weights=age ** 2, minlength=self.size
+        )
+
+    def result(self, grid: Optional[xr.DataArray] = None) -> xr.Dataset:
+        """Statistics as data set on the grid.
+
+        Parameter
+        =========
+        grid : xr.DataArray
+            Field on the model grid, e.g. as used for seeding, the cell numbers
+            index its longitude and latitude coordinates.
+
+        """
+        dims = ["k", "j", "i"][-len(self.shape) :]
+        shape = self.shape
+        coords = {
+            dim: (dim, np.arange(size) + self.offset) for dim, size in zip(dims, shape)
+        }
+        if self.time_bins is not None:
+            dims = ["time", *dims]
+            shape = (len(self.time_bins) - 1, *shape)
+            coords["time"] = (
+                "time",
+                trajectory_time.to_datetime64(self.time_bins[:-1], self.epoch).astype(
+                    "datetime64[ns]"
+                ),
+            )
+
+        with np.errstate(invalid="ignore", divide="ignore"):
+            data: Dict[str, np.ndarray] = {
+                "count": self.count,
+                "transport": self.transport,
+                "time_mean": trajectory_time.to_datetime64(
+                    np.where(self.count > 0, self.time_sum / self.count, 0), self.epoch
+                ).astype("datetime64[ns]"),
+            }
+            data["time_mean"][self.count == 0] = np.datetime64("NaT")
+            if self.init_ids is not None:
+                age_mean = self.age_sum / self.age_count
+                data["age_mean"] = age_mean
+                data["age_std"] = np.sqrt(
+                    np.maximum(self.age_sum_squares / self.age_count - age_mean ** 2, 0)
+                )
+        ds = xr.Dataset(
+            {name: (dims, values.reshape(shape)) for name, values in data.items()},
+            coords=coords,
+        )
+        ds["count"].attrs = {"long_name": "number of trajectory positions"}
+        ds["transport"].attrs = {"long_name": "sum of subvolumes"}
+        ds["time_mean"].attrs = {"long_name": "mean time of the positions"}
+        if self.init_ids is not None:
+            ds["age_mean"].attrs = {
+                "long_name": "mean time since initialization",
+                "units": "days",
+            }
+            ds["age_std"].attrs = {
+                "long_name": "standard deviation of the time since initialization",
+                "units": "days",
+            }
+        if grid is not None:
+            ds = ds.assign_coords(_grid_coords(grid, ds, self.offset))
+        return ds
+
+
+def _grid_coords(
+    grid: xr.DataArray, ds: xr.Dataset, offset: int
+) -> Dict[str, Tuple[str, np.ndarray]]:
+    """Longitude and latitude of the cells."""
+    import cf_xarray as cfxr  # noqa
+
+    lon = grid.cf["longitude"].values
+    lat = grid.cf["latitude"].values
+    i = np.clip(ds.i.values - offset, 0, len(lon) - 1)
+    j = np.clip(ds.j.values - offset, 0, len(lat) - 1)
+    return {"longitude": ("i", lon[i]), "latitude": ("j", lat[j])}
+
+
+def to_grid(
+    trajectories: Trajectories,
+    shape: Tuple[int, ...],
+    time_bins: Optional[Sequence[np.datetime64]] = None,
+    init: Optional[Union[pd.DataFrame, TrajectoryTable]] = None,
+    grid: Optional[xr.DataArray] = None,
+    epoch: Optional[datetime] = None,
+    offset: int = 1,
+    chunk_size: int = 1 << 22,
+) -> xr.Dataset:
+    """Particle density, transport and time statistics on the model grid.
+
+    Parameter
+    =========
+    trajectories : Path, pd.DataFrame, TrajectoryTable or iterable of pd.DataFrame
+        Trajectories with the columns id, i, j, (k,) subvol and time. Files are
+        streamed with :func:`water_masses.tracmass.io.iter_tracmass_file`.
+    shape : tuple of int
+        Number of cells `(nj, ni)` or `(nk, nj, ni)`.
+    time_bins : sequence of datetime64
+        Edges of the time windows.
+    init : pd.DataFrame or TrajectoryTable
+        Initialization data, adds the age statistics.
+    grid : xr.DataArray
+        Field on the model grid, adds longitude and latitude.
+    epoch : datetime
+        Reference date of `time`, defaults to the end of the experiment.
+    offset : int
+        Added to the floored positions to get cell numbers.
+    chunk_size : int
+        Rows per chunk.
+
+    Returns
+    =======
+    xr.Dataset
+        `count`, `transport` and `time_mean`, and with `init` given `age_mean`
+        and `age_std`, on the dimensions ([time,] [k,] j, i).
+
+    """
+    if isinstance(trajectories, TrajectoryTable):
+        epoch = trajectories.epoch if epoch is None else epoch
+        chunks: Iterable[pd.DataFrame] = (
+            batch.to_pandas()
+            for batch in trajectories.table.to_batches(max_chunksize=chunk_size)
+        )
+    elif isinstance(trajectories, pd.DataFrame):
+        chunks = [trajectories]
+    elif isinstance(trajectories, (str, Path)):
+        chunks = iter_tracmass_file(Path(trajectories), chunk_size=chunk_size)
+    else:
+        chunks = trajectories
+    accumulator = GridAccumulator(
+        shape, time_bins=time_bins, init=init, epoch=epoch, offset=offset
+    )
+    for chunk in chunks:
+        accumulator.update(chunk)
+    return accumulator.result(grid)
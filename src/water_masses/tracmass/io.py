@@ -1,19 +1,30 @@
 import gzip
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from glob import glob
 from pathlib import Path
-from typing import Union
+from typing import TYPE_CHECKING, Iterator, List, Optional, Sequence, Union
 
+import numpy as np
 import pandas as pd
-import vaex
+
+if TYPE_CHECKING:  # pragma: no cover
+    import vaex
+
+    from .table import TrajectoryTable
 
 
 def open_tracmass_file(
     filepath: Path, use_vaex: bool = True, convert=False
-) -> Union[vaex.dataframe.DataFrameLocal, pd.DataFrame]:
+) -> Union["vaex.dataframe.DataFrameLocal", pd.DataFrame]:
     """Open tracmass as pandas dataframe or veax dataframe.
 
     Defaults to the use of vaex, otherwise uses pandas.
 
     """
+    if use_vaex:
+        import vaex
+
     suffixes = _get_suffixes(filepath)
     kws = {
         "header": None,
@@ -35,6 +46,167 @@ def open_tracmass_file(
     return df
 
 
+def open_trajectory_table(filepath: Path) -> "TrajectoryTable":
+    """Open tracmass file as Arrow backed trajectory table.
+
+    CSV (including .csv.gz) files are read with the multithreaded Arrow reader,
+    HDF5 files are memory mapped through vaex.
+
+    """
+    from .table import TrajectoryTable
+
+    if _get_suffixes(filepath) == ".hdf5":
+        import vaex
+
+        return TrajectoryTable.from_vaex(vaex.open(filepath))
+    return TrajectoryTable.from_csv(filepath)
+
+
+def open_tracmass_files(
+    paths: Union[str, Sequence[Path]],
+    engine: str = "vaex",
+    max_workers: Optional[int] = None,
+    processes: bool = False,
+    tag: str = "experiment",
+) -> Union["vaex.dataframe.DataFrameLocal", pd.DataFrame, "TrajectoryTable"]:
+    """Open many tracmass files concurrently as one table.
+
+    Parameter
+    =========
+    paths : str or sequence of Path
+        Glob pattern (e.g. ``"runs/*/tests_run.csv"``) or list of files.
+    engine : str
+        `vaex` (default) concatenates lazily, `arrow` returns a
+        :class:`~water_masses.tracmass.table.TrajectoryTable` whose concatenation
+        does not copy, `pandas` a single DataFrame.
+    max_workers : int
+        Size of the pool, defaults to the executors default.
+    processes : bool
+        Parse on a process instead of a thread pool. Threads suffice for the
+        Arrow and pandas CSV readers, which release the GIL.
+    tag : str
+        Name of the column holding the experiment of each row. Experiments are
+        named after the file, or its path relative to the common parent
+        directory if file names are not unique.
+
+    """
+    if engine not in {"vaex", "arrow", "pandas"}:
+        raise ValueError("engine must be one of vaex, arrow or pandas.")
+    files = _resolve(paths)
+    names = _experiment_names(files)
+    pool: Executor = (
+        ProcessPoolExecutor(max_workers=max_workers)
+        if processes
+        else ThreadPoolExecutor(max_workers=max_workers)
+    )
+    with pool:
+        tables = list(
+            pool.map(
+                partial(_open_tagged, engine=engine, tag=tag, names=names),
+                files,
+                names,
+            )
+        )
+
+    if engine == "vaex":
+        import vaex
+
+        return vaex.concat(tables)
+    if engine == "arrow":
+        from .table import TrajectoryTable
+
+        return TrajectoryTable.concat(tables)
+    return pd.concat(tables, ignore_index=True)
+
+
+def _open_tagged(
+    filepath: Path, name: str, engine: str, tag: str, names: Sequence[str]
+) -> Union["vaex.dataframe.DataFrameLocal", pd.DataFrame, "TrajectoryTable"]:
+    """Open a single file and tag its rows with the experiment name."""
+    if engine == "arrow":
+        import pyarrow as pa
+
+        from .table import TrajectoryTable
+
+        table = open_trajectory_table(filepath)
+        return TrajectoryTable(
+            table.table.append_column(
+                tag,
+                pa.DictionaryArray.from_arrays(
+                    np.zeros(len(table), dtype=np.int32), pa.array([name])
+                ),
+            ),
+            epoch=table.epoch,
+        )
+    df = open_tracmass_file(filepath, use_vaex=engine == "vaex")
+    if engine == "vaex":
+        import vaex
+
+        df[tag] = vaex.vconstant(name, len(df))
+        return df
+    return df.assign(
+        **{
+            tag: pd.Categorical.from_codes(
+                np.full(len(df), names.index(name)), categories=names
+            )
+        }
+    )
+
+
+def _resolve(paths: Union[str, Sequence[Path]]) -> List[Path]:
+    """Expand a glob pattern to a sorted list of paths."""
+    if isinstance(paths, str):
+        files = [Path(path) for path in sorted(glob(paths))]
+    else:
+        files = [Path(path) for path in paths]
+    if not files:
+        raise FileNotFoundError(f"No tracmass files found for {paths}.")
+    return files
+
+
+def _experiment_names(files: Sequence[Path]) -> List[str]:
+    """Name experiments after the files without suffixes, or relative paths."""
+    names = [path.name[: -len(_get_suffixes(path))] for path in files]
+    if len(set(names)) == len(names):
+        return names
+    parent = Path(*_common_parts([path.resolve().parent.parts for path in files]))
+    return [
+        str(path.resolve().relative_to(parent))[: -len(_get_suffixes(path))]
+        for path in files
+    ]
+
+
+def _common_parts(parts: Sequence[Sequence[str]]) -> List[str]:
+    common: List[str] = []
+    for level in zip(*parts):
+        if len(set(level)) > 1:
+            break
+        common.append(level[0])
+    return common
+
+
+def iter_tracmass_file(
+    filepath: Path, chunk_size: int = 1 << 22
+) -> Iterator[pd.DataFrame]:
+    """Stream tracmass file in flat pandas DataFrames of about `chunk_size` rows.
+
+    CSV (including .csv.gz) files are streamed with the Arrow reader, HDF5 files
+    through vaex, so memory is bounded by the chunk size.
+
+    """
+    from .table import iter_csv
+
+    if _get_suffixes(filepath) == ".hdf5":
+        import vaex
+
+        df = vaex.open(filepath)
+        for _, _, table in df.to_arrow_table(chunk_size=chunk_size):
+            yield table.to_pandas(split_blocks=True)
+    else:
+        # about 64 bytes of CSV per row of tracmass output
+        yield from iter_csv(filepath, block_size=64 * chunk_size)
+
+
 def _get_suffixes(path: Path) -> str:
     """Extract and check suffixes."""
     if "".join(path.suffixes[-1:]).lower() in [".hdf5", ".csv"]:
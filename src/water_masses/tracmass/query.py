@@ -0,0 +1,375 @@
+# -*- coding: utf-8 -*-
+"""Select trajectories by region and time, chunk by chunk.
+
+Row predicates (:class:`Box`, :class:`Mask`, :class:`TimeWindow`, combined
+with ``&``, ``|`` and ``~``) are evaluated per row. Conditions quantify them
+per trajectory: :func:`ever` (a row of the trajectory matches, e.g. it passes
+through a region), :func:`never` and :func:`always`. A :class:`Query` selects
+the trajectories meeting all its conditions in two streaming passes:
+
+1. the ids meeting the conditions are collected chunk by chunk,
+2. the rows of these ids are extracted chunk by chunk.
+
+Memory is hence bounded by the chunk size and the number of ids, never by the
+number of rows. Positions are matched as cells numbered as in
+:mod:`water_masses.tracmass.aggregate`: with ``offset=1`` cell `n` spans the
+positions `n - 1` to `n`.
+
+For example, trajectories passing through a box in winter but never
+leaving the shelf::
+
+    query = Query(
+        ever(Box(i=(700, 720), j=(590, 600)) & TimeWindow(months=(12, 1, 2))),
+        never(~Mask(shelf)),
+    )
+    df = query.rows("tests_run.csv")
+
+"""
+
+from abc import ABC, abstractmethod
+from datetime import datetime
+from pathlib import Path
+from typing import (
+    TYPE_CHECKING,
+    Callable,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+    cast,
+)
+
+import numpy as np
+import pandas as pd
+
+from ..constants import Timespan
+from . import trajectory_time
+from .io import iter_tracmass_file
+from .table import COLUMN_TYPES, TrajectoryTable
+
+if TYPE_CHECKING:  # pragma: no cover
+    import vaex
+    import xarray as xr
+
+Source = Union[
+    str,
+    Path,
+    pd.DataFrame,
+    TrajectoryTable,
+    "vaex.dataframe.DataFrame",
+    Callable[[], Iterable[pd.DataFrame]],
+]
+
+Bounds = Optional[Tuple[int, int]]
+
+
+class Predicate(ABC):
+    """Row predicate, combine with ``&``, ``|`` and ``~``."""
+
+    @abstractmethod
+    def mask(self, chunk: pd.DataFrame, epoch: datetime) -> np.ndarray:
+        """Boolean mask of the matching rows of a chunk."""
+
+    def __and__(self, other: "Predicate") -> "Predicate":
+        return _Combined(np.logical_and, self, other)
+
+    def __or__(self, other: "Predicate") -> "Predicate":
+        return _Combined(np.logical_or, self, other)
+
+    def __invert__(self) -> "Predicate":
+        return _Not(self)
+
+
+class _Combined(Predicate):
+    def __init__(self, ufunc: np.ufunc, *predicates: Predicate) -> None:
+        self.ufunc = ufunc
+        self.predicates = predicates
+
+    def mask(self, chunk: pd.DataFrame, epoch: datetime) -> np.ndarray:
+        return self.ufunc.reduce(
+            [predicate.mask(chunk, epoch) for predicate in self.predicates]
+        )
+
+
+class _Not(Predicate):
+    def __init__(self, predicate: Predicate) -> None:
+        self.predicate = predicate
+
+    def mask(self, chunk: pd.DataFrame, epoch: datetime) -> np.ndarray:
+        return ~self.predicate.mask(chunk, epoch)
+
+
+def _cells(chunk: pd.DataFrame, dim: str, offset: int) -> np.ndarray:
+    return np.floor(chunk[dim].values).astype(np.int64) + offset
+
+
+class Box(Predicate):
+    """Rows within ranges of cell numbers.
+
+    Parameter
+    =========
+    i, j, k : tuple of int
+        First and last (inclusive) cell along the dimension, None for all.
+    offset : int
+        Added to the floored positions to get cell numbers.
+
+    """
+
+    def __init__(
+        self, i: Bounds = None, j: Bounds = None, k: Bounds = None, offset: int = 1
+    ) -> None:
+        """Store the bounds."""
+        self.bounds = {
+            dim: bounds for dim, bounds in zip("ijk", (i, j, k)) if bounds is not None
+        }
+        self.offset = offset
+
+    def mask(self, chunk: pd.DataFrame, epoch: datetime) -> np.ndarray:
+        """Rows within all bounds."""
+        result = np.ones(len(chunk), dtype=bool)
+        for dim, (first, last) in self.bounds.items():
+            cells = _cells(chunk, dim, self.offset)
+            result &= (cells >= first) & (cells <= last)
+        return result
+
+
+class Mask(Predicate):
+    """Rows in the cells where a mask on the model grid is true.
+
+    Parameter
+    =========
+    mask : np.ndarray or xr.DataArray
+        Boolean mask `(nj, ni)` or `(nk, nj, ni)`, indexed by the cell number
+        minus `offset`. Rows outside the mask do not match.
+    offset : int
+        Added to the floored positions to get cell numbers.
+
+    """
+
+    def __init__(
+        self, mask: Union[np.ndarray, "xr.DataArray"], offset: int = 1
+    ) -> None:
+        """Store the mask."""
+        self.values = np.asarray(mask, dtype=bool)
+        if self.values.ndim not in {2, 3}:
+            raise ValueError("The mask must be (nj, ni) or (nk, nj, ni).")
+        self.offset = offset
+
+    def mask(self, chunk: pd.DataFrame, epoch: datetime) -> np.ndarray:
+        """Rows in true cells."""
+        dims = ["k", "j", "i"][-self.values.ndim :]
+        index = [_cells(chunk, dim, self.offset) - self.offset for dim in dims]
+        inside = np.logical_and.reduce(
+            [(idx >= 0) & (idx < size) for idx, size in zip(index, self.values.shape)]
+        )
+        result = np.zeros(len(chunk), dtype=bool)
+        result[inside] = self.values[tuple(idx[inside] for idx in index)]
+        return result
+
+
+class TimeWindow(Predicate):
+    """Rows within a time range and/or months.
+
+    Parameter
+    =========
+    start, end : datetime64 or str
+        Start (inclusive) and end (exclusive) of the window.
+    months : sequence of int
+        Months (1 to 12), e.g. ``(12, 1, 2)`` for winters.
+
+    """
+
+    def __init__(
+        self,
+        start: Union[None, str, np.datetime64] = None,
+        end: Union[None, str, np.datetime64] = None,
+        months: Optional[Sequence[int]] = None,
+    ) -> None:
+        """Store the window."""
+        self.start = None if start is None else np.datetime64(start, "s")
+        self.end = None if end is None else np.datetime64(end, "s")
+        self.months = None if months is None else np.asarray(months)
+
+    def mask(self, chunk: pd.DataFrame, epoch: datetime) -> np.ndarray:
+        """Rows within the window."""
+        time = chunk["time"].values.astype(np.int64)
+        result = np.ones(len(chunk), dtype=bool)
+        if self.start is not None:
+            result &= time >= trajectory_time.from_datetime64(self.start, epoch)
+        if self.end is not None:
+            result &= time < trajectory_time.from_datetime64(self.end, epoch)
+        if self.months is not None:
+            _, month = trajectory_time.year_month(time, epoch)
+            result &= np.isin(month, self.months)
+        return result
+
+
+class Condition(object):
+    """Per trajectory quantifier of a row predicate."""
+
+    def __init__(self, predicate: Predicate, quantifier: str) -> None:
+        """Use :func:`ever`, :func:`never` or :func:`always`."""
+        self.predicate = predicate
+        self.quantifier = quantifier
+
+
+def ever(predicate: Predicate) -> Condition:
+    """Trajectories with at least one matching row."""
+    return Condition(predicate, "ever")
+
+
+def never(predicate: Predicate) -> Condition:
+    """Trajectories without matching rows."""
+    return Condition(predicate, "never")
+
+
+def always(predicate: Predicate) -> Condition:
+    """Trajectories with matching rows only."""
+    return Condition(~predicate, "never")
+
+
+class Query(object):
+    """Trajectories meeting all conditions.
+
+    Parameter
+    =========
+    conditions : Condition
+        Conditions per trajectory, see :func:`ever`, :func:`never` and
+        :func:`always`.
+    rows : Predicate
+        Only extract the matching rows of the selected trajectories.
+    epoch : datetime
+        Reference date of `time`, defaults to the epoch of trajectory tables
+        or the end of the experiment.
+    chunk_size : int
+        Rows per chunk.
+
+    """
+
+    def __init__(
+        self,
+        *conditions: Condition,
+        rows: Optional[Predicate] = None,
+        epoch: Optional[datetime] = None,
+        chunk_size: int = 1 << 22,
+    ) -> None:
+        """Store the conditions."""
+        self.conditions = conditions
+        self.row_predicate = rows
+        self.epoch = epoch
+        self.chunk_size = chunk_size
+
+    def ids(self, trajectories: Source) -> np.ndarray:
+        """Sorted ids of the trajectories meeting all conditions (first pass)."""
+        epoch = self._epoch(trajectories)
+        seen: List[np.ndarray] = []
+        matched: List[List[np.ndarray]] = [[] for _ in self.conditions]
+        for chunk in _chunks(trajectories, self.chunk_size):
+            ids = chunk["id"].values
+            seen.append(np.unique(ids))
+            for number, condition in enumerate(self.conditions):
+                mask = condition.predicate.mask(chunk, epoch)
+                matched[number].append(np.unique(ids[mask]))
+        selected = _unique(seen)
+        for condition, chunk_ids in zip(self.conditions, matched):
+            ids = _unique(chunk_ids)
+            if condition.quantifier == "ever":
+                selected = np.intersect1d(selected, ids, assume_unique=True)
+            else:
+                selected = np.setdiff1d(selected, ids, assume_unique=True)
+        return selected
+
+    def iter_rows(
+        self, trajectories: Source, ids: Optional[np.ndarray] = None
+    ) -> Iterator[pd.DataFrame]:
+        """Stream the rows of the selected trajectories (second pass).
+
+        The ids are collected with :meth:`ids` unless given.
+
+        """
+        if ids is None:
+            ids = self.ids(trajectories)
+        ids = np.sort(np.asarray(ids))
+        epoch = self._epoch(trajectories)
+        for chunk in _chunks(trajectories, self.chunk_size):
+            keep = _isin_sorted(chunk["id"].values, ids)
+            if self.row_predicate is not None:
+                keep &= self.row_predicate.mask(chunk, epoch)
+            if keep.any():
+                yield chunk[keep]
+
+    def rows(
+        self, trajectories: Source, ids: Optional[np.ndarray] = None
+    ) -> pd.DataFrame:
+        """Rows of the selected trajectories as flat DataFrame.
+
+        Without selected rows the result is empty, with the columns of the
+        source, or of TRACMASS output if the source has no rows at all.
+
+        """
+        chunks = list(self.iter_rows(trajectories, ids))
+        if chunks:
+            return pd.concat(chunks, ignore_index=True)
+        first = next(iter(_chunks(trajectories, self.chunk_size)), None)
+        return _empty_rows() if first is None else first.iloc[:0]
+
+    def _epoch(self, trajectories: Source) -> datetime:
+        if self.epoch is not None:
+            return self.epoch
+        if isinstance(trajectories, TrajectoryTable):
+            return trajectories.epoch
+        return Timespan().end
+
+
+def _unique(arrays: List[np.ndarray]) -> np.ndarray:
+    """Sorted unique values of per chunk arrays, concatenated once."""
+    if not arrays:
+        return np.array([], dtype=np.int64)
+    return np.unique(np.concatenate(arrays))
+
+
+def _empty_rows() -> pd.DataFrame:
+    """Flat DataFrame without rows with the columns of TRACMASS output."""
+    return pd.DataFrame(
+        {
+            name: np.array([], dtype=type_.to_pandas_dtype())
+            for name, type_ in COLUMN_TYPES.items()
+        }
+    ).astype({"time": np.int64})
+
+
+def _isin_sorted(values: np.ndarray, sorted_ids: np.ndarray) -> np.ndarray:
+    """``np.isin`` for sorted unique `sorted_ids` by binary search."""
+    if not len(sorted_ids):
+        return np.zeros(len(values), dtype=bool)
+    position = np.minimum(np.searchsorted(sorted_ids, values), len(sorted_ids) - 1)
+    return sorted_ids[position] == values
+
+
+def _chunks(trajectories: Source, chunk_size: int) -> Iterable[pd.DataFrame]:
+    """Fresh iterable of flat chunks, sources are read once per pass."""
+    if isinstance(trajectories, (str, Path)):
+        return iter_tracmass_file(Path(trajectories), chunk_size=chunk_size)
+    if isinstance(trajectories, pd.DataFrame):
+        if any(name is not None for name in trajectories.index.names):
+            trajectories = trajectories.reset_index()
+        return (
+            trajectories.iloc[start : start + chunk_size]
+            for start in range(0, max(len(trajectories), 1), chunk_size)
+        )
+    if isinstance(trajectories, TrajectoryTable):
+        return (
+            batch.to_pandas()
+            for batch in trajectories.table.to_batches(max_chunksize=chunk_size)
+        )
+    if hasattr(trajectories, "to_arrow_table"):
+        # vaex DataFrame (which is callable as well)
+        df = cast("vaex.dataframe.DataFrame", trajectories)
+        return (
+            table.to_pandas(split_blocks=True)
+            for _, _, table in df.to_arrow_table(chunk_size=chunk_size)
+        )
+    return trajectories()
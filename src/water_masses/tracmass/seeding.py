@@ -1,12 +1,15 @@
 # -*- coding: utf-8 -*-
 """Create seeding file for Tracmass."""
 from pathlib import Path
-from typing import Optional, Union, List, Tuple, Dict
+from typing import TYPE_CHECKING, Optional, Union, List, Tuple, Dict
 import io
 
-import cf_xarray as cfxr  # noqa
 import numpy as np
-import xarray as xr
+
+if TYPE_CHECKING:  # pragma: no cover
+    import xarray as xr
+
+    from ..grid import Grid
 
 
 def seed_patch(
@@ -110,17 +113,26 @@ def seed_horizontal_diagonal(
     y0: float,
     x1: float,
     y1: float,
-    da: xr.DataArray,
+    da: "xr.DataArray",
     flow_direction: Dict[str, int],
     nyq: int = 3,
     experiment_name: Optional[str] = "diagonal",
     file_target_dir: Optional[Path] = None,
+    grid: Optional["Grid"] = None,
 ) -> List[Tuple[int, int]]:
-    """Create a seed file for a horizontal diagonal seeding line."""
+    """Create a seed file for a horizontal diagonal seeding line.
+
+    Spacing and index lookups are taken from `grid`, defaults to the cached
+    grid of `da`, see :class:`water_masses.grid.Grid`.
+
+    """
+    from ..grid import get_grid
+
     if x1 < x0:
         raise ValueError("x1 needs to be equal to, or east of x0.")
-    xi, yi = _interpolate_on_step_function(x0, y0, x1, y1, da, nyq)
-    coords = _step_function_gridbox_coords(xi, yi, da)
+    grid = get_grid(da, grid)
+    xi, yi = _interpolate_on_step_function(x0, y0, x1, y1, da, nyq, grid)
+    coords = _step_function_gridbox_coords(xi, yi, da, grid)
     if file_target_dir is not None:
         seedfile = f"seed_{experiment_name}.txt"
         seedfile = str(file_target_dir.joinpath(seedfile))
@@ -171,9 +183,13 @@ def _interpolate_on_step_function(
     y0: float,
     x1: float,
     y1: float,
-    da: xr.DataArray,
+    da: "xr.DataArray",
     nyq: int,
+    grid: Optional["Grid"] = None,
 ) -> Tuple[np.ndarray, np.ndarray]:
+    from ..grid import get_grid
+
+    spacing = get_grid(da, grid).spacing
     num = int(
         np.max(
             [
@@ -181,7 +197,7 @@ def _interpolate_on_step_function(
                 for start, end, delta in zip(
                     [x0, y0],
                     [x1, y1],
-                    [np.mean(np.diff(da.cf[dim])) for dim in ["longitude", "latitude"]],
+                    [spacing[dim] for dim in ["longitude", "latitude"]],
                 )
             ],
         ),
@@ -196,23 +212,19 @@ def _interpolate_on_step_function(
 def _step_function_gridbox_coords(
     xi: np.ndarray,
     yi: np.ndarray,
-    da: xr.DataArray,
+    da: "xr.DataArray",
+    grid: Optional["Grid"] = None,
 ) -> List[Tuple[int, int]]:
     """Calculate unique coordinates of gridboxed of the seeding step-function."""
-    coords = [
-        (
-            float(da.cf[coord].cf.sel(**{coord: value, "method": "nearest"}).values)
-            for coord, value in zip(["longitude", "latitude"], [lon, lat])
-        )
-        for lon, lat in zip(xi, yi)
-    ]
-    coords = [
-        (
-            index(da, "longitude", x),
-            index(da, "latitude", y),
+    from ..grid import get_grid
+
+    grid = get_grid(da, grid)
+    coords = list(
+        zip(
+            grid.nearest("longitude", xi).tolist(),
+            grid.nearest("latitude", yi).tolist(),
         )
-        for x, y in coords
-    ]
+    )
     coords = sorted(
         set(coords),
         key=lambda x: (x[0], x[1] * 1 if yi[-1] >= yi[0] else -1),
@@ -233,8 +245,22 @@ def _step_function_gridbox_coords(
     )
 
 
-def index(ds: Union[xr.DataArray, xr.Dataset], dim: str, loc: float) -> int:
-    """Look up nearest index given a location."""
+def index(
+    ds: Union["xr.DataArray", "xr.Dataset"],
+    dim: str,
+    loc: float,
+    grid: Optional["Grid"] = None,
+) -> int:
+    """Look up nearest index given a location, in the lookup table of `grid`.
+
+    With `grid`, `dim` is looked up by its CF role, see
+    :func:`water_masses.grid.cf_role`.
+
+    """
+    if grid is not None:
+        from ..grid import cf_role
+
+        return int(grid.nearest(cf_role(ds, dim), loc)[0])
     islocarr = ds[dim] != ds.sel(**{dim: loc}, method="nearest")[dim]
     notloc = True
     i = 0
@@ -245,10 +271,20 @@ def index(ds: Union[xr.DataArray, xr.Dataset], dim: str, loc: float) -> int:
 
 
 def convert(
-    da: xr.DataArray,
+    da: "xr.DataArray",
     idx: Union[float, np.ndarray],
+    grid: Optional["Grid"] = None,
 ) -> Union[float, np.ndarray]:
-    """Convert index to coordinate."""
+    """Convert index to coordinate, with the bounds of `grid` if given.
+
+    With `grid`, the coordinate `da` is looked up by its CF role, see
+    :func:`water_masses.grid.cf_role`.
+
+    """
+    if grid is not None:
+        from ..grid import cf_role
+
+        return grid.to_coordinate(cf_role(da, str(da.name)), idx)
     mi = da.min().values
     ma = da.max().values
     le = len(da)
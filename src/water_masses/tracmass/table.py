@@ -0,0 +1,268 @@
+# -*- coding: utf-8 -*-
+"""Arrow backed table of trajectories.
+
+The :class:`TrajectoryTable` is the common exchange format between
+:mod:`water_masses.tracmass.io`, :mod:`water_masses.spgsi` and
+:mod:`water_masses.filter_month`. Columns are kept as flat, contiguous Arrow
+arrays, hence conversions to pandas, vaex and NumPy do not copy the data when
+a column has a single chunk and no missing values. Time is stored as int64
+seconds relative to an epoch, by default the end of the experiment
+(:attr:`water_masses.constants.Timespan.end`), as written by TRACMASS.
+
+Requires `pyarrow`.
+"""
+
+from datetime import datetime
+from pathlib import Path
+from typing import (
+    TYPE_CHECKING,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Union,
+)
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from pyarrow import compute as pc
+from pyarrow import csv
+
+from ..constants import Timespan
+
+if TYPE_CHECKING:  # pragma: no cover
+    import vaex
+
+#: Columns of TRACMASS output files, in file order.
+COLUMNS = ["id", "i", "j", "k", "subvol", "time"]
+
+#: Types of the columns when read from CSV, time may be written as float.
+COLUMN_TYPES = {
+    "id": pa.int64(),
+    "i": pa.float64(),
+    "j": pa.float64(),
+    "k": pa.float64(),
+    "subvol": pa.float64(),
+    "time": pa.float64(),
+}
+
+
+class TrajectoryTable(object):
+    """Trajectories backed by an Arrow table."""
+
+    def __init__(self, table: pa.Table, epoch: Optional[datetime] = None) -> None:
+        """Wrap an Arrow table.
+
+        Parameter
+        =========
+        table : pa.Table
+            Trajectories, the column `time` holds seconds relative to `epoch`
+            and is cast to int64 if required.
+        epoch : datetime
+            Reference date of `time`, defaults to the end of the experiment.
+
+        """
+        self.epoch = epoch if epoch is not None else Timespan().end
+        self.table = _int64_time(table)
+
+    def __len__(self) -> int:
+        """Number of rows."""
+        return self.table.num_rows
+
+    def __repr__(self) -> str:
+        """Short summary."""
+        return f"TrajectoryTable(rows={len(self)}, columns={self.column_names})"
+
+    @property
+    def column_names(self) -> List[str]:
+        """Names of the columns."""
+        return self.table.column_names
+
+    @classmethod
+    def from_pandas(
+        cls, df: pd.DataFrame, epoch: Optional[datetime] = None
+    ) -> "TrajectoryTable":
+        """Create table from a pandas DataFrame.
+
+        Index levels (e.g. `id` of :func:`water_masses.filter_month.open_dataset`)
+        become columns, the derived `date` is dropped in favour of `time`.
+
+        """
+        if any(name is not None for name in df.index.names):
+            df = df.reset_index()
+        df = df.drop(columns=["date"], errors="ignore")
+        return cls(pa.Table.from_pandas(df, preserve_index=False), epoch=epoch)
+
+    @classmethod
+    def from_vaex(
+        cls, df: "vaex.dataframe.DataFrame", epoch: Optional[datetime] = None
+    ) -> "TrajectoryTable":
+        """Create table from a vaex DataFrame."""
+        return cls(df.to_arrow_table(), epoch=epoch)
+
+    @classmethod
+    def from_csv(
+        cls,
+        filepath: Union[str, Path],
+        usecols: Sequence[int] = (0, 1, 2, 3, 4, 5),
+        names: Sequence[str] = COLUMNS,
+        epoch: Optional[datetime] = None,
+    ) -> "TrajectoryTable":
+        """Read a headerless TRACMASS CSV (or CSV.gz) file with the Arrow reader.
+
+        Parameter
+        =========
+        filepath : str or Path
+            Path to the file.
+        usecols : sequence of int
+            Positions of the columns to read.
+        names : sequence of str
+            Names of the columns at the positions `usecols`.
+
+        """
+        table = csv.read_csv(
+            str(filepath),  # compression is inferred from the suffix
+            read_options=csv.ReadOptions(autogenerate_column_names=True),
+            convert_options=_convert_options(usecols, names),
+        )
+        return cls(table.rename_columns(list(names)), epoch=epoch)
+
+    @classmethod
+    def concat(cls, tables: Iterable["TrajectoryTable"]) -> "TrajectoryTable":
+        """Concatenate tables with the same columns and epoch.
+
+        Columns are cast to the types of the first table, the data of columns
+        of equal type is not copied.
+
+        """
+        tables = list(tables)
+        schema = tables[0].table.schema
+        return cls(
+            pa.concat_tables([table.table.cast(schema) for table in tables]),
+            epoch=tables[0].epoch,
+        )
+
+    def to_pandas(self) -> pd.DataFrame:
+        """Convert to a flat pandas DataFrame, zero-copy where dtypes allow."""
+        return self.table.to_pandas(split_blocks=True)
+
+    def to_vaex(self) -> "vaex.dataframe.DataFrameLocal":
+        """Convert to a vaex DataFrame without copying."""
+        import vaex
+
+        return vaex.from_arrow_table(self.table)
+
+    def to_numpy(self, column: str) -> np.ndarray:
+        """Column as NumPy array.
+
+        A single chunk of numbers without nulls is returned as read-only view of
+        the Arrow buffer. Other columns, e.g. concatenated from several tables,
+        are copied.
+
+        """
+        array = self.table.column(column)
+        if (
+            array.num_chunks == 1
+            and array.null_count == 0
+            and (pa.types.is_integer(array.type) or pa.types.is_floating(array.type))
+        ):
+            return array.chunk(0).to_numpy(zero_copy_only=True)
+        return array.to_numpy()
+
+    def to_dict(self, columns: Optional[Sequence[str]] = None) -> Dict[str, np.ndarray]:
+        """Columns as NumPy arrays, see :meth:`to_numpy`."""
+        return {
+            column: self.to_numpy(column)
+            for column in (columns if columns is not None else self.column_names)
+        }
+
+    def dates(self) -> np.ndarray:
+        """Absolute dates of `time` as datetime64[s]."""
+        return np.datetime64(self.epoch, "s") + self.to_numpy("time").astype(
+            "timedelta64[s]"
+        )
+
+    def to_frame(self, index: Sequence[str] = ("id", "date")) -> pd.DataFrame:
+        """Convert to pandas with a `date` column and the given index.
+
+        The default gives the `(id, date)` MultiIndex frames used by
+        :mod:`water_masses.filter_month` and :func:`water_masses.spgsi.assign2trj`.
+
+        """
+        df = self.to_pandas()
+        df["date"] = self.dates().astype("datetime64[ns]")
+        return df.set_index(list(index)) if index else df
+
+
+def iter_csv(
+    filepath: Union[str, Path],
+    usecols: Sequence[int] = (0, 1, 2, 3, 4, 5),
+    names: Sequence[str] = COLUMNS,
+    block_size: int = 1 << 24,
+) -> Iterator[pd.DataFrame]:
+    """Stream a headerless TRACMASS CSV (or CSV.gz) file in flat batches.
+
+    Time is converted as by :class:`TrajectoryTable`, an empty file has no
+    batches.
+
+    Parameter
+    =========
+    filepath : str or Path
+        Path to the file.
+    usecols : sequence of int
+        Positions of the columns to read.
+    names : sequence of str
+        Names of the columns at the positions `usecols`.
+    block_size : int
+        Approximate size of a batch in bytes of CSV.
+
+    """
+    if _is_empty(filepath):
+        return
+    reader = csv.open_csv(
+        str(filepath),
+        read_options=csv.ReadOptions(
+            autogenerate_column_names=True, block_size=block_size
+        ),
+        convert_options=_convert_options(usecols, names),
+    )
+    for batch in reader:
+        table = pa.Table.from_batches([batch]).rename_columns(list(names))
+        yield _int64_time(table).to_pandas()
+
+
+def _is_empty(filepath: Union[str, Path]) -> bool:
+    """Whether the (decompressed) file has no content, Arrow cannot open it."""
+    with pa.input_stream(str(filepath)) as stream:
+        return not stream.read(1)
+
+
+def _int64_time(table: pa.Table) -> pa.Table:
+    """Cast `time` to int64 seconds, floating point times are rounded."""
+    if "time" not in table.column_names:
+        return table
+    time = table.column("time")
+    if time.type == pa.int64():
+        return table
+    if pa.types.is_floating(time.type):
+        time = pc.round(time)
+    return table.set_column(
+        table.column_names.index("time"), "time", time.cast(pa.int64())
+    )
+
+
+def _convert_options(
+    usecols: Sequence[int], names: Sequence[str]
+) -> csv.ConvertOptions:
+    """Select columns and fix the types of the known ones."""
+    return csv.ConvertOptions(
+        include_columns=[f"f{col}" for col in usecols],
+        column_types={
+            f"f{col}": COLUMN_TYPES[name]
+            for col, name in zip(usecols, names)
+            if name in COLUMN_TYPES
+        },
+    )
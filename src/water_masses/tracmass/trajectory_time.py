@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+"""Vectorized time handling of trajectories.
+
+Time is kept as int64 seconds relative to an epoch (TRACMASS writes seconds
+relative to :attr:`water_masses.constants.Timespan.end`). Per trajectory
+reductions sort the rows by id once and reduce contiguous segments with
+``ufunc.reduceat``, calendar keys are derived arithmetically from
+``datetime64`` without creating Python date objects.
+"""
+
+from datetime import datetime
+from typing import Optional, Tuple, Union
+
+import numpy as np
+
+SECONDS_PER_DAY = 86400
+
+
+def segments(
+    ids: np.ndarray,
+) -> Tuple[Optional[np.ndarray], np.ndarray, np.ndarray]:
+    """Sort order, segment starts and unique ids of an id column.
+
+    Returns
+    =======
+    order : np.ndarray
+        Stable permutation sorting `ids`, ``None`` if `ids` is already sorted.
+    starts : np.ndarray
+        Position of the first row of each id in the sorted data.
+    unique : np.ndarray
+        Ids in sorted order.
+
+    """
+    ids = np.asarray(ids)
+    order = None
+    if len(ids) > 1 and np.any(ids[1:] < ids[:-1]):
+        order = np.argsort(ids, kind="stable")
+        ids = ids[order]
+    starts = np.flatnonzero(np.r_[True, ids[1:] != ids[:-1]]) if len(ids) else ids
+    return order, starts.astype(np.intp), ids[starts]
+
+
+def reduce_by_id(
+    ids: np.ndarray,
+    values: np.ndarray,
+    ufunc: np.ufunc = np.maximum,
+    broadcast: bool = True,
+) -> np.ndarray:
+    """Reduce `values` per trajectory with a sorted-segment ``reduceat``.
+
+    Parameter
+    =========
+    ids : np.ndarray
+        Trajectory id of each row.
+    values : np.ndarray
+        Values of each row.
+    ufunc : np.ufunc
+        Binary ufunc used for the reduction, e.g. np.maximum, np.minimum, np.add.
+    broadcast : bool
+        If True (default) return the reduction for each row, otherwise one
+        value per unique id in ascending id order.
+
+    """
+    values = np.asarray(values)
+    if not len(values):
+        return values
+    order, starts, _ = segments(ids)
+    reduced = ufunc.reduceat(values if order is None else values[order], starts)
+    if not broadcast:
+        return reduced
+    counts = np.diff(np.r_[starts, len(values)])
+    per_row = np.repeat(reduced, counts)
+    if order is None:
+        return per_row
+    result = np.empty_like(per_row)
+    result[order] = per_row
+    return result
+
+
+def init_time(ids: np.ndarray, time: np.ndarray) -> np.ndarray:
+    """Initialization time of each row's trajectory, the latest time of its id.
+
+    TRACMASS backward runs start at the latest time of a trajectory.
+
+    """
+    return reduce_by_id(ids, time, np.maximum)
+
+
+def to_datetime64(time: np.ndarray, epoch: datetime) -> np.ndarray:
+    """Seconds relative to `epoch` as datetime64[s]."""
+    return np.datetime64(epoch, "s") + np.asarray(time).astype("timedelta64[s]")
+
+
+def from_datetime64(
+    dates: Union[np.datetime64, np.ndarray], epoch: datetime
+) -> np.ndarray:
+    """Datetime64 value(s) as int64 seconds relative to `epoch`."""
+    return (
+        np.asarray(dates).astype("datetime64[s]") - np.datetime64(epoch, "s")
+    ).astype(np.int64)
+
+
+def floor_day(time: np.ndarray, epoch: datetime) -> np.ndarray:
+    """Floor seconds relative to `epoch` to midnight."""
+    offset = from_datetime64(np.datetime64(epoch, "D"), epoch)
+    time = np.asarray(time, dtype=np.int64)
+    return (time - offset) // SECONDS_PER_DAY * SECONDS_PER_DAY + offset
+
+
+def year_month_key(time: np.ndarray, epoch: datetime) -> np.ndarray:
+    """Integer year-month key ``12 * year + month - 1``."""
+    months = to_datetime64(time, epoch).astype("datetime64[M]").astype(np.int64)
+    return months + 12 * 1970
+
+
+def year_month(time: np.ndarray, epoch: datetime) -> Tuple[np.ndarray, np.ndarray]:
+    """Year and month (1 to 12) of seconds relative to `epoch`."""
+    key = year_month_key(time, epoch)
+    return key // 12, key % 12 + 1
@@ -1,10 +1,51 @@
+from functools import lru_cache
+from typing import TYPE_CHECKING, Optional, Tuple
+
+import numpy as np
 import xarray as xr
 
+if TYPE_CHECKING:  # pragma: no cover
+    from .grid import Grid
+
+
+def roll(
+    ds: xr.Dataset,
+    dim: str = "longitude",
+    lon_min: float = -180,
+    grid: Optional["Grid"] = None,
+) -> xr.Dataset:
+    """Rolls data to `lon_min:lon_min + 360` longitude format, default -180:180.
+
+    The permutation is applied as a single (lazy) indexing step, so the
+    chunk layout of dask backed data is kept and the data is not copied
+    before it is computed. Longitudes that map onto the same location, e.g.
+    0 and 360, are only kept once. With the :class:`water_masses.grid.Grid` of
+    `ds` the permutation is looked up without hashing the longitudes.
+
+    """
+    if grid is not None:
+        index, wrapped = grid.roll_index(lon_min)
+    else:
+        index, wrapped = _roll_index(tuple(ds[dim].values.tolist()), lon_min)
+    ds = ds.isel(**{dim: index})
+    return ds.assign_coords({dim: (dim, wrapped, ds[dim].attrs)})
+
+
+@lru_cache(maxsize=32)
+def _roll_index(
+    longitude: Tuple[float, ...], lon_min: float
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Calculate permutation index and wrapped longitudes of a longitude axis.
+
+    Cached, as data sets on the same grid share the permutation. Only
+    longitudes outside `lon_min:lon_min + 360` are wrapped, the others are kept
+    bit for bit, so rolled data still aligns with unrolled data on the grid.
 
-def roll(ds: xr.Dataset, dim="longitude") -> xr.Dataset:
-    """Rolls data to -180:180 longitude format."""
-    ds_east = ds.sel(**{dim: slice(180, 360)})
-    ds_east = ds_east.assign_coords({dim: (ds_east[dim] - 360)})
-    ds_west = ds.sel(**{dim: slice(0, 180)})
-    ds = xr.concat([ds_east, ds_west], dim=dim)
-    return ds
+    """
+    wrapped = np.array(longitude, dtype=float)
+    outside = (wrapped < lon_min) | (wrapped >= lon_min + 360)
+    wrapped[outside] = (wrapped[outside] - lon_min) % 360 + lon_min
+    wrapped, index = np.unique(wrapped, return_index=True)
+    index.setflags(write=False)
+    wrapped.setflags(write=False)
+    return index, wrapped
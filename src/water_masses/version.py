@@ -1,13 +1,13 @@
 # -*- coding: utf-8 -*-
 
-import pkg_resources
+from importlib import metadata
 
 
 def _get_version(dist_name: str) -> str:  # pragma: no cover
     """Fetches distribution name. Contains a fix for Sphinx."""
     try:
-        return pkg_resources.get_distribution(dist_name).version
-    except pkg_resources.DistributionNotFound:
+        return metadata.version(dist_name)
+    except metadata.PackageNotFoundError:
         return ""  # readthedocs can not install `poetry` projects
 
 
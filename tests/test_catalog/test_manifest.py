@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+
+from water_masses import catalog, processing
+
+
+@pytest.fixture
+def files(tmp_path):
+    """Daily files with packed salinity, one with different time units."""
+    rng = np.random.default_rng(0)
+    paths = []
+    for number, day in enumerate(pd.date_range("2000-02-27", periods=5, freq="D")):
+        salinity = 35 + rng.normal(size=(1, 2, 3, 4))
+        salinity[..., 0, 0] = np.nan
+        ds = xr.Dataset(
+            {"so": (("time", "depth", "latitude", "longitude"), salinity)},
+            coords={
+                "time": [day + pd.Timedelta(12, "h")],
+                "depth": [0.0, 10.0],
+                "latitude": (
+                    "latitude",
+                    [50.0, 51.0, 52.0],
+                    {"units": "degrees_north"},
+                ),
+                "longitude": ("longitude", np.arange(4.0), {"units": "degrees_east"}),
+            },
+            attrs={"title": "test"},
+        )
+        units = "days since 2000-01-01" if number == 3 else "hours since 1950-01-01"
+        path = tmp_path.joinpath(f"sal_dm_{day:%Y%m%d}.nc")
+        ds.to_netcdf(
+            path,
+            encoding={
+                "so": {
+                    "dtype": "int16",
+                    "scale_factor": np.float32(0.001),
+                    "add_offset": 30.0,
+                    "_FillValue": -32767,
+                },
+                "time": {"units": units},
+            },
+        )
+        paths.append(path)
+    return paths
+
+
+def _expected(files):
+    """The files opened with ``open_mfdataset``."""
+    return xr.open_mfdataset(
+        [str(path) for path in files], combine="by_coords"
+    ).compute()
+
+
+def test_manifest_matches_open_mfdataset(files, tmp_path):
+    """A manifest round tripped through JSON opens as ``open_mfdataset``."""
+    manifest = catalog.Manifest.build(str(tmp_path.joinpath("sal_dm_*.nc")))
+    manifest.to_json(tmp_path.joinpath("manifest.json"))
+    loaded = catalog.Manifest.from_json(tmp_path.joinpath("manifest.json"))
+
+    for chunks in (None, {"time": 2, "latitude": 2}):
+        ds = loaded.to_dataset(chunks=chunks)
+        assert ds.so.chunks is not None
+        xr.testing.assert_identical(ds.compute(), _expected(files))
+    assert loaded.to_dataset(chunks={"time": 2}).so.chunks[0] == (2, 2, 1)
+
+
+def test_manifest_is_current(files, tmp_path):
+    """Modified or moved files make the manifest outdated."""
+    pattern = str(tmp_path.joinpath("sal_dm_*.nc"))
+    manifest = catalog.Manifest.build(pattern)
+    assert manifest.is_current()
+
+    os.utime(files[0], ns=(0, 0))
+    assert not manifest.is_current()
+    manifest = catalog.Manifest.build(pattern)
+    files[-1].rename(tmp_path.joinpath("other.nc"))
+    assert not manifest.is_current()
+
+
+def test_block_reader_prefetches(files, tmp_path):
+    """Blocks following the requested one are read ahead."""
+    manifest = catalog.Manifest.build([str(path) for path in files])
+    reader = catalog.BlockReader(manifest, prefetch=2)
+    blocks = [reader.read("so", (block, 0, 0, 0)) for block in range(5)]
+
+    assert reader.prefetched == 4
+    raw = xr.open_mfdataset(
+        [str(path) for path in files], combine="by_coords", mask_and_scale=False
+    )
+    np.testing.assert_array_equal(np.concatenate(blocks), raw.so.values)
+
+
+def test_iter_chunks(files, tmp_path):
+    """Chunks along time are computed in order."""
+    manifest = catalog.Manifest.build([str(path) for path in files])
+    ds = manifest.to_dataset(chunks={"time": 2})
+
+    chunks = list(catalog.iter_chunks(ds.so, prefetch=2))
+
+    assert [len(chunk.time) for chunk in chunks] == [2, 2, 1]
+    assert all(chunk.chunks is None for chunk in chunks)
+    xr.testing.assert_identical(xr.concat(chunks, "time"), ds.so.compute())
+
+
+def test_open_sss_from_manifest(files, tmp_path, monkeypatch):
+    """The catalog source is opened from a manifest built once."""
+    home = tmp_path.joinpath("home")
+    directory = home.joinpath("data", "test", "external", "copernicus", "SAL", "dm")
+    directory.mkdir(parents=True)
+    for number, path in enumerate(files):
+        path.rename(directory.joinpath(f"metoffice_foam1_amm7_NWS_SAL_dm{number}.nc"))
+    monkeypatch.setenv("HOME", str(home))
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path.joinpath("cache")))
+
+    expected = processing.open_sss(source="test_daily_mean").compute()
+    result = processing.open_sss(source="test_daily_mean", manifest=True)
+    manifests = list(tmp_path.joinpath("cache").glob("water-masses/manifests/*"))
+
+    assert len(manifests) == 1
+    xr.testing.assert_identical(result.compute(), expected)
+    mtime = manifests[0].stat().st_mtime_ns
+    processing.open_sss(source="test_daily_mean", manifest=True)
+    assert manifests[0].stat().st_mtime_ns == mtime
+
+
+def test_subset_is_pushed_into_reads(files, tmp_path):
+    """Only the hyperslabs of the selected files are read."""
+    manifest = catalog.Manifest.build([str(path) for path in files])
+    sel = {
+        "time": slice("2000-02-28", "2000-03-01"),
+        "depth": 10.0,
+        "latitude": slice(51, 52),
+    }
+    stride = {"longitude": 2, "time": 2}
+
+    for chunks in (None, {"longitude": 1}):
+        ds = manifest.to_dataset(chunks=chunks, indexers=manifest.indexers(sel, stride))
+        expected = _expected(files).sel(sel).isel(longitude=slice(None, None, 2))
+        xr.testing.assert_identical(
+            ds.compute(), expected.isel(time=slice(None, None, 2))
+        )
+    # blocks of the two selected files only
+    assert ds.so.data.npartitions == 4
+
+
+def test_open_sss_subset(files, tmp_path, monkeypatch):
+    """Subsets opened from a manifest match those opened from the catalog."""
+    home = tmp_path.joinpath("home")
+    directory = home.joinpath("data", "test", "external", "copernicus", "SAL", "dm")
+    directory.mkdir(parents=True)
+    for number, path in enumerate(files):
+        path.rename(directory.joinpath(f"metoffice_foam1_amm7_NWS_SAL_dm{number}.nc"))
+    monkeypatch.setenv("HOME", str(home))
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path.joinpath("cache")))
+    kwargs = {
+        "region": {"longitude": slice(1, 3)},
+        "stride": 2,
+        "time": slice("2000-02-29", None),
+    }
+
+    expected = processing.open_sss(source="test_daily_mean", **kwargs).compute()
+    result = processing.open_sss(source="test_daily_mean", manifest=True, **kwargs)
+
+    assert dict(expected.sizes) == {"time": 3, "latitude": 2, "longitude": 2}
+    xr.testing.assert_identical(result.compute(), expected)
+    strided = {"latitude": 2, "time": 2}
+    expected = processing.open_sss(source="test_daily_mean", stride=strided)
+    result = processing.open_sss(
+        source="test_daily_mean", manifest=True, stride=strided
+    )
+    assert dict(expected.sizes) == {"time": 3, "latitude": 2, "longitude": 4}
+    xr.testing.assert_identical(result.compute(), expected.compute())
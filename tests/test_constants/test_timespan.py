@@ -1,9 +1,15 @@
 # -*- coding: utf-8 -*-
 
-import pytest
-from water_masses.constants import Timespan
+import pickle
 from datetime import datetime
 
+import numpy as np
+import pandas as pd
+import pytest
+from cftime import DatetimeNoLeap
+
+from water_masses.constants import Timespan, noleap_dates
+
 
 @pytest.mark.parametrize(
     ("start", "end", "expected"),
@@ -22,3 +28,49 @@ def test_timespan(start, end, expected):
     """Example test with parametrization."""
     assert Timespan(start, end).start == expected["start"]
     assert Timespan(start, end).end == expected["end"]
+
+
+def test_timespan_is_cached_value():
+    """Equal timespans are the same immutable, hashable instance."""
+    timespan = Timespan()
+
+    assert Timespan() is timespan
+    assert Timespan("1993-01-01T00:00:00", "2019-12-31T00:00:00") is timespan
+    assert timespan != Timespan("1993-01-01T00:00:00", "2003-01-11T00:01:00")
+    assert len({timespan, Timespan()}) == 1
+    with pytest.raises(AttributeError):
+        timespan.start = datetime(2000, 1, 1)
+    assert timespan.monthly is timespan.monthly
+
+
+def test_timespan_pickle():
+    """Unpickling returns the cached instance, other timespans are not altered."""
+    other = Timespan("2000-01-01T00:00:00", "2000-12-31T00:00:00")
+
+    assert pickle.loads(pickle.dumps(other)) is other
+    assert Timespan().start == datetime(1993, 1, 1)
+
+
+def test_timespan_calendars():
+    timespan = Timespan("2000-01-01T00:00:00", "2001-12-31T00:00:00")
+
+    assert len(timespan.monthly) == 24
+    assert len(timespan.daily) == 731
+    assert len(timespan.noleap) == 730
+    assert list(timespan.month_names[:2]) == ["January", "February"]
+    np.testing.assert_array_equal(timespan.year_month_keys, 12 * 2000 + np.arange(24))
+    assert list(timespan.noleap[[0, 59, -1]]) == [
+        DatetimeNoLeap(2000, 1, 1),
+        DatetimeNoLeap(2000, 3, 1),
+        DatetimeNoLeap(2001, 12, 31),
+    ]
+
+
+def test_noleap_dates():
+    dates = pd.DatetimeIndex(["1996-02-28T12:00", "1996-03-01T06:30", "1997-12-31"])
+
+    assert list(noleap_dates(dates)) == [
+        DatetimeNoLeap(*date.timetuple()[:6]) for date in dates
+    ]
+    with pytest.raises(ValueError):
+        noleap_dates(pd.DatetimeIndex(["1996-02-29"]))
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from water_masses import filter_month
+from water_masses.tracmass.table import TrajectoryTable
+
+
+@pytest.fixture()
+def meta_data(tmp_path):
+    """Initialization file with one particle per day over two years."""
+    end = filter_month.Timespan().end
+    dates = pd.date_range("2017-01-01", "2018-12-31", freq="D")
+    seconds = (dates - pd.Timestamp(end)).total_seconds().astype(int)
+    pd.DataFrame(
+        {
+            "id": np.arange(len(dates)),
+            "i": np.arange(len(dates)) % 7,
+            "j": 1.0,
+            "k": 1.0,
+            "subvol": 1.0,
+            "time": seconds,
+        },
+    ).to_csv(tmp_path.joinpath("tests_ini.csv"), header=False, index=False)
+    return filter_month.MetaData(data_path=str(tmp_path.joinpath("tests_{0}.csv")))
+
+
+def test_all_months_in_one_pass(meta_data):
+    """Each month gets its sample, reproducible and independent of batch size."""
+    sample = filter_month.sample_initialization(5, seed=1, meta_data=meta_data)
+    assert sample.groupby("month").size().to_dict() == {
+        month: 5 for month in range(1, 13)
+    }
+    assert not sample.id.duplicated().any()
+    pd.testing.assert_frame_equal(
+        sample,
+        filter_month.sample_initialization(
+            5, seed=1, meta_data=meta_data, block_size=1 << 10
+        ),
+    )
+
+
+def test_strata_and_selection(meta_data):
+    """Any strata and subsets of strata can be sampled."""
+    sample = filter_month.sample_initialization(
+        100,
+        strata=("year", "month", "region"),
+        seed=2,
+        meta_data=meta_data,
+        select={"month": [2]},
+        region=lambda batch: batch["lon"].values > 3,
+    )
+    counts = sample.groupby(["year", "region"]).size()
+    assert counts.sum() == 28 + 28
+    assert (sample.month == 2).all()
+
+
+def test_select_from_initialization(meta_data):
+    """The single month selection draws from that month only."""
+    ids = filter_month.select_from_initialization(
+        10, month="March", meta_data=meta_data, seed=3
+    )
+    table = TrajectoryTable.from_csv(meta_data.data_path.format("ini"))
+    dates = pd.Series(table.dates(), index=table.to_numpy("id"))
+    assert len(ids) == 10
+    assert (pd.DatetimeIndex(dates[ids]).month == 3).all()
+    assert ids.equals(
+        filter_month.select_from_initialization(
+            10, month="March", meta_data=meta_data, table=table, seed=3
+        )
+    )
+
+
+def test_fractional_times_as_in_table(tmp_path):
+    """Streamed and tabled initialization data round times the same way."""
+    end = filter_month.Timespan().end
+    start = (pd.Timestamp("2019-03-01") - pd.Timestamp(end)).total_seconds()
+    pd.DataFrame({"id": [1, 2], "lon": 1.0, "j": 1.0, "k": 1.0, "subvol": 1.0},).assign(
+        time=[start - 0.4, start - 0.6]
+    ).to_csv(tmp_path.joinpath("tests_ini.csv"), header=False, index=False)
+    meta_data = filter_month.MetaData(data_path=str(tmp_path.joinpath("tests_{0}.csv")))
+    table = TrajectoryTable.from_csv(
+        meta_data.data_path.format("ini"),
+        usecols=(0, 1, 5),
+        names=("id", "lon", "time"),
+    )
+
+    streamed = filter_month.sample_initialization(1, meta_data=meta_data)
+    tabled = filter_month.sample_initialization(1, meta_data=meta_data, table=table)
+    assert streamed.set_index("id").month.to_dict() == {1: 3, 2: 2}
+    pd.testing.assert_frame_equal(streamed, tabled)
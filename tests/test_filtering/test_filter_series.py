@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+from scipy import signal
+
+from water_masses import filtering, spgsi, time_series
+
+SOS = filtering.lowpass_sos(cutlen=15, fs=12, order=5)
+
+
+@pytest.fixture()
+def series():
+    """Monthly series as columns, with gaps, a short segment and no data."""
+    rng = np.random.default_rng(0)
+    values = rng.normal(size=(240, 5)).cumsum(axis=0)
+    values[100:110, 1] = np.nan
+    values[100:110, 2] = np.nan
+    values[:5, 3] = np.nan
+    values[200:230, 3] = np.nan
+    values[:, 4] = np.nan
+    return values
+
+
+def _reference(values):
+    """Column wise sosfiltfilt of the segments long enough to filter."""
+    result = np.full(values.shape, np.nan)
+    minimum = filtering.default_padlen(SOS) + 1
+    for column in range(values.shape[1]):
+        valid = ~np.isnan(values[:, column])
+        bounds = np.flatnonzero(np.diff(np.r_[0, valid.astype(int), 0]))
+        for start, stop in zip(bounds[::2], bounds[1::2]):
+            if stop - start >= minimum:
+                result[start:stop, column] = signal.sosfiltfilt(
+                    SOS, values[start:stop, column]
+                )
+    return result
+
+
+def test_array_matches_columnwise_filter(series):
+    result = filtering.filter_series(series, SOS)
+
+    np.testing.assert_allclose(result, _reference(series))
+    # the segment of 30 values after the gap is too short
+    assert np.isnan(result[230:, 3]).all()
+    np.testing.assert_allclose(filtering.filter_series(series.T, SOS, axis=1), result.T)
+
+
+def test_dataframe_is_not_mutated(series):
+    df = pd.DataFrame(series, columns=list("abcde"))
+    original = df.copy()
+
+    result = filtering.lowpass(df)
+
+    pd.testing.assert_frame_equal(df, original)
+    np.testing.assert_allclose(result.values, _reference(series))
+    assert list(result.columns) == list(df.columns)
+
+
+def test_data_array(series):
+    da = xr.DataArray(
+        series.reshape(240, 1, 5).astype(np.float32),
+        dims=("time", "latitude", "longitude"),
+        attrs={"units": "psu"},
+    ).chunk({"longitude": 2})
+
+    result = filtering.filter_series(da, SOS)
+
+    assert result.dims == da.dims
+    assert result.dtype == np.float32
+    assert result.attrs == da.attrs
+    np.testing.assert_allclose(
+        result.values[:, 0], _reference(series.astype(np.float32)), atol=1e-5
+    )
+    complete = da.isel(longitude=[0])
+    np.testing.assert_allclose(
+        filtering.filter_series(complete, SOS).values,
+        filtering.apply_filter(
+            filtering.butter_lowpass_filter, complete.compute(), [], {}
+        ).values,
+        atol=1e-5,
+    )
+
+
+def test_index_filters_return_copies():
+    index = pd.DataFrame(
+        {"PC1": np.sin(np.arange(60.0)), "PC2": np.cos(np.arange(60.0))}
+    )
+
+    result = spgsi.filter(index)
+    several = time_series.lowpass_filter(index, ["PC1", "PC2"])
+
+    assert list(index.columns) == ["PC1", "PC2"]
+    sos = signal.butter(N=10, Wn=4 / 6, btype="lowpass", fs=12, output="sos")
+    np.testing.assert_allclose(result.filtered, signal.sosfiltfilt(sos, index.PC2))
+    np.testing.assert_allclose(several.fPC2, result.filtered)
+    np.testing.assert_allclose(several.fPC1, signal.sosfiltfilt(sos, index.PC1))
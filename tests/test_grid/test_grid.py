@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import pytest
+import xarray as xr
+
+from water_masses.grid import EARTH_RADIUS, Grid
+from water_masses.origin import pca
+from water_masses.tracmass import seeding
+from water_masses.transform import roll
+
+
+@pytest.fixture
+def da() -> xr.DataArray:
+    lat = np.linspace(50, 60, 41)
+    lon = np.linspace(-10, 10, 81)
+    return xr.DataArray(
+        np.zeros((lat.size, lon.size)),
+        dims=("latitude", "longitude"),
+        coords={
+            "latitude": ("latitude", lat, {"standard_name": "latitude"}),
+            "longitude": ("longitude", lon, {"standard_name": "longitude"}),
+        },
+    )
+
+
+def test_grid_cached_by_coordinates(da):
+    """Fields on the same grid share the instance, other grids or masks do not."""
+    grid = Grid.from_coords(da)
+    assert Grid.from_coords(da.copy(deep=True)) is grid
+    assert Grid.from_coords(da.isel(latitude=slice(1, None))) is not grid
+    wet = np.ones(grid.shape, dtype=bool)
+    assert Grid.from_coords(da, wet=wet) is not grid
+    assert Grid.from_coords(da, wet=wet) is Grid.from_coords(da, wet=wet)
+    with pytest.raises(ValueError):
+        grid.coslat[0] = 0
+    with pytest.raises(ValueError):
+        Grid.from_coords(da, wet=wet[1:])
+
+
+def test_grid_geometry(da):
+    grid = Grid.from_coords(da)
+    assert grid.spacing == {"latitude": pytest.approx(0.25), "longitude": 0.25}
+    assert grid.bounds == {"latitude": (50.0, 60.0), "longitude": (-10.0, 10.0)}
+    np.testing.assert_allclose(
+        grid.coslat_weights[:, 0], np.sqrt(np.cos(np.deg2rad(da.latitude.values)))
+    )
+    # cells span 49.875 to 60.125 degrees north and 20.25 degrees of longitude
+    expected = (
+        EARTH_RADIUS ** 2
+        * np.deg2rad(20.25)
+        * (np.sin(np.deg2rad(60.125)) - np.sin(np.deg2rad(49.875)))
+    )
+    assert grid.area.sum() == pytest.approx(expected)
+    wet = np.zeros(grid.shape, dtype=bool)
+    wet[:, :10] = True
+    masked = Grid.from_coords(da, wet=wet)
+    assert masked.wet_area.sum() == pytest.approx(grid.area[:, :10].sum())
+
+
+def test_modules_accept_grid(da):
+    """Results with and without the grid are the same."""
+    grid = Grid.from_coords(da)
+    np.testing.assert_array_equal(pca._coslat_weights(da, grid), grid.coslat_weights)
+    for loc in (49.0, 52.37, 55.125, 61.0):
+        assert seeding.index(da, "latitude", loc, grid) == seeding.index(
+            da, "latitude", loc
+        )
+    idx = np.arange(da.longitude.size)
+    np.testing.assert_allclose(
+        seeding.convert(da.longitude, idx, grid), seeding.convert(da.longitude, idx)
+    )
+    ds = da.to_dataset(name="sss")
+    xr.testing.assert_identical(roll(ds, lon_min=0, grid=grid), roll(ds, lon_min=0))
+    assert seeding.seed_horizontal_diagonal(
+        -5.0, 51.0, 5.0, 58.0, da, {"zonal": 1, "meridional": 2}, grid=grid
+    ) == seeding.seed_horizontal_diagonal(
+        -5.0, 51.0, 5.0, 58.0, da, {"zonal": 1, "meridional": 2}
+    )
+
+
+def test_seeding_looks_up_cf_roles(da):
+    """Coordinates are found by their CF role, not by their name."""
+    renamed = da.rename(latitude="lat", longitude="lon")
+    renamed.lat.attrs = {"units": "degrees_north"}
+    renamed.lon.attrs = {"units": "degrees_east"}
+    grid = Grid.from_coords(renamed)
+    assert grid is Grid.from_coords(da)
+
+    assert seeding.index(renamed, "lat", 52.37, grid) == seeding.index(
+        renamed, "lat", 52.37
+    )
+    idx = np.arange(renamed.lon.size)
+    np.testing.assert_allclose(
+        seeding.convert(renamed.lon, idx, grid), seeding.convert(renamed.lon, idx)
+    )
+    with pytest.raises(KeyError):
+        seeding.convert(xr.DataArray(idx, dims="x", name="x"), idx, grid)
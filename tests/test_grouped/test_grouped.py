@@ -0,0 +1,129 @@
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+
+from cftime import DatetimeNoLeap
+
+from water_masses import grouped, processing
+
+
+@pytest.fixture
+def data() -> xr.DataArray:
+    rng = np.random.default_rng(0)
+    time = pd.date_range("1999-12-01", "2002-02-28", freq="D")
+    values = rng.normal(size=(len(time), 3, 4))
+    values[:, 0, 0] = np.nan
+    values[::7, 1, 1] = np.nan
+    return xr.DataArray(
+        values,
+        coords={"time": time, "latitude": [50.0, 51.0, 52.0]},
+        dims=("time", "latitude", "longitude"),
+        name="salinity",
+    )
+
+
+def _expected(data, by, func):
+    group = data.groupby(f"time.{by}")
+    if func == "quantile":
+        return group.quantile(0.9, dim="time").drop_vars("quantile")
+    return getattr(group, func)("time")
+
+
+@pytest.mark.parametrize("by", ["month", "season", "dayofyear"])
+@pytest.mark.parametrize("func", ["mean", "count", "quantile"])
+@pytest.mark.parametrize("chunks", [None, {"time": 100, "latitude": 2}])
+def test_reduce_matches_groupby(data, by, func, chunks):
+    da = data if chunks is None else data.chunk(chunks)
+    result = grouped.reduce(da, by, func=func, q=0.9)
+
+    if chunks is not None:
+        assert result.chunks is not None
+    xr.testing.assert_allclose(
+        result.compute(), _expected(data, by, func).transpose(*result.dims)
+    )
+
+
+def test_reduce_partials_hold_present_groups(data):
+    da = data.chunk({"time": 31}).transpose(..., "time")
+    unique, codes = grouped.labels(da.time, "dayofyear")
+    kws = {"ngroups": len(unique), "func": "mean", "q": None, "skipna": True}
+    partials = grouped._chunk_partials(da.data, codes, kws)
+
+    assert len(partials) == len(da.chunks[-1])
+    for present, array in partials:
+        assert len(present) <= 31
+        assert array.shape[-1] == 2 * len(present)
+    result = grouped.reduce(data.chunk({"time": 31}), "dayofyear")
+    xr.testing.assert_allclose(
+        result.compute(), _expected(data, "dayofyear", "mean").transpose(*result.dims)
+    )
+
+
+def test_reduce_without_skipna(data):
+    result = grouped.reduce(data, "month", skipna=False)
+
+    assert result[1, 1].isnull().all()
+    xr.testing.assert_allclose(
+        result[2], _expected(data, "month", "mean").transpose(*result.dims)[2]
+    )
+
+
+def test_reduce_labels(data):
+    result = grouped.reduce(data, data.time.dt.year.values, group_dim="year")
+
+    xr.testing.assert_allclose(
+        result, data.groupby("time.year").mean("time").transpose(*result.dims)
+    )
+    with pytest.raises(ValueError):
+        grouped.reduce(data, [1, 2, 3])
+    with pytest.raises(ValueError):
+        grouped.reduce(data, "month", func="median")
+
+
+@pytest.mark.parametrize("chunks", [None, {"time": 100}])
+def test_resample_monthly(data, chunks):
+    da = data if chunks is None else data.chunk(chunks)
+    result = grouped.resample_monthly(da, func="quantile", q=0.5)
+
+    xr.testing.assert_allclose(
+        result.compute(),
+        data.resample(time="MS")
+        .quantile(0.5, dim="time")
+        .drop_vars("quantile")
+        .transpose(*result.dims),
+    )
+
+
+def test_resample_monthly_cftime(data):
+    noleap = processing.rm_leap(data)
+    result = grouped.resample_monthly(noleap)
+
+    assert result.time.values[0] == DatetimeNoLeap(1999, 12, 1)
+    np.testing.assert_allclose(
+        result, noleap.resample(time="MS").mean().transpose(*result.dims)
+    )
+
+
+def test_anomalies(data):
+    result = grouped.anomalies(data, "dayofyear")
+
+    expected = data.groupby("time.dayofyear") - data.groupby("time.dayofyear").mean()
+    assert result.dims == data.dims
+    xr.testing.assert_allclose(result, expected.drop_vars("dayofyear"))
+
+
+def test_anomalies_dask_with_reduction(data):
+    da = data.chunk({"time": 100, "latitude": 2}).transpose("latitude", ...)
+    climatology = grouped.reduce(data, "dayofyear", func="quantile", q=0.9)
+    result = grouped.anomalies(da, "dayofyear", reduced=climatology)
+
+    assert result.dims == da.dims
+    assert result.chunks == da.chunks
+    expected = data.groupby("time.dayofyear") - data.groupby("time.dayofyear").quantile(
+        0.9, dim="time"
+    )
+    xr.testing.assert_allclose(
+        result.compute(),
+        expected.drop_vars(["dayofyear", "quantile"]).transpose(*da.dims),
+    )
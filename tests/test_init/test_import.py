@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+
+import json
+import subprocess
+import sys
+
+import pytest
+
+import water_masses
+
+#: Seconds allowed for the import of a light weight module in a fresh interpreter.
+IMPORT_BUDGET = 3.0
+
+HEAVY = (
+    "vaex",
+    "eofs",
+    "statsmodels",
+    "intake",
+    "scipy.signal",
+    "cf_xarray",
+    "cftime",
+)
+
+SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import water_masses
+from water_masses.tracmass import seeding
+from water_masses import constants
+elapsed = time.perf_counter() - start
+print(json.dumps({"elapsed": elapsed, "modules": sorted(sys.modules)}))
+"""
+
+
+def test_import_is_light():
+    """Heavy dependencies are only imported by the functions using them."""
+    output = subprocess.run(
+        [sys.executable, "-c", SCRIPT],
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    result = json.loads(output)
+    assert not set(HEAVY) & set(result["modules"])
+    assert result["elapsed"] < IMPORT_BUDGET
+
+
+@pytest.mark.parametrize("name", water_masses.__all__)
+def test_lazy_attributes(name):
+    """All public names resolve on access."""
+    assert getattr(water_masses, name) is not None
+    assert name in dir(water_masses)
+
+
+def test_unknown_attribute():
+    """Unknown names raise an AttributeError."""
+    with pytest.raises(AttributeError, match="no attribute"):
+        water_masses.does_not_exist  # noqa: B018
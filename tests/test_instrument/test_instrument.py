@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+
+from water_masses import instrument
+from water_masses.processing import rm_leap
+
+
+@pytest.fixture()
+def daily():
+    """Small daily data set including a leap day."""
+    time = pd.date_range("2000-02-20", "2000-03-10", freq="D")
+    return xr.DataArray(
+        np.ones((len(time), 2, 3)),
+        dims=("time", "latitude", "longitude"),
+        coords={"time": time},
+    ).chunk({"latitude": 1})
+
+
+@pytest.fixture()
+def recording():
+    """Enable instrumentation for a single test."""
+    instrument.reset()
+    with instrument.recording():
+        yield
+
+
+def test_disabled_records_nothing(daily):
+    """Without enabling, the decorated functions leave no trace."""
+    instrument.reset()
+    instrument.disable()
+    rm_leap(daily)
+    assert instrument.records() == []
+
+
+def test_recording_restores_switch_and_records(daily):
+    """Recording within a block leaves the instrumentation as it was."""
+    instrument.reset()
+    instrument.disable()
+    with instrument.recording():
+        rm_leap(daily)
+        assert len(instrument.records()) == 1
+    assert not instrument.is_enabled()
+    assert instrument.records() == []
+
+
+@pytest.mark.usefixtures("recording")
+def test_stage_report(daily, tmp_path):
+    """Nested stages are recorded with timing, memory, tasks and bytes."""
+    with instrument.stage("outer", inputs=daily) as outer:
+        outer.output = rm_leap(daily)
+    path = tmp_path.joinpath("report.json")
+    instrument.report(path)
+    report = json.loads(path.read_text())
+
+    inner, outer_record = report["stages"]
+    assert inner["name"] == "water_masses.processing.rm_leap"
+    assert inner["parent"] == "outer"
+    assert outer_record["parent"] is None
+    assert inner["bytes_in"] == daily.nbytes
+    assert inner["bytes_out"] == daily.nbytes - 2 * 3 * 8
+    assert inner["dask_tasks"] > 0
+    assert inner["wall_time"] <= outer_record["wall_time"]
+    assert report["total"]["wall_time"] == outer_record["wall_time"]
+    assert report["total"]["peak_rss"] > 0
+
+
+@pytest.mark.usefixtures("recording")
+def test_stages_nest_per_thread():
+    """Stages on worker threads do not take or drop the stages of others."""
+    barrier = threading.Barrier(2)
+
+    def run(name):
+        with instrument.stage(name):
+            barrier.wait()
+            with instrument.stage(f"{name}.inner"):
+                barrier.wait()
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        list(pool.map(run, ["first", "second"]))
+    parents = {record["name"]: record["parent"] for record in instrument.records()}
+    assert parents == {
+        "first": None,
+        "second": None,
+        "first.inner": "first",
+        "second.inner": "second",
+    }
+
+
+@pytest.mark.usefixtures("recording")
+def test_peak_rss_per_stage():
+    """A stage after a larger one still records its own memory increase."""
+    with instrument.stage("large"):
+        large = np.ones(1 << 25)  # 256 MiB
+        del large
+    with instrument.stage("small") as small:
+        small.output = np.ones(1 << 23)  # 64 MiB
+    large_record, small_record = instrument.records()
+    assert large_record["peak_rss_increase"] > 200 * 2 ** 20
+    assert small_record["peak_rss_increase"] > 50 * 2 ** 20
+    assert small_record["peak_rss"] < large_record["peak_rss"]
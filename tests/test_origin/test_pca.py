@@ -0,0 +1,70 @@
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+
+from water_masses.origin import pca
+
+
+@pytest.fixture
+def field() -> xr.DataArray:
+    rng = np.random.default_rng(0)
+    time = pd.date_range("2000-01-01", periods=24, freq="MS")
+    lat = np.linspace(50, 60, 9)
+    lon = np.linspace(-20, 0, 11)
+    patterns = rng.normal(size=(3, lat.size, lon.size))
+    amplitudes = rng.normal(size=(time.size, 3)) * [3.0, 2.0, 1.0]
+    values = np.einsum("tm,myx->tyx", amplitudes, patterns)
+    values += 0.1 * rng.normal(size=values.shape)
+    values[:, :2, :3] = np.nan
+    return xr.DataArray(
+        values,
+        coords={
+            "time": time,
+            "latitude": ("latitude", lat, {"standard_name": "latitude"}),
+            "longitude": ("longitude", lon, {"standard_name": "longitude"}),
+        },
+        dims=("time", "latitude", "longitude"),
+    )
+
+
+def _align_sign(actual: np.ndarray, expected: np.ndarray) -> np.ndarray:
+    """Flip modes (first axis) of `actual` to the sign of `expected`."""
+    sign = np.sign(
+        np.nansum(actual * expected, axis=tuple(range(1, actual.ndim)), keepdims=True)
+    )
+    return actual * sign
+
+
+@pytest.mark.parametrize("spatial_chunk", [None, 2])
+@pytest.mark.parametrize("chunked", [False, True])
+def test_gram_eof_matches_eofs(field, spatial_chunk, chunked):
+    da = field.chunk({"latitude": 4}) if chunked else field
+    expected_solver, expected = pca.lat_weighted_eof(field, nmodes=3)
+    solver, eof = pca.lat_weighted_eof(
+        da, nmodes=3, out_of_core=True, spatial_chunk=spatial_chunk
+    )
+
+    assert eof.dims == expected.dims
+    np.testing.assert_array_equal(np.isnan(eof), np.isnan(expected))
+    np.testing.assert_allclose(
+        _align_sign(eof.values, expected.values), expected.values, atol=1e-8
+    )
+    np.testing.assert_allclose(
+        solver.varianceFraction(neigs=3), expected_solver.varianceFraction(neigs=3)
+    )
+    np.testing.assert_allclose(
+        solver.eigenvalues(neigs=3), expected_solver.eigenvalues(neigs=3)
+    )
+    for scaling in (0, 1, 2):
+        pcs = solver.pcs(pcscaling=scaling, npcs=3).values.T
+        expected_pcs = expected_solver.pcs(pcscaling=scaling, npcs=3).values.T
+        np.testing.assert_allclose(
+            _align_sign(pcs, expected_pcs), expected_pcs, atol=1e-8
+        )
+
+
+def test_gram_eof_rejects_unknown_scaling(field):
+    solver = pca.GramEof(field)
+    with pytest.raises(ValueError):
+        solver.pcs(pcscaling=3)
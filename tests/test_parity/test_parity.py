@@ -0,0 +1,553 @@
+# -*- coding: utf-8 -*-
+"""Parity of optimized code paths with recorded reference outputs.
+
+Each case runs its implementations on small, seeded synthetic data (a netCDF
+SSS cube, TRACMASS CSV, CSV.gz and HDF5 files and an SPG index CSV) and
+compares their outputs to the golden output in ``golden/<case>.npz`` within
+the tolerances declared by the case. The goldens hold the outputs of the
+reference (first) implementation and its run time when they were recorded.
+
+Record the goldens again (only when a change of the results is intended)::
+
+    WATER_MASSES_RECORD_GOLDEN=1 python -m pytest tests/test_parity
+
+Print the timings and speedups against the recorded reference next to the
+parity of all implementations::
+
+    python tests/test_parity/test_parity.py
+
+"""
+
+import os
+import tempfile
+import time
+from pathlib import Path
+from typing import IO, Any, Callable, Dict, Iterable, List, Sequence, Set, Tuple
+
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+
+from water_masses import decompose, processing, spgsi, time_series
+from water_masses.constants import Timespan
+from water_masses.grid import Grid
+from water_masses.tracmass import io, seeding
+from water_masses.tracmass.table import TrajectoryTable
+
+GOLDEN = Path(__file__).parent.joinpath("golden")
+RECORD = os.environ.get("WATER_MASSES_RECORD_GOLDEN", "0") not in {"", "0"}
+SEED = 7
+SECONDS = "__seconds__"
+
+
+class Data(object):
+    """Synthetic input files in `directory` and their contents."""
+
+    def __init__(self, directory: Path) -> None:
+        """Write the input files."""
+        rng = np.random.default_rng(SEED)
+        self.directory = directory
+
+        # daily SSS with seasonal cycle, trend, noise and land
+        time_axis = pd.date_range("2000-01-01", "2001-06-30", freq="D")
+        lat, lon = np.linspace(56, 60, 4), np.linspace(-4, 4, 5)
+        doy = time_axis.dayofyear.values[:, np.newaxis, np.newaxis]
+        values = (
+            35.0
+            + 0.5 * np.sin(2 * np.pi * doy / 365.25)
+            + np.linspace(0, 0.1, len(time_axis))[:, np.newaxis, np.newaxis]
+            + rng.normal(scale=0.1, size=(len(time_axis), len(lat), len(lon)))
+        )
+        values[:, 0, :2] = np.nan
+        self.sss_path = directory.joinpath("sss.nc")
+        xr.Dataset(
+            {"sss": (("time", "latitude", "longitude"), values)},
+            coords={
+                "time": time_axis,
+                "latitude": ("latitude", lat, {"standard_name": "latitude"}),
+                "longitude": ("longitude", lon, {"standard_name": "longitude"}),
+            },
+        ).to_netcdf(self.sss_path)
+
+        # backward trajectories, seconds relative to the end of the timespan
+        timespan = Timespan()
+        ids, rows_per_id = 20, 50
+        seconds = int((timespan.end - timespan.start).total_seconds())
+        start = rng.integers(-seconds, 0, size=ids) // 86400 * 86400
+        step = np.tile(np.arange(rows_per_id) * -86400 * 5, ids)
+        trajectories = pd.DataFrame(
+            {
+                "id": np.repeat(np.arange(1, ids + 1), rows_per_id),
+                "i": rng.uniform(1, 297, ids * rows_per_id),
+                "j": rng.uniform(1, 375, ids * rows_per_id),
+                "k": rng.uniform(1, 24, ids * rows_per_id),
+                "subvol": rng.uniform(0, 1e4, ids * rows_per_id),
+                "time": np.maximum(np.repeat(start, rows_per_id) + step, -seconds),
+            },
+        )
+        for suffix in (".csv", ".csv.gz"):
+            trajectories.to_csv(self.trajectories(suffix), header=False, index=False)
+        try:
+            import vaex
+        except ImportError:
+            pass
+        else:
+            vaex.from_pandas(trajectories).export_hdf5(str(self.trajectories(".hdf5")))
+
+        self.spgsi_path = directory.joinpath("spgsi.csv")
+        pd.DataFrame(
+            rng.normal(size=(len(timespan.monthly), 2)), columns=["PC1", "PC2"]
+        ).to_csv(self.spgsi_path, header=False, index=False)
+
+        # AMM7 spacing for the seeding
+        self.seed_grid = xr.DataArray(
+            np.zeros((61, 73)),
+            dims=("latitude", "longitude"),
+            coords={
+                "latitude": ("latitude", np.linspace(56, 60, 61)),
+                "longitude": ("longitude", np.linspace(-4, 4, 73)),
+            },
+        )
+        self.seed_grid.latitude.attrs["standard_name"] = "latitude"
+        self.seed_grid.longitude.attrs["standard_name"] = "longitude"
+
+    @property
+    def sss(self) -> xr.DataArray:
+        """SSS loaded from the netCDF file."""
+        with xr.open_dataset(self.sss_path) as ds:
+            return ds.sss.load()
+
+    @property
+    def spgs_idx(self) -> pd.DataFrame:
+        """SPG strength index."""
+        return spgsi.open_index(self.spgsi_path)
+
+    def trajectories(self, suffix: str) -> Path:
+        """Path of the trajectory file."""
+        return self.directory.joinpath(f"tests_run{suffix}")
+
+    def output(self) -> Path:
+        """Fresh directory for written outputs."""
+        return Path(tempfile.mkdtemp(dir=self.directory))
+
+
+Implementation = Callable[[Data], Any]
+
+
+class Case(object):
+    """Implementations of one result, the first one is the reference.
+
+    Parameter
+    =========
+    implementations : dict
+        Functions of :class:`Data` by name.
+    rtol, atol : float
+        Tolerances of floating point outputs, other outputs must be equal.
+    ignore : sequence of str
+        Keys of the flat outputs (see :func:`flatten`) not compared.
+
+    """
+
+    def __init__(
+        self,
+        implementations: Dict[str, Implementation],
+        rtol: float = 1e-12,
+        atol: float = 0.0,
+        ignore: Sequence[str] = (),
+    ) -> None:
+        """Store the implementations and tolerances."""
+        self.implementations = implementations
+        self.reference = next(iter(implementations))
+        self.rtol = rtol
+        self.atol = atol
+        self.ignore = {SECONDS, *ignore}
+
+
+def _meta_data(averaging_method: str) -> processing.MetaData:
+    return processing.MetaData(
+        "daily_mean", averaging_method=averaging_method, quantile=0.9
+    )
+
+
+def _seed_lines(directory: Path) -> List[str]:
+    return [
+        line
+        for path in sorted(directory.iterdir())
+        for line in [path.name, *path.read_text().splitlines()]
+    ]
+
+
+def _seed_patch(data: Data) -> List[str]:
+    directory = data.output()
+    seeding.seed_patch(2, 4, 3, 2, max_as_diff=True, file_target_dir=str(directory))
+    seeding.seed_patch(
+        10,
+        12,
+        5,
+        9,
+        experiment_name="section",
+        grid_location=1,
+        file_target_dir=str(directory),
+    )
+    return _seed_lines(directory)
+
+
+def _loop_diagonal(data: Data) -> Tuple[np.ndarray, List[str]]:
+    """Seeding line by nearest ``.sel`` and index loops, without :class:`Grid`."""
+    da = data.seed_grid
+    start, end = np.array([-3.5, 56.3]), np.array([3.2, 59.4])
+    dims = ("longitude", "latitude")
+    spacing = np.array([np.mean(np.diff(da[dim])) for dim in dims])
+    points = np.linspace(start, end, int(np.max((end - start) / spacing * 3)))
+    # the line rises eastwards, cells are ordered by longitude, then latitude
+    cells = sorted(
+        {
+            tuple(seeding.index(da, dim, value) for dim, value in zip(dims, point))
+            for point in points
+        }
+    )
+    corners = [
+        (i0, j1)
+        for (i0, j0), (i1, j1) in zip(cells, cells[1:])
+        if i0 != i1 and j0 != j1
+    ]
+    coords = sorted({*cells, *corners})
+    directory = data.output()
+    with open(directory.joinpath("seed_diagonal.txt"), "w") as file:
+        _write_diagonal(file, coords, {"zonal": 1, "meridional": 2})
+    return np.asarray(coords), _seed_lines(directory)
+
+
+def _write_diagonal(
+    file: IO[str], coords: List[Tuple[int, int]], flow_direction: Dict[str, int]
+) -> None:
+    previous: Dict[str, int] = {}
+    for number, (i, j) in enumerate(coords):
+        y, isec = (j, 2) if not number else seeding.seedloc_at(j, coords[number - 1][1])
+        seed = {
+            "i": i,
+            "j": y,
+            "k": 1,
+            "gridloc": isec,
+            "dirfilt": flow_direction["zonal" if isec == 1 else "meridional"],
+        }
+        if seed != previous:
+            seeding.write_seed(file, **seed)
+        previous = seed
+
+
+def _seed_diagonal(data: Data, grid: bool) -> Tuple[np.ndarray, List[str]]:
+    directory = data.output()
+    coords = seeding.seed_horizontal_diagonal(
+        -3.5,
+        56.3,
+        3.2,
+        59.4,
+        data.seed_grid,
+        {"zonal": 1, "meridional": 2},
+        file_target_dir=directory,
+        grid=Grid.from_coords(data.seed_grid) if grid else None,
+    )
+    return np.asarray(coords), _seed_lines(directory)
+
+
+def _seed_lookup(data: Data, grid: bool) -> Tuple[List[int], np.ndarray]:
+    cached = Grid.from_coords(data.seed_grid) if grid else None
+    locations = [55.0, 56.01, 57.033, 58.5, 60.2]
+    index = [
+        seeding.index(data.seed_grid, "latitude", loc, cached) for loc in locations
+    ]
+    longitude = data.seed_grid.longitude
+    fractional = np.linspace(0, len(longitude) - 1, 17)
+    return index, seeding.convert(longitude, fractional, cached)
+
+
+READERS: Dict[str, Callable[[Path], Any]] = {
+    "table": io.open_trajectory_table,
+    "vaex": lambda path: io.open_tracmass_file(path).to_pandas_df(),
+    "pandas": lambda path: io.open_tracmass_file(path, use_vaex=False),
+}
+
+
+def _indexed(df: Any) -> pd.DataFrame:
+    """`(id, date)` indexed frame as of :mod:`water_masses.filter_month`."""
+    if isinstance(df, TrajectoryTable):
+        return df.to_frame()
+    dates = pd.Timestamp(Timespan().end) + pd.to_timedelta(df.time, "s")
+    return df.assign(date=dates).set_index(["id", "date"])
+
+
+def _assign2trj(suffix: str, reader: str, indexed: bool = False) -> Implementation:
+    def assign(data: Data) -> pd.DataFrame:
+        if suffix == ".hdf5":
+            pytest.importorskip("vaex")
+        df = READERS[reader](data.trajectories(suffix))
+        return spgsi.assign2trj(_indexed(df) if indexed else df, data.spgs_idx)
+
+    return assign
+
+
+def _from_monthly_index(data: Data) -> Tuple[int, xr.Dataset]:
+    index = data.spgs_idx
+    return decompose.from_monthly_index(data.sss.to_dataset(), index[index.PC2 > 0])
+
+
+CASES = {
+    "remove_trend_point_wise": Case(
+        {
+            "point_wise": lambda data: processing.RemoveTrend(
+                data.sss, _meta_data("mean")
+            ).point_wise(),
+            "polyfit": lambda data: time_series.detrend(
+                data.sss, "time", method="polyfit"
+            ),
+            "fused_dask": lambda data: processing.RemoveTrend(
+                data.sss.chunk({"latitude": 2}), _meta_data("mean")
+            ).point_wise(),
+        },
+        rtol=1e-10,
+        atol=1e-10,
+    ),
+    "remove_trend_domain_wide": Case(
+        {
+            "domain_wide": lambda data: processing.RemoveTrend(
+                data.sss, _meta_data("quantile")
+            ).domain_wide(),
+        },
+        rtol=1e-10,
+    ),
+    **{
+        f"climatology_point_wise_{method}": Case(
+            {
+                "grouped": lambda data, method=method: (
+                    processing.Climatology.point_wise(data.sss, _meta_data(method))
+                ),
+                "xarray": lambda data, method=method: (
+                    processing.Climatology.point_wise(
+                        data.sss.groupby("time.dayofyear"), _meta_data(method)
+                    )
+                ),
+                "grouped_dask": lambda data, method=method: (
+                    processing.Climatology.point_wise(
+                        data.sss.chunk({"latitude": 2}), _meta_data(method)
+                    )
+                ),
+            },
+            rtol=1e-10,
+            # xarray keeps the scalar quantile coordinate, grouped does not
+            ignore=["coords/quantile"],
+        )
+        for method in ("mean", "quantile")
+    },
+    **{
+        f"climatology_domain_wide_{method}": Case(
+            {
+                "domain_wide": lambda data, method=method: (
+                    processing.Climatology.domain_wide(
+                        data.sss.groupby("time.dayofyear"), _meta_data(method)
+                    )
+                ),
+            },
+            rtol=1e-10,
+        )
+        for method in ("mean", "quantile")
+    },
+    "rm_leap": Case(
+        {
+            "rm_leap": lambda data: processing.rm_leap(data.sss),
+            "rm_leap_dask": lambda data: processing.rm_leap(
+                data.sss.chunk({"time": 100})
+            ),
+        },
+    ),
+    "from_monthly_index": Case({"from_monthly_index": _from_monthly_index}),
+    "assign2trj": Case(
+        {
+            f"{reader}{suffix}": _assign2trj(suffix, reader)
+            for suffix, reader in [
+                (".csv", "pandas"),
+                (".csv.gz", "pandas"),
+                (".csv", "table"),
+                (".csv.gz", "table"),
+                (".hdf5", "table"),
+                (".hdf5", "vaex"),
+            ]
+        },
+    ),
+    "assign2trj_indexed": Case(
+        {
+            f"{reader}{suffix}": _assign2trj(suffix, reader, indexed=True)
+            for suffix, reader in [
+                (".csv", "pandas"),
+                (".csv", "table"),
+                (".csv.gz", "table"),
+            ]
+        },
+    ),
+    "seed_patch": Case({"seed_patch": _seed_patch}),
+    "seed_horizontal_diagonal": Case(
+        {
+            "loop": _loop_diagonal,
+            "cached_grid": lambda data: _seed_diagonal(data, grid=False),
+            "grid": lambda data: _seed_diagonal(data, grid=True),
+        },
+    ),
+    "seed_lookup": Case(
+        {
+            "loop": lambda data: _seed_lookup(data, grid=False),
+            "grid": lambda data: _seed_lookup(data, grid=True),
+        },
+    ),
+}
+
+
+def flatten(obj: Any, prefix: str = "") -> Dict[str, np.ndarray]:
+    """Arrays of an output, with dimensions and columns in a canonical order."""
+    if isinstance(obj, (tuple, list)) and not all(np.isscalar(x) for x in obj):
+        return _merged(
+            flatten(item, f"{prefix}{number}/") for number, item in enumerate(obj)
+        )
+    if isinstance(obj, xr.Dataset):
+        return _merged(
+            flatten(obj[name], f"{prefix}{name}/") for name in sorted(obj.data_vars)
+        )
+    if isinstance(obj, xr.DataArray):
+        obj = obj.transpose(*sorted(obj.dims))
+        return {
+            f"{prefix}values": _plain(obj.values),
+            **{
+                f"{prefix}coords/{name}": _plain(obj[name].values)
+                for name in sorted(obj.coords)
+            },
+        }
+    if isinstance(obj, pd.DataFrame):
+        named = any(name is not None for name in obj.index.names)
+        obj = obj.reset_index() if named else obj
+        return {f"{prefix}{column}": _plain(obj[column].values) for column in obj}
+    return {f"{prefix}value": _plain(np.asarray(obj))}
+
+
+def _merged(parts: Iterable[Dict[str, np.ndarray]]) -> Dict[str, np.ndarray]:
+    return {key: value for arrays in parts for key, value in arrays.items()}
+
+
+def _plain(values: np.ndarray) -> np.ndarray:
+    """Values storable without pickling, e.g. cftime dates as strings."""
+    if values.dtype == object:
+        return np.asarray([str(value) for value in values.ravel()]).reshape(
+            values.shape
+        )
+    return values
+
+
+def run(case: Case, name: str, data: Data) -> Tuple[Dict[str, np.ndarray], float]:
+    """Flat output of an implementation and its run time in seconds."""
+    start = time.perf_counter()
+    arrays = flatten(case.implementations[name](data))
+    return arrays, time.perf_counter() - start
+
+
+_recorded: Set[str] = set()
+
+
+def golden(case_name: str, data: Data) -> Dict[str, np.ndarray]:
+    """Golden output of a case, recorded first with `RECORD`."""
+    path = GOLDEN.joinpath(f"{case_name}.npz")
+    if RECORD and case_name not in _recorded:
+        case = CASES[case_name]
+        arrays, seconds = run(case, case.reference, data)
+        GOLDEN.mkdir(exist_ok=True)
+        np.savez_compressed(path, **arrays, **{SECONDS: np.asarray(seconds)})
+        _recorded.add(case_name)
+    if not path.exists():
+        pytest.fail(f"No golden output {path.name}, record it with RECORD.")
+    with np.load(path) as stored:
+        return dict(stored)
+
+
+def deviation(
+    actual: Dict[str, np.ndarray], expected: Dict[str, np.ndarray], case: Case
+) -> float:
+    """Largest absolute deviation, fails if outside the tolerances of `case`."""
+    actual, expected = [
+        {key: value for key, value in arrays.items() if key not in case.ignore}
+        for arrays in (actual, expected)
+    ]
+    assert sorted(actual) == sorted(expected)
+    largest = 0.0
+    for key, value in actual.items():
+        reference = expected[key]
+        assert value.shape == reference.shape, key
+        if value.dtype.kind in "biuf" and reference.dtype.kind in "biuf":
+            np.testing.assert_allclose(
+                value,
+                reference,
+                rtol=case.rtol,
+                atol=case.atol,
+                equal_nan=True,
+                err_msg=key,
+            )
+            difference = np.abs(value.astype(float) - reference.astype(float))
+            if np.any(~np.isnan(difference)):
+                largest = max(largest, float(np.nanmax(difference)))
+        else:
+            np.testing.assert_array_equal(value, reference, err_msg=key)
+    return largest
+
+
+@pytest.fixture(scope="module")
+def data(tmp_path_factory) -> Data:
+    return Data(tmp_path_factory.mktemp("parity"))
+
+
+@pytest.mark.parametrize(
+    ("case_name", "name"),
+    [
+        (case_name, name)
+        for case_name, case in CASES.items()
+        for name in case.implementations
+    ],
+)
+def test_parity(data, record_property, case_name, name):
+    """Implementations reproduce the golden output within the tolerances."""
+    case = CASES[case_name]
+    expected = golden(case_name, data)
+    actual, seconds = run(case, name, data)
+    record_property("seconds", seconds)
+    record_property("speedup", float(expected[SECONDS]) / seconds)
+    deviation(actual, expected, case)
+
+
+def report() -> None:
+    """Print parity, timings and speedups of all implementations."""
+    header = f"{'case':32} {'implementation':20} {'seconds':>9} {'speedup':>8}  parity"
+    print(header)
+    print("-" * len(header))
+    with tempfile.TemporaryDirectory() as directory:
+        data = Data(Path(directory))
+        for case_name, case in CASES.items():
+            expected = golden(case_name, data)
+            for name in case.implementations:
+                print(_report_line(case_name, name, data, expected))
+
+
+def _report_line(
+    case_name: str, name: str, data: Data, expected: Dict[str, np.ndarray]
+) -> str:
+    """Timing, speedup and parity of an implementation."""
+    case = CASES[case_name]
+    try:
+        actual, seconds = run(case, name, data)
+    except pytest.skip.Exception as skipped:
+        return f"{case_name:32} {name:20} skipped: {skipped}"
+    try:
+        status = f"max deviation {deviation(actual, expected, case):.1e}"
+    except AssertionError as error:
+        status = "FAILED " + str(error).strip().splitlines()[0]
+    speedup = float(expected[SECONDS]) / seconds
+    return f"{case_name:32} {name:20} {seconds:9.4f} {speedup:7.1f}x  {status}"
+
+
+if __name__ == "__main__":
+    report()
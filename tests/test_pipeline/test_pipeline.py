@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -*-
+
+import json
+import threading
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+
+from water_masses import grouped, pipeline, precision, time_series
+
+CALLS: Counter = Counter()
+
+
+def _field() -> xr.DataArray:
+    rng = np.random.default_rng(0)
+    time = pd.date_range("2001-01-01", "2004-12-31", freq="D")
+    doy = time.dayofyear.values[:, np.newaxis, np.newaxis]
+    return xr.DataArray(
+        35
+        + 0.5 * np.sin(2 * np.pi * doy / 365.25)
+        + rng.normal(scale=0.1, size=(len(time), 3, 4)),
+        dims=("time", "latitude", "longitude"),
+        coords={
+            "time": time,
+            "latitude": ("latitude", [50.0, 51.0, 52.0], {"units": "degrees_north"}),
+            "longitude": ("longitude", np.arange(4.0), {"units": "degrees_east"}),
+        },
+        name="salinity",
+    ).chunk({"latitude": 1})
+
+
+@pipeline.register("synthetic", checkpoint=False)
+def _synthetic() -> xr.DataArray:
+    CALLS["synthetic"] += 1
+    return _field()
+
+
+@pipeline.register("counted")
+def _counted(da, fail=False):
+    CALLS["counted"] += 1
+    if fail:
+        raise RuntimeError("interrupted")
+    return da * 2
+
+
+@pipeline.register("policy")
+def _policy(da):
+    """Count the precision policy seen by the task."""
+    CALLS[precision.get_policy()] += 1
+    return da
+
+
+BARRIER = threading.Barrier(2, timeout=10)
+
+
+@pipeline.register("meet")
+def _meet(da):
+    """Only passes if another task runs at the same time."""
+    BARRIER.wait()
+    return da
+
+
+def _config(tmp_path, **params):
+    return {
+        "directory": str(tmp_path.joinpath("run")),
+        "workers": 2,
+        "tasks": {
+            "sss": {"op": "synthetic"},
+            "detrended": {"op": "detrend", "inputs": ["sss"]},
+            "climatology": {
+                "op": "climatology",
+                "inputs": ["detrended"],
+                "params": {"by": "dayofyear"},
+            },
+            "anomalies": {"op": "anomalies", "inputs": ["detrended", "climatology"]},
+            "monthly": {"op": "resample_monthly", "inputs": ["anomalies"]},
+            "filtered": {
+                "op": "lowpass",
+                "inputs": ["monthly"],
+                "params": {"cutlen": 6, "fs": 1},
+            },
+            "doubled": {"op": "counted", "inputs": ["monthly"], "params": params},
+            "eof": {"op": "eof", "inputs": ["filtered"], "params": {"nmodes": 2}},
+            "pc1": {
+                "op": "select",
+                "inputs": ["eof"],
+                "params": {"variable": "pcs", "isel": {"mode": 0}},
+            },
+            "composite": {"op": "composite", "inputs": ["monthly", "pc1"]},
+        },
+    }
+
+
+@pytest.fixture(autouse=True)
+def _reset_calls():
+    CALLS.clear()
+
+
+def test_run_checkpoints_and_resumes(tmp_path):
+    with pytest.raises(RuntimeError, match="interrupted"):
+        pipeline.Pipeline.from_config(_config(tmp_path, fail=True)).run()
+    assert not tmp_path.joinpath("run", "doubled.nc").exists()
+    assert tmp_path.joinpath("run", "anomalies.nc").exists()
+
+    CALLS.clear()
+    resumed = pipeline.Pipeline.from_config(_config(tmp_path))
+    plan = resumed.plan()
+    assert plan["doubled"] == "run"
+    assert plan["monthly"] == "load"
+    assert "sss" not in plan
+    outputs = resumed.run()
+
+    assert CALLS == {"counted": 1}
+    detrended = time_series.detrend(_field(), "time", method="fused")
+    expected = grouped.anomalies(detrended, "dayofyear").compute()
+    xr.testing.assert_allclose(outputs["anomalies"].compute(), expected)
+    assert outputs["composite"]["count"].sum() > 0
+    assert set(outputs["eof"]) == {"eofs", "pcs", "variance_fraction"}
+    state = json.loads(tmp_path.joinpath("run", "eof.json").read_text())
+    assert state["kind"] == "Dataset"
+
+    CALLS.clear()
+    resumed.run()
+    assert not CALLS
+    assert resumed.plan(rerun=["monthly"])["anomalies"] == "load"
+    resumed.run(rerun=["monthly"])
+    assert CALLS == {"counted": 1}
+
+
+def test_changed_params_invalidate_descendants(tmp_path):
+    config = _config(tmp_path)
+    pipeline.Pipeline.from_config(config).run(targets=["monthly"])
+
+    config["tasks"]["climatology"]["params"] = {"by": "month"}
+    plan = pipeline.Pipeline.from_config(config).plan(targets=["monthly"])
+
+    assert plan == {
+        "detrended": "load",
+        "climatology": "run",
+        "anomalies": "run",
+        "monthly": "run",
+    }
+
+
+def test_new_version_invalidates_checkpoints(tmp_path, monkeypatch):
+    """Checkpoints of another package version are recomputed."""
+    config = _config(tmp_path)
+    pipeline.Pipeline.from_config(config).run(targets=["detrended"])
+    assert not list(tmp_path.joinpath("run").glob("*.partial"))
+    assert pipeline.Pipeline.from_config(config).plan(targets=["detrended"]) == {
+        "detrended": "load"
+    }
+
+    monkeypatch.setattr(pipeline, "pkg_version", "0.0.0-other")
+    plan = pipeline.Pipeline.from_config(config).plan(targets=["detrended"])
+    assert plan == {"sss": "run", "detrended": "run"}
+
+
+def test_independent_tasks_run_in_parallel(tmp_path):
+    config = {
+        "directory": str(tmp_path),
+        "workers": 2,
+        "tasks": {
+            "sss": {"op": "synthetic"},
+            "left": {"op": "meet", "inputs": ["sss"]},
+            "right": {"op": "meet", "inputs": ["sss"]},
+        },
+    }
+    outputs = pipeline.Pipeline.from_config(config).run()
+    assert set(outputs) == {"sss", "left", "right"}
+
+
+def test_run_restores_policy(tmp_path):
+    """The precision of a run applies to its tasks only."""
+    config = {
+        "directory": str(tmp_path),
+        "precision": "float32",
+        "tasks": {
+            "sss": {"op": "synthetic"},
+            "checked": {"op": "policy", "inputs": ["sss"]},
+        },
+    }
+    with precision.policy("float64"):
+        pipeline.Pipeline.from_config(config).run()
+        assert precision.get_policy() == "float64"
+    assert CALLS["float32"] == 1
+
+
+def test_invalid_dags(tmp_path):
+    with pytest.raises(ValueError, match="cycle"):
+        pipeline.Pipeline.from_config(
+            {
+                "directory": str(tmp_path),
+                "tasks": {
+                    "a": {"op": "counted", "inputs": ["b"]},
+                    "b": {"op": "counted", "inputs": ["a"]},
+                },
+            }
+        )
+    with pytest.raises(KeyError, match="Unknown input"):
+        pipeline.Pipeline.from_config(
+            {
+                "directory": str(tmp_path),
+                "tasks": {"a": {"op": "counted", "inputs": ["b"]}},
+            }
+        )
+    with pytest.raises(KeyError, match="Unknown operation"):
+        pipeline.Task("a", "unknown")
+
+
+def test_cli_dry_run(tmp_path, capsys):
+    path = tmp_path.joinpath("pipeline.json")
+    config = _config(tmp_path)
+    config["directory"] = "run"
+    path.write_text(json.dumps(config))
+
+    assert pipeline.cli([str(path), "--dry-run", "--target", "climatology"]) == 0
+    assert capsys.readouterr().out.split() == [
+        "run",
+        "sss",
+        "run",
+        "detrended",
+        "run",
+        "climatology",
+    ]
+    assert pipeline.cli([str(path), "--target", "climatology"]) == 0
+    assert tmp_path.joinpath("run", "climatology.nc").exists()
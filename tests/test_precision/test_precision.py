@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+
+from water_masses import filtering, grouped, precision, time_series
+from water_masses.processing import Climatology, MetaData
+
+#: Largest absolute difference of float32 and float64 results (salinity ~35).
+TOLERANCE = 1e-4
+
+
+@pytest.fixture()
+def field():
+    """Three years of daily salinity with a trend, a seasonal cycle and gaps."""
+    rng = np.random.default_rng(0)
+    time = pd.date_range("2001-01-01", "2003-12-31", freq="D")
+    doy = time.dayofyear.values[:, np.newaxis, np.newaxis]
+    data = (
+        35
+        + 0.5 * np.sin(2 * np.pi * doy / 365.25)
+        + np.linspace(0, 0.3, len(time))[:, np.newaxis, np.newaxis]
+        + rng.normal(scale=0.1, size=(len(time), 3, 4))
+    )
+    data[rng.random(data.shape) < 0.01] = np.nan
+    return xr.DataArray(
+        data,
+        dims=("time", "latitude", "longitude"),
+        coords={"time": time, "latitude": [50.0, 51.0, 52.0], "longitude": range(4)},
+    ).chunk({"latitude": 2})
+
+
+def _pipeline(da, averaging_method):
+    meta_data = MetaData("test", averaging_method=averaging_method, quantile=0.9)
+    da = precision.as_field(da)
+    detrended = time_series.detrend(da, "time", method="fused")
+    anomalies = grouped.anomalies(
+        detrended,
+        "dayofyear",
+        reduced=Climatology.point_wise(detrended, meta_data),
+    )
+    filtered = filtering.apply_filter(
+        filtering.butter_lowpass_filter,
+        anomalies.fillna(0).compute(),
+        [],
+        {"cutlen": 30, "fs": 1},
+    )
+    return {"detrended": detrended, "anomalies": anomalies, "filtered": filtered}
+
+
+def test_policy():
+    assert precision.get_policy() == "float64"
+    with precision.policy("float32"):
+        assert precision.field_dtype() == np.float32
+        assert precision.as_field(np.ones(2)).dtype == np.float32
+    assert precision.field_dtype() == np.float64
+    with pytest.raises(ValueError, match="policy"):
+        precision.set_policy("float16")
+
+
+def test_as_field_keeps_coordinates_and_integers():
+    ds = xr.Dataset(
+        {"so": ("x", np.ones(3)), "flag": ("x", np.arange(3))},
+        coords={"x": np.arange(3.0)},
+    )
+    with precision.policy("float32"):
+        result = precision.as_field(ds)
+    assert result.so.dtype == np.float32
+    assert result.flag.dtype == ds.flag.dtype
+    assert result.x.dtype == np.float64
+
+
+@pytest.mark.parametrize("averaging_method", ["mean", "quantile"])
+def test_float32_pipeline_matches_float64(field, averaging_method):
+    expected = _pipeline(field, averaging_method)
+    with precision.policy("float32"):
+        result = _pipeline(field, averaging_method)
+
+    for stage, da in result.items():
+        assert da.dtype == np.float32, stage
+        np.testing.assert_allclose(
+            da.values, expected[stage].values, rtol=0, atol=TOLERANCE, err_msg=stage
+        )
+
+
+def test_reductions_accumulate_in_float64():
+    """A float32 sum of a million values misses the float32 mean."""
+    da = xr.DataArray(
+        np.full((1, 1_000_000), 0.1, dtype=np.float32),
+        dims=("x", "time"),
+        coords={"time": pd.date_range("2000-01-01", periods=1_000_000, freq="s")},
+    )
+    mean = grouped.reduce(da, "year")
+
+    assert mean.dtype == np.float32
+    assert mean.item() == np.float32(0.1)
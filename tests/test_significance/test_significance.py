@@ -0,0 +1,104 @@
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+
+from water_masses import significance, time_series
+from water_masses.origin import pca
+
+
+@pytest.fixture
+def series() -> pd.DataFrame:
+    rng = np.random.default_rng(1)
+    x = np.cumsum(rng.normal(size=120)) * 0.1 + rng.normal(size=120)
+    return pd.DataFrame(
+        {"x": x, "y": np.roll(x, 2) + 0.5 * rng.normal(size=120)},
+        index=pd.date_range("2000-01-01", periods=120, freq="MS"),
+    )
+
+
+@pytest.fixture
+def field() -> xr.DataArray:
+    rng = np.random.default_rng(2)
+    pattern = rng.normal(size=(6, 8))
+    values = rng.normal(size=(40, 1, 1)) * 3 * pattern + rng.normal(size=(40, 6, 8))
+    values[:, 0, 0] = np.nan
+    return xr.DataArray(
+        values,
+        coords={
+            "time": pd.date_range("2000-01-01", periods=40, freq="MS"),
+            "latitude": (
+                "latitude",
+                np.linspace(50, 60, 6),
+                {"standard_name": "latitude"},
+            ),
+            "longitude": (
+                "longitude",
+                np.linspace(-10, 0, 8),
+                {"standard_name": "longitude"},
+            ),
+        },
+        dims=("time", "latitude", "longitude"),
+    )
+
+
+@pytest.mark.parametrize("method", ["ar1", "phase"])
+def test_surrogates(series, method):
+    x = series[["x", "y"]].values
+    result = significance.surrogates(x, 50, method=method, seed=3)
+
+    assert result.shape == (50, *x.shape)
+    np.testing.assert_array_equal(
+        result, significance.surrogates(x, 50, method=method, seed=3)
+    )
+    if method == "phase":
+        np.testing.assert_allclose(
+            np.abs(np.fft.rfft(result, axis=1)),
+            np.broadcast_to(np.abs(np.fft.rfft(x, axis=0)), (50, 61, 2)),
+            rtol=1e-8,
+            atol=1e-8,
+        )
+    else:
+        np.testing.assert_allclose(
+            significance.ar1_coefficient(result.transpose(1, 0, 2)).mean(axis=0),
+            significance.ar1_coefficient(x),
+            atol=0.1,
+        )
+
+
+def test_surrogates_unknown_method(series):
+    with pytest.raises(ValueError):
+        significance.surrogates(series.x.values, 2, method="white")
+
+
+def test_crosscorr_test(series):
+    lags = [-2, 0, 2]
+    correlation, null, p_value = significance.crosscorr_test(
+        series.x, series.y, lags=lags, n_surrogates=99, seed=0, max_workers=1
+    )
+
+    np.testing.assert_allclose(
+        correlation, [time_series.crosscorr(series.x, series.y, lag) for lag in lags]
+    )
+    assert null.dims == ("surrogate", "lag")
+    assert null.shape == (99, 3)
+    assert p_value.sel(lag=-2) == pytest.approx(0.01)
+    assert p_value.sel(lag=2) > 0.05
+
+
+def test_null_distribution_independent_of_workers(series):
+    kws = dict(lags=1, n_surrogates=30, seed=4, batch_size=7)
+    _, serial, _ = significance.crosscorr_test(series.x, series.y, max_workers=1, **kws)
+    _, pooled, _ = significance.crosscorr_test(series.x, series.y, max_workers=2, **kws)
+    xr.testing.assert_identical(serial, pooled)
+
+
+def test_eof_test(field):
+    variance_fraction, null, p_value = significance.eof_test(
+        field, nmodes=3, n_surrogates=40, seed=0, max_workers=1
+    )
+
+    solver = pca.GramEof(field, weights=pca._coslat_weights(field))
+    np.testing.assert_allclose(variance_fraction, solver.varianceFraction(neigs=3))
+    assert null.dims == ("surrogate", "mode")
+    assert p_value.sel(mode=0) == pytest.approx(1 / 41)
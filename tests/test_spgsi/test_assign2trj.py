@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+
+from datetime import date
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from water_masses import spgsi
+from water_masses.constants import Timespan
+from water_masses.tracmass.table import TrajectoryTable
+
+
+@pytest.fixture()
+def spgs_idx(tmp_path):
+    """Monthly SPG strength index over the default timespan."""
+    months = len(pd.date_range(Timespan().start, Timespan().end, freq="MS"))
+    path = tmp_path.joinpath("spgsi.csv")
+    pd.DataFrame({"PC1": np.zeros(months), "PC2": np.arange(months) / 10}).to_csv(
+        path, header=False, index=False
+    )
+    return spgsi.open_index(path)
+
+
+@pytest.fixture()
+def trajectories():
+    """Two trajectories, the second one partly before the timespan."""
+    day = 86400
+    end = Timespan().end
+    first = int((pd.Timestamp("1993-01-01") - pd.Timestamp(end)).total_seconds())
+    return pd.DataFrame(
+        {
+            "id": [1, 1, 1, 2, 2],
+            "lon": [1.0, 2.0, 3.0, 4.0, 5.0],
+            "time": [-40 * day, -10 * day + 3600, -70 * day, first, first - day],
+        },
+    )
+
+
+def test_assign2trj_indexed(trajectories, spgs_idx):
+    """Rows outside the timespan are dropped, PC2 of the init month assigned."""
+    df = TrajectoryTable.from_pandas(trajectories).to_frame()
+    result = spgsi.assign2trj(df, spgs_idx)
+    assert result.index.equals(df.index[:4])
+    assert list(result.init) == [date(2019, 12, 21)] * 3 + [date(1993, 1, 1)]
+    np.testing.assert_array_equal(
+        result.PC2.values, np.round(spgs_idx.PC2.values[[-1, -1, -1, 0]])
+    )
+
+
+def test_assign2trj_flat(trajectories, spgs_idx):
+    """Tables and flat frames give flat columns."""
+    expected = spgsi.assign2trj(
+        TrajectoryTable.from_pandas(trajectories).to_frame(), spgs_idx
+    )
+    for df in [trajectories, TrajectoryTable.from_pandas(trajectories)]:
+        result = spgsi.assign2trj(df, spgs_idx)
+        assert list(result.index) == [0, 1, 2, 3]
+        assert list(result.year) == [2019, 2019, 2019, 1993]
+        assert list(result.month) == [12, 12, 12, 1]
+        np.testing.assert_array_equal(result.PC2.values, expected.PC2.values)
+
+
+def test_assign2trj_missing_month(trajectories, spgs_idx):
+    """Months without index raise a KeyError."""
+    with pytest.raises(KeyError, match="2019-12"):
+        spgsi.assign2trj(trajectories, spgs_idx.iloc[:-1])
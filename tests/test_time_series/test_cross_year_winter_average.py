@@ -0,0 +1,30 @@
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from water_masses import time_series
+
+
+def test_cross_year_winter_average():
+    time = pd.date_range("1993-01-01", "1996-12-31", freq="D")
+    values = np.broadcast_to(
+        np.arange(len(time), dtype=float), (2, 3, len(time))
+    ).copy()
+    values[0, 0, 400] = np.nan
+    da = xr.DataArray(
+        values,
+        coords={"lat": [50.0, 51.0], "lon": [0.0, 1.0, 2.0], "time": time},
+        dims=("lat", "lon", "time"),
+    )
+
+    result = time_series.cross_year_winter_average(da)
+
+    assert result.dims == ("time", "lat", "lon")
+    np.testing.assert_array_equal(
+        result.time, pd.to_datetime(["1994-01-15", "1995-01-15", "1996-01-15"])
+    )
+    winter = (time >= "1994-12-01") & (time < "1995-03-01")
+    assert result[1, 1, 1] == np.arange(len(time))[winter].mean()
+    # missing values propagate
+    assert np.isnan(result[0, 0, 0])
+    assert result[0, 0, 1] == result[0, 1, 1]
@@ -0,0 +1,70 @@
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+from cftime import DatetimeNoLeap
+
+from water_masses import time_series
+
+
+@pytest.fixture
+def data() -> xr.DataArray:
+    rng = np.random.default_rng(0)
+    values = rng.normal(size=(3, 4, 60)) + 0.05 * np.arange(60) ** 1.5
+    values[0, 0, 7] = np.nan
+    values[1, 1] = np.nan
+    values[2, 2, :-1] = np.nan
+    return xr.DataArray(
+        values,
+        coords={"time": pd.date_range("2000-01-01", periods=60, freq="MS")},
+        dims=("latitude", "longitude", "time"),
+    )
+
+
+@pytest.mark.parametrize("deg", [1, 2])
+def test_fused_matches_polyfit(data, deg):
+    expected = time_series.detrend(data, "time", deg=deg)
+    result = time_series.detrend(data, "time", deg=deg, method="fused")
+
+    assert result.dims == data.dims
+    enough = data.count("time") > deg
+    np.testing.assert_allclose(result.where(enough), expected.where(enough).values)
+    # polyfit returns the minimum norm fit of series with too few values
+    assert result[2, 2].isnull().all()
+
+
+def test_fused_dask_and_dtype(data):
+    data = data.astype(np.float32).transpose("time", ...)
+    result = time_series.detrend(data.chunk({"latitude": 1}), "time", method="fused")
+
+    assert result.chunks is not None
+    assert result.dtype == np.float32
+    xr.testing.assert_allclose(
+        result.compute(), time_series.detrend(data, "time", method="fused")
+    )
+
+
+def test_fused_cftime_axis(data):
+    noleap = data.assign_coords(
+        time=[DatetimeNoLeap(*date.timetuple()[:6]) for date in data.indexes["time"]]
+    )
+    expected = time_series.detrend(noleap, "time")
+    result = time_series.detrend(noleap, "time", method="fused")
+
+    # the calendars differ by the leap days, compare with polyfit on the same axis
+    enough = data.count("time") > 1
+    np.testing.assert_allclose(
+        result.where(enough), expected.where(enough).values, rtol=0, atol=1e-8
+    )
+
+
+def test_vandermonde_is_cached(data):
+    time_series._vandermonde.cache_clear()
+    time_series.detrend(data, "time", method="fused")
+    time_series.detrend(data + 1, "time", method="fused")
+    assert time_series._vandermonde.cache_info().hits == 1
+
+
+def test_unknown_method(data):
+    with pytest.raises(ValueError):
+        time_series.detrend(data, "time", method="lstsq")
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+
+from water_masses.tracmass.aggregate import to_grid
+
+DAY = 86400
+
+
+@pytest.fixture()
+def trajectories():
+    """Random trajectories on a 4 x 5 x 6 grid, ids 0 to 9."""
+    rng = np.random.default_rng(0)
+    rows = 1000
+    return pd.DataFrame(
+        {
+            "id": rng.integers(0, 10, rows),
+            "i": rng.uniform(0, 6, rows),
+            "j": rng.uniform(0, 5, rows),
+            "k": rng.uniform(0, 4, rows),
+            "subvol": rng.uniform(0, 10, rows),
+            "time": -rng.integers(0, 100, rows) * DAY,
+        },
+    )
+
+
+def test_counts_and_transport(trajectories, tmp_path):
+    """Binning agrees with a groupby over cells, also when streamed from file."""
+    expected = trajectories.assign(
+        i=np.floor(trajectories.i).astype(int) + 1,
+        j=np.floor(trajectories.j).astype(int) + 1,
+    ).groupby(["j", "i"])
+    path = tmp_path.joinpath("tests_run.csv")
+    trajectories.to_csv(path, header=False, index=False)
+    for source in [trajectories, path]:
+        ds = to_grid(source, (5, 6), chunk_size=64)
+        stacked = ds.stack(cell=("j", "i")).to_dataframe()
+        np.testing.assert_array_equal(stacked["count"], expected.size())
+        np.testing.assert_allclose(stacked.transport, expected.subvol.sum())
+        assert ds.i.values.tolist() == [1, 2, 3, 4, 5, 6]
+
+
+def test_time_windows_and_depth(trajectories):
+    """Time windows and the vertical add dimensions, rows outside are dropped."""
+    bins = pd.to_datetime(["2019-10-01", "2019-11-01", "2019-12-01"]).values
+    ds = to_grid(trajectories, (4, 5, 6), time_bins=bins)
+    assert ds["count"].dims == ("time", "k", "j", "i")
+    dates = pd.Timestamp("2019-12-31") + pd.to_timedelta(trajectories.time, "s")
+    assert ds["count"].sum() == ((dates >= bins[0]) & (dates < bins[-1])).sum()
+
+
+def test_age(trajectories):
+    """Age is the time since the initialization of the trajectory."""
+    init = pd.DataFrame({"id": np.arange(10), "time": np.zeros(10, dtype=int)})
+    ds = to_grid(trajectories, (5, 6), init=init.iloc[:5])
+    cell = trajectories[
+        (trajectories.i < 1) & (trajectories.j < 1) & (trajectories.id < 5)
+    ]
+    np.testing.assert_allclose(ds.age_mean.isel(i=0, j=0), (-cell.time / DAY).mean())
+    np.testing.assert_allclose(
+        ds.age_std.isel(i=0, j=0), (-cell.time / DAY).std(ddof=0)
+    )
+
+
+def test_grid_coordinates(trajectories):
+    """Cells get the coordinates of the model grid."""
+    grid = xr.DataArray(
+        np.zeros((5, 6)),
+        dims=("latitude", "longitude"),
+        coords={
+            "latitude": (
+                "latitude",
+                np.arange(5.0) + 50,
+                {"standard_name": "latitude"},
+            ),
+            "longitude": ("longitude", np.arange(6.0), {"standard_name": "longitude"}),
+        },
+    )
+    ds = to_grid(trajectories, (5, 6), grid=grid, offset=0)
+    np.testing.assert_array_equal(ds.longitude, np.arange(6.0))
+    np.testing.assert_array_equal(ds.latitude, np.arange(5.0) + 50)
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from water_masses.tracmass.io import open_tracmass_files
+
+
+@pytest.fixture()
+def experiments(tmp_path):
+    """Three experiment directories with output files of different lengths."""
+    paths = []
+    for number, suffix in enumerate([".csv", ".csv.gz", ".csv"]):
+        directory = tmp_path.joinpath(f"exp{number}")
+        directory.mkdir()
+        path = directory.joinpath(f"tests_run{suffix}")
+        rows = number + 2
+        pd.DataFrame(
+            {
+                "id": np.arange(rows),
+                "i": np.ones(rows),
+                "j": np.ones(rows),
+                "k": np.ones(rows),
+                "subvol": np.ones(rows),
+                "time": -np.arange(rows) * 86400.0,
+            },
+        ).to_csv(path, header=False, index=False)
+        paths.append(path)
+    return paths
+
+
+@pytest.mark.parametrize("engine", ["arrow", "pandas", "vaex"])
+def test_open_tracmass_files(experiments, tmp_path, engine):
+    """All files end up in one table, each row tagged with its experiment."""
+    if engine == "vaex":
+        pytest.importorskip("vaex")
+    df = open_tracmass_files(str(tmp_path.joinpath("exp*", "tests_run.csv*")), engine)
+    if engine == "arrow":
+        df = df.to_pandas()
+    elif engine == "vaex":
+        df = df.to_pandas_df()
+    assert len(df) == 2 + 3 + 4
+    assert (
+        list(df.experiment)
+        == ["exp0/tests_run"] * 2 + ["exp1/tests_run"] * 3 + ["exp2/tests_run"] * 4
+    )
+    assert df.time.min() == -3 * 86400
+
+
+def test_unique_file_names(experiments):
+    """Unique file names are used as experiment names, also on processes."""
+    renamed = [
+        path.rename(path.with_name(f"run{number}{''.join(path.suffixes)}"))
+        for number, path in enumerate(experiments)
+    ]
+    df = open_tracmass_files(renamed, "pandas", max_workers=2, processes=True)
+    assert list(df.experiment.cat.categories) == ["run0", "run1", "run2"]
+
+
+def test_no_files(tmp_path):
+    """An empty glob is an error."""
+    with pytest.raises(FileNotFoundError):
+        open_tracmass_files(str(tmp_path.joinpath("*.csv")))
@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+
+import gzip
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from water_masses.tracmass.query import (
+    Box,
+    Mask,
+    Predicate,
+    Query,
+    TimeWindow,
+    always,
+    ever,
+    never,
+)
+from water_masses.tracmass.table import TrajectoryTable
+
+DAY = 86400
+
+
+@pytest.fixture()
+def trajectories():
+    """Random walks of 20 trajectories over 100 days on a 10 x 12 grid."""
+    rng = np.random.default_rng(0)
+    ids = np.repeat(np.arange(20), 100)
+    steps = rng.normal(scale=0.3, size=(2, len(ids)))
+    return pd.DataFrame(
+        {
+            "id": ids,
+            "i": np.clip(6 + steps[0].reshape(20, 100).cumsum(axis=1).ravel(), 0, 11.9),
+            "j": np.clip(5 + steps[1].reshape(20, 100).cumsum(axis=1).ravel(), 0, 9.9),
+            "k": np.ones(len(ids)),
+            "subvol": np.ones(len(ids)),
+            "time": -np.tile(np.arange(100), 20) * DAY,
+        }
+    )
+
+
+def _dates(df):
+    return pd.Timestamp("2019-12-31") + pd.to_timedelta(df.time, "s")
+
+
+def _ids(df, mask):
+    return np.unique(df.id[mask])
+
+
+@pytest.mark.parametrize("chunk_size", [7, 1 << 22])
+def test_ever_box_in_time_window(trajectories, chunk_size):
+    box = Box(i=(8, 12), j=(1, 5))
+    window = TimeWindow(start="2019-10-01", end="2019-11-01")
+    query = Query(ever(box & window), chunk_size=chunk_size)
+
+    i = np.floor(trajectories.i) + 1
+    j = np.floor(trajectories.j) + 1
+    dates = _dates(trajectories)
+    inside = (i >= 8) & (j <= 5)
+    expected = _ids(
+        trajectories,
+        inside & (dates >= "2019-10-01") & (dates < "2019-11-01"),
+    )
+
+    np.testing.assert_array_equal(query.ids(trajectories), expected)
+    assert 0 < len(expected) < 20
+    pd.testing.assert_frame_equal(
+        query.rows(trajectories),
+        trajectories[trajectories.id.isin(expected)].reset_index(drop=True),
+    )
+
+
+def test_never_always_and_masks(trajectories, tmp_path):
+    shelf = np.zeros((10, 12), dtype=bool)
+    shelf[2:8, 3:9] = True
+    i = np.floor(trajectories.i).astype(int)
+    j = np.floor(trajectories.j).astype(int)
+    on_shelf = shelf[j, i]
+    left = _ids(trajectories, ~on_shelf)
+    stayed = np.setdiff1d(trajectories.id.unique(), left)
+    winter = _dates(trajectories).dt.month.isin([12, 1, 2])
+    left_in_winter = _ids(trajectories, ~on_shelf & winter)
+
+    path = tmp_path.joinpath("tests_run.csv")
+    trajectories.to_csv(path, header=False, index=False)
+    for source in [trajectories, path, TrajectoryTable.from_pandas(trajectories)]:
+        np.testing.assert_array_equal(
+            Query(always(Mask(shelf)), chunk_size=64).ids(source), stayed
+        )
+        np.testing.assert_array_equal(
+            Query(never(~Mask(shelf)), chunk_size=64).ids(source), stayed
+        )
+        np.testing.assert_array_equal(
+            Query(
+                ever(~Mask(shelf) & TimeWindow(months=(12, 1, 2))), chunk_size=64
+            ).ids(source),
+            left_in_winter,
+        )
+    assert len(stayed) and len(left_in_winter)
+
+
+def test_row_predicate_and_streaming(trajectories):
+    """Only the rows in the window of the selected trajectories, chunk by chunk."""
+    window = TimeWindow(start="2019-12-01")
+    query = Query(ever(Box(i=(1, 6))), rows=window, chunk_size=150)
+
+    chunks = list(query.iter_rows(lambda: iter(np.array_split(trajectories, 10))))
+
+    assert max(len(chunk) for chunk in chunks) <= 200
+    result = pd.concat(chunks)
+    expected_ids = _ids(trajectories, np.floor(trajectories.i) + 1 <= 6)
+    np.testing.assert_array_equal(np.unique(result.id), expected_ids)
+    assert (_dates(result) >= "2019-12-01").all()
+    assert len(result) == len(expected_ids) * 31
+
+
+def test_vaex_source(trajectories):
+    vaex = pytest.importorskip("vaex")
+    query = Query(ever(Box(j=(1, 3))), chunk_size=100)
+    np.testing.assert_array_equal(
+        query.ids(vaex.from_pandas(trajectories)), query.ids(trajectories)
+    )
+
+
+def test_empty_selection(trajectories):
+    result = Query(ever(Box(i=(100, 101)))).rows(trajectories)
+    assert result.empty
+    assert list(result.columns) == list(trajectories.columns)
+
+
+def _no_chunks():
+    return iter([])
+
+
+@pytest.mark.parametrize("suffix", [".csv", ".csv.gz", None])
+def test_empty_source(tmp_path, suffix):
+    """Sources without rows give an empty frame with the TRACMASS columns."""
+    if suffix is None:
+        source = _no_chunks
+    else:
+        source = tmp_path.joinpath(f"empty{suffix}")
+        source.write_bytes(gzip.compress(b"") if suffix == ".csv.gz" else b"")
+    query = Query(ever(Box(i=(1, 6))))
+
+    assert len(query.ids(source)) == 0
+    result = query.rows(source)
+    assert result.empty
+    assert list(result.columns) == ["id", "i", "j", "k", "subvol", "time"]
+
+
+def test_predicate_is_abstract():
+    with pytest.raises(TypeError):
+        Predicate()
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+
+import io
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from water_masses import filter_month
+from water_masses.tracmass.io import open_trajectory_table
+from water_masses.tracmass.table import TrajectoryTable
+
+ROWS = """\
+   1,  10.5,  20.5,  1.5,  100.0,  -86400.0,  7
+   1,  11.5,  21.5,  1.5,  100.0,  -172800.0,  7
+   2,  12.5,  22.5,  2.5,  200.0,  -2678400.0,  7
+"""
+
+
+@pytest.fixture(params=["tests_ini.csv", "tests_ini.csv.gz"])
+def csv_path(request, tmp_path):
+    """Headerless TRACMASS CSV file, plain or gzipped."""
+    path = tmp_path.joinpath(request.param)
+    pd.read_csv(io.StringIO(ROWS), header=None).to_csv(path, header=False, index=False)
+    return path
+
+
+def test_open_trajectory_table(csv_path):
+    """Time is stored as int64 seconds relative to the end of the timespan."""
+    table = open_trajectory_table(csv_path)
+    assert len(table) == 3
+    assert table.column_names == ["id", "i", "j", "k", "subvol", "time"]
+    assert table.to_numpy("time").dtype == np.int64
+    np.testing.assert_array_equal(
+        table.dates(),
+        np.array(["2019-12-30", "2019-12-29", "2019-11-30"], dtype="datetime64[s]"),
+    )
+
+
+def test_zero_copy(csv_path):
+    """Numeric columns are shared between Arrow, NumPy and pandas."""
+    table = open_trajectory_table(csv_path)
+    subvol = table.to_numpy("subvol")
+    assert np.shares_memory(subvol, table.to_numpy("subvol"))
+    assert np.shares_memory(subvol, table.to_pandas()["subvol"].values)
+    assert not subvol.flags.writeable
+
+
+def test_copy_of_chunked_columns(csv_path):
+    """Columns of several chunks are copied into one array."""
+    table = open_trajectory_table(csv_path)
+    both = TrajectoryTable.concat([table, table])
+    subvol = both.to_numpy("subvol")
+    assert subvol.flags.writeable
+    np.testing.assert_array_equal(subvol, np.tile(table.to_numpy("subvol"), 2))
+
+
+def test_vaex_roundtrip(csv_path):
+    """Tables convert to and from vaex."""
+    pytest.importorskip("vaex")
+    table = open_trajectory_table(csv_path)
+    roundtrip = TrajectoryTable.from_vaex(table.to_vaex())
+    assert roundtrip.table.equals(table.table)
+
+
+def test_filter_month_open_dataset(csv_path):
+    """The (id, date) frame matches the previous pandas implementation."""
+    meta_data = filter_month.MetaData(
+        data_path=str(csv_path).replace("ini", "{0}"),
+        timespan=filter_month.Timespan(end="2019-12-31T00:00:00"),
+    )
+    expected = pd.read_csv(csv_path, **meta_data.import_kwargs).set_index("id")
+    expected = expected.assign(
+        date=pd.Timestamp(datetime(2019, 12, 31))
+        + pd.to_timedelta(expected.time.values, "s"),
+    ).set_index("date", append=True)
+
+    df = filter_month.open_dataset("ini", meta_data)
+    pd.testing.assert_frame_equal(df, expected, check_dtype=False)
+    pd.testing.assert_frame_equal(
+        TrajectoryTable.from_pandas(df).to_frame(), df, check_like=True
+    )
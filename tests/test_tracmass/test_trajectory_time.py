@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from water_masses.tracmass import trajectory_time
+
+EPOCH = datetime(2019, 12, 31)
+
+
+@pytest.mark.parametrize("ufunc", [np.maximum, np.minimum, np.add])
+def test_reduce_by_id(ufunc):
+    """Sorted-segment reduction agrees with a pandas groupby."""
+    rng = np.random.default_rng(0)
+    ids = rng.integers(0, 50, 1000)
+    values = rng.integers(-(10 ** 9), 0, 1000)
+    name = {np.maximum: "max", np.minimum: "min", np.add: "sum"}[ufunc]
+    expected = pd.Series(values).groupby(ids).transform(name).values
+    np.testing.assert_array_equal(
+        trajectory_time.reduce_by_id(ids, values, ufunc), expected
+    )
+    np.testing.assert_array_equal(
+        trajectory_time.reduce_by_id(np.sort(ids), values, ufunc),
+        pd.Series(values).groupby(np.sort(ids)).transform(name).values,
+    )
+
+
+def test_calendar_keys():
+    """Year, month and day are derived without Python date objects."""
+    dates = pd.to_datetime(["1993-01-01 12:00", "2000-02-29 23:59:59", "2019-12-31"])
+    time = trajectory_time.from_datetime64(dates.values, EPOCH)
+    year, month = trajectory_time.year_month(time, EPOCH)
+    np.testing.assert_array_equal(year, dates.year)
+    np.testing.assert_array_equal(month, dates.month)
+    np.testing.assert_array_equal(
+        trajectory_time.to_datetime64(trajectory_time.floor_day(time, EPOCH), EPOCH),
+        dates.normalize().values.astype("datetime64[s]"),
+    )
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+
+import dask.array as dsa
+import numpy as np
+import pytest
+import xarray as xr
+
+from water_masses.transform import roll
+
+
+def _dataset(longitude: np.ndarray) -> xr.Dataset:
+    data = dsa.from_array(
+        np.arange(3 * len(longitude), dtype=float).reshape(3, -1), chunks=(1, -1)
+    )
+    return xr.Dataset(
+        {"sss": (("time", "longitude"), data)},
+        coords={"longitude": longitude},
+    )
+
+
+def test_roll_no_boundary_duplicate():
+    """Longitude 180 (and 0/360) must not end up twice in the rolled data."""
+    ds = roll(_dataset(np.arange(0, 361, 10.0)))
+    lon = ds.longitude.values
+    assert len(np.unique(lon)) == len(lon) == 36
+    assert lon[0] == -180
+    assert lon[-1] == 170
+    assert np.all(np.diff(lon) > 0)
+
+
+def test_roll_values_follow_coordinates():
+    """Each value stays with its longitude and the result stays lazy."""
+    original = _dataset(np.arange(0, 360, 30.0))
+    ds = roll(original)
+    assert ds.sss.chunks[0] == (1, 1, 1)
+    for lon in ds.longitude.values:
+        np.testing.assert_array_equal(
+            ds.sss.sel(longitude=lon).values,
+            original.sss.sel(longitude=lon % 360).values,
+        )
+
+
+@pytest.mark.parametrize("lon_min", [-180, 0, -30])
+def test_roll_any_convention(lon_min):
+    """Wrapping is idempotent and ends up in [lon_min, lon_min + 360)."""
+    ds = roll(roll(_dataset(np.arange(-180, 180, 15.0))), lon_min=lon_min)
+    lon = ds.longitude.values
+    assert lon.min() >= lon_min
+    assert lon.max() < lon_min + 360
+    assert np.all(np.diff(lon) > 0)
+
+
+def test_roll_keeps_longitudes_in_range():
+    """Longitudes already in range are not changed, not even by rounding."""
+    longitude = np.linspace(-19.888889, 12.999999, 297)
+    ds = roll(_dataset(longitude))
+    np.testing.assert_array_equal(ds.longitude.values, longitude)
+    ds = roll(_dataset(longitude + 180), lon_min=0)
+    np.testing.assert_array_equal(ds.longitude.values, longitude + 180)
+
+
+def test_roll_keeps_longitude_chunks():
+    """The longitude chunks of dask backed data keep their sizes."""
+    longitude = np.arange(0, 360, 10.0)
+    data = dsa.from_array(np.zeros((3, len(longitude))), chunks=(1, 6))
+    ds = xr.Dataset(
+        {"sss": (("time", "longitude"), data)}, coords={"longitude": longitude}
+    )
+    assert roll(ds).sss.chunks[1] == (6,) * 6